@@ -0,0 +1,296 @@
+"""
+Admission control for public file downloads, shared by all gunicorn workers.
+
+Every MP3 transfer holds a sync worker until the last byte is sent, so a
+single client scripting bulk downloads could take all of them and leave
+the homepage waiting. Requests for files now pass two checks first:
+
+- a per-client budget: each client IP and lane ('downloads',
+  'thumbnails') has a token bucket (token_buckets.py, in limits.db). An
+  empty bucket answers 429 at once, with Retry-After set to when the next
+  request would be allowed. A Range request resuming a transfer past its
+  first byte is free if its If-Range ETag is the one the client was sent
+  in full within CONTINUATION_SECONDS (remember_transfer()); any other
+  one costs CONTINUATION_COST of a request, so a client that only asks
+  for ranges is still limited
+- lanes with a batch (thumbnails, about 50 per page view) count requests
+  in the worker first and take them from the shared bucket batch tokens
+  at a time, so most of their requests do no write on limits.db. A
+  worker whose batch was refused rejects the client itself until the
+  bucket has refilled
+- a global cap on large transfers (MP3s, ZIP exports): a transfer holds one
+  of max_transfers slots from admission until its body has been sent. When
+  all are taken a request may wait up to queue_seconds in one of
+  queue_size waiting places; with none free, or when the wait runs out, it
+  gets 503 and Retry-After
+
+Slots and waiting places are flocks on files in the slots directory, so a
+worker that dies frees its slots with it. Keeping max_transfers +
+queue_size below the number of workers is what leaves a lane open for
+pages and thumbnails: they never wait behind MP3s for a worker. Under
+asgi.py a transfer holds no thread, and the cap is off unless configured.
+
+Rejections and waits go to /metrics and, summed up, to the log once a
+minute per worker.
+"""
+
+import fcntl
+import logging
+import math
+import random
+import threading
+import time
+from pathlib import Path
+
+import metrics
+import token_buckets
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks of a waiting request for a free slot
+POLL_SECONDS = 0.05
+
+# Unused client buckets are dropped after this long (by then they are full again)
+IDLE_BUCKET_SECONDS = 60 * 60
+PRUNE_INTERVAL = 10 * 60
+
+SUMMARY_INTERVAL = 60
+
+# A Range continuation of a transfer sent this recently is free; any other one costs CONTINUATION_COST
+CONTINUATION_SECONDS = 60 * 60
+CONTINUATION_COST = 0.25
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS admitted_transfers (
+    key TEXT PRIMARY KEY,
+    etag TEXT NOT NULL,
+    admitted_at REAL NOT NULL
+);
+"""
+
+_db = None
+_slots_dir = None
+_limits = {}
+_batches = {}
+_max_transfers = 0
+_queue_size = 0
+_queue_seconds = 0.0
+_busy_retry_after = 5
+
+# Batched lanes: tokens counted in this worker but not yet taken from the shared bucket,
+# and until when (time.monotonic()) this worker rejects a client whose batch was refused
+_pending_lock = threading.Lock()
+_pending = {}
+_blocked = {}
+
+_last_prune = time.monotonic()
+_summary_lock = threading.Lock()
+_summary = {}
+_summary_clients = {}
+_summary_started = time.monotonic()
+
+
+class Rejected(Exception):
+    """A request turned away: HTTP status (429 or 503) and the whole seconds the client should wait."""
+
+    def __init__(self, status, retry_after, reason):
+        super().__init__(reason)
+        self.status = status
+        self.retry_after = max(1, math.ceil(retry_after))
+        self.reason = reason
+
+
+def init(slots_dir, limits, max_transfers, queue_size=0, queue_seconds=0.0, busy_retry_after=_busy_retry_after,
+         db_path=None, batches=None):
+    """
+    Configure admission. limits maps a lane to (requests per minute, burst)
+    per client; a lane that is missing or has 0 is not limited. batches maps
+    a lane to how many of its requests a worker takes from the shared bucket
+    at once. max_transfers=0 turns the transfer cap off. db_path holds the
+    transfers sent in full (by default limits.db next to the slots directory).
+    """
+    global _db, _slots_dir, _limits, _batches, _max_transfers, _queue_size, _queue_seconds, _busy_retry_after
+    _slots_dir = Path(slots_dir)
+    _db = Database(db_path or _slots_dir.parent / 'limits.db', SCHEMA)
+    _slots_dir.mkdir(exist_ok=True)
+    _limits = dict(limits)
+    _batches = dict(batches or {})
+    with _pending_lock:
+        _pending.clear()
+        _blocked.clear()
+    _max_transfers = max(0, int(max_transfers))
+    _queue_size = max(0, int(queue_size))
+    _queue_seconds = max(0.0, float(queue_seconds))
+    _busy_retry_after = busy_retry_after
+
+
+def check_rate(client, lane, cost=1):
+    """Count a request of a client in a lane. Raises Rejected (429) when the client's budget is used up."""
+    per_minute, burst = _limits.get(lane, (0, 0))
+    if not per_minute:
+        return
+    _prune_if_due()
+    key = f'{lane}:{client}'
+    batch = min(_batches.get(lane, 1), burst)
+    if batch > 1:
+        cost = _batched(lane, client, cost, batch)
+        if cost is None:
+            return
+    allowed, retry_after = token_buckets.take(key, cost, per_minute / 60, burst)
+    if not allowed:
+        if batch > 1:
+            with _pending_lock:
+                _blocked[key] = time.monotonic() + retry_after
+        _reject_rate(client, lane, retry_after)
+
+
+def _batched(lane, client, cost, batch):
+    """
+    Count cost in this worker. Returns the tokens to take from the shared
+    bucket now (a full batch), or None while the batch is still filling.
+    Raises Rejected while the client is blocked here.
+    """
+    key = f'{lane}:{client}'
+    with _pending_lock:
+        wait = _blocked.get(key, 0) - time.monotonic()
+        if wait <= 0:
+            pending = _pending.pop(key, 0) + cost
+            if pending < batch:
+                _pending[key] = pending
+                return None
+            return pending
+    _reject_rate(client, lane, wait)
+
+
+def _reject_rate(client, lane, retry_after):
+    _record('rejected', lane=lane, reason='rate_limit', client=client)
+    raise Rejected(429, retry_after, 'rate_limit')
+
+
+def check_continuation(client, lane, resource, if_range):
+    """
+    Count a Range request for resource that starts past its first byte. It
+    is free when if_range (the request's If-Range header) is the ETag
+    remember_transfer() recorded for this client and resource; otherwise it
+    costs CONTINUATION_COST. Raises Rejected (429) like check_rate().
+    """
+    if if_range and _limits.get(lane, (0, 0))[0]:
+        row = _db.connect().execute(
+            'SELECT etag FROM admitted_transfers WHERE key = ? AND admitted_at >= ?',
+            (f'{lane}:{client}:{resource}', time.time() - CONTINUATION_SECONDS)).fetchone()
+        if row is not None and row['etag'] == if_range:
+            return
+    check_rate(client, lane, CONTINUATION_COST)
+
+
+def remember_transfer(client, lane, resource, etag):
+    """Record that a client was admitted to resource (counted in full) and sent it with this ETag."""
+    if not _limits.get(lane, (0, 0))[0]:
+        return
+    with _db.transaction() as conn:
+        conn.execute('INSERT OR REPLACE INTO admitted_transfers (key, etag, admitted_at) VALUES (?, ?, ?)',
+                     (f'{lane}:{client}:{resource}', etag, time.time()))
+
+
+def _prune_if_due():
+    global _last_prune
+    if time.monotonic() - _last_prune < PRUNE_INTERVAL:
+        return
+    _last_prune = time.monotonic()
+    removed = token_buckets.prune(IDLE_BUCKET_SECONDS)
+    # Forget this worker's unfinished batches (less than a batch per client) and ended blocks
+    with _pending_lock:
+        _pending.clear()
+        for key in [key for key, until in _blocked.items() if until <= time.monotonic()]:
+            del _blocked[key]
+    with _db.transaction() as conn:
+        conn.execute('DELETE FROM admitted_transfers WHERE admitted_at < ?', (time.time() - CONTINUATION_SECONDS,))
+    if removed:
+        logger.debug("Dropped %d idle client rate limit buckets", removed)
+
+
+def _try_lock(kind, count):
+    """Open and flock a free one of count lock files of a kind, or return None."""
+    for index in random.sample(range(count), count):
+        lock_file = open(_slots_dir / f'{kind}-{index}.lock', 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return lock_file
+        except BlockingIOError:
+            lock_file.close()
+    return None
+
+
+def acquire_transfer(lane='downloads'):
+    """
+    Claim a transfer slot, waiting in line if allowed. Returns a function
+    that frees it (safe to call more than once); raises Rejected (503) when
+    the server is at its transfer cap.
+    """
+    if not _max_transfers:
+        return lambda: None
+
+    slot = _try_lock('transfer', _max_transfers)
+    if slot is None:
+        slot = _wait_for_slot(lane)
+
+    released = threading.Event()
+
+    def release():
+        if not released.is_set():
+            released.set()
+            slot.close()
+
+    return release
+
+
+def _wait_for_slot(lane):
+    place = _try_lock('queue', _queue_size) if _queue_size and _queue_seconds else None
+    if place is None:
+        _record('rejected', lane=lane, reason='busy')
+        raise Rejected(503, _busy_retry_after, 'busy')
+
+    start = time.perf_counter()
+    try:
+        while time.perf_counter() - start < _queue_seconds:
+            time.sleep(POLL_SECONDS)
+            slot = _try_lock('transfer', _max_transfers)
+            if slot is not None:
+                metrics.observe('admission_queue_wait_seconds', time.perf_counter() - start)
+                _record('queued', lane=lane, outcome='admitted')
+                return slot
+    finally:
+        place.close()
+
+    metrics.observe('admission_queue_wait_seconds', time.perf_counter() - start)
+    _record('queued', lane=lane, outcome='timeout')
+    _record('rejected', lane=lane, reason='queue_timeout')
+    raise Rejected(503, _busy_retry_after, 'queue_timeout')
+
+
+def _record(event, lane, client=None, **labels):
+    """Count an admission event in the metrics and in this worker's periodic log summary."""
+    metrics.inc(f'admission_{event}_total', lane=lane, **labels)
+    key = (event, lane, *labels.values())
+    with _summary_lock:
+        _summary[key] = _summary.get(key, 0) + 1
+        if client is not None:
+            _summary_clients[client] = _summary_clients.get(client, 0) + 1
+    _log_summary_if_due()
+
+
+def _log_summary_if_due():
+    global _summary, _summary_clients, _summary_started
+    with _summary_lock:
+        elapsed = time.monotonic() - _summary_started
+        if elapsed < SUMMARY_INTERVAL:
+            return
+        counts, clients = _summary, _summary_clients
+        _summary, _summary_clients, _summary_started = {}, {}, time.monotonic()
+
+    parts = [f"{count} {event} {lane} ({detail})" for (event, lane, detail), count in sorted(counts.items())]
+    top_client = max(clients, key=clients.get) if clients else None
+    logger.warning("Admission in the last %.0fs: %s", elapsed, ', '.join(parts),
+                   extra={'top_limited_client': top_client,
+                          'top_limited_requests': clients.get(top_client)})
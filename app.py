@@ -1,31 +1,83 @@
+import fcntl
+import logging
 import os
-import json
 import re
-import requests
-import yt_dlp
-import sys
+import mimetypes
+import threading
 import time
-from flask import Flask, render_template, request, redirect, url_for, session, send_file, jsonify
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from flask import Flask, Response, g, render_template, stream_template, request, redirect, url_for, session, jsonify
+from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.security import check_password_hash, generate_password_hash
 from dotenv import load_dotenv
 from pathlib import Path
 
-# Force unbuffered output for real-time logging
-sys.stdout.reconfigure(line_buffering=True)
-sys.stderr.reconfigure(line_buffering=True)
+import admission
+import audio_metadata
+import catalog
+import download_strategies
+import format_cache
+import jobs
+import logging_setup
+import metrics
+import reconcile
+import search_cache
+import static_pages
+import storage
+import streaming
+import thumbnails
+import token_buckets
+import transcode
+import zip_export
+from file_delivery import send_cached_file, send_generated, is_content_addressed, IMMUTABLE_CACHE_CONTROL
 
 load_dotenv()
 
+# Leveled logging (LOG_LEVEL, LOG_FORMAT=json) written by a background thread
+logging_setup.configure()
+logger = logging.getLogger('app')
+
 app = Flask(__name__)
 app.secret_key = os.getenv('SECRET_KEY', 'dev-secret-key')
 ADMIN_PASSWORD = os.getenv('ADMIN_PASSWORD', 'admin')
 
-# Log EVERY request before it reaches any route
+# Bearer token required by /metrics (open when unset)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+
 @app.before_request
-def log_request():
-    print(f"\n>>> [MIDDLEWARE] Request received: {request.method} {request.path}", flush=True)
-    print(f">>> [MIDDLEWARE] Time: {time.time()}", flush=True)
-    sys.stdout.flush()
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request_metrics(response):
+    """Count the request and time it until the body has been fully sent."""
+    start = g.get('request_start', time.perf_counter())
+    endpoint = request.endpoint or 'unmatched'
+    method = request.method
+    path = request.path
+    length = response.content_length
+
+    def finished():
+        elapsed = time.perf_counter() - start
+        metrics.inc('http_requests_total', endpoint=endpoint, method=method, status=response.status_code)
+        metrics.observe('http_request_duration_seconds', elapsed, endpoint=endpoint)
+        if length:
+            metrics.inc('http_response_bytes_total', length, endpoint=endpoint)
+        logger.info('%s %s %s', method, path, response.status_code,
+                    extra={'endpoint': endpoint, 'ms': round(elapsed * 1000, 1)})
+
+    if response.direct_passthrough:
+        # File responses go straight to the server (sendfile), bypassing the
+        # close callbacks - time them up to the hand-off instead
+        finished()
+    else:
+        response.call_on_close(finished)
+    return response
 
 # Add ngrok skip warning header to all responses
 @app.after_request
@@ -45,36 +97,167 @@ DOWNLOADS_DIR.mkdir(exist_ok=True)
 THUMBNAILS_DIR = PERSISTENT_DATA_DIR / 'thumbnails'
 THUMBNAILS_DIR.mkdir(exist_ok=True)
 
-DATA_FILE = PERSISTENT_DATA_DIR / 'data.json'
+# Song catalog (SQLite, shared by all gunicorn workers)
+CATALOG_DB = PERSISTENT_DATA_DIR / 'catalog.db'
+catalog.init_db(CATALOG_DB)
 
-# Initialize data file
-if not DATA_FILE.exists():
-    DATA_FILE.write_text(json.dumps({'songs': []}, indent=2))
+# Legacy JSON catalog, imported once into the SQLite catalog
+DATA_FILE = PERSISTENT_DATA_DIR / 'data.json'
+imported_songs = catalog.import_json(DATA_FILE)
+
+# Background job queue for downloads (shared by all gunicorn workers)
+JOBS_DB = PERSISTENT_DATA_DIR / 'jobs.db'
+DOWNLOAD_WORKERS = int(os.getenv('DOWNLOAD_WORKERS', 2))
+
+# Parallel downloads inside a single bulk import job
+BULK_IMPORT_CONCURRENCY = int(os.getenv('BULK_IMPORT_CONCURRENCY', 3))
+
+# Shared cache of YouTube search results
+CACHE_DB = PERSISTENT_DATA_DIR / 'cache.db'
+search_cache.init(
+    CACHE_DB,
+    ttl_seconds=int(os.getenv('SEARCH_CACHE_TTL', 6 * 60 * 60)),
+    max_entries=int(os.getenv('SEARCH_CACHE_MAX_ENTRIES', 500)),
+    max_bytes=int(os.getenv('SEARCH_CACHE_MAX_BYTES', 5 * 1024 * 1024)),
+)
+
+# Top search results whose formats are resolved while the admin looks at the
+# results page (0 = off), and how long that stays usable
+PRERESOLVE_RESULTS = int(os.getenv('PRERESOLVE_RESULTS', 2))
+PRERESOLVE_TTL = int(os.getenv('PRERESOLVE_TTL', 10 * 60))
+
+# yt-dlp transfers: DASH/HLS fragments fetched in parallel per download, retries of a
+# failed request or fragment (resuming where it stopped), and a bandwidth budget in
+# KB/s (0 = unlimited) shared by every download in every worker, so ingests leave
+# room on the uplink for serving MP3s
+DOWNLOAD_FRAGMENT_CONCURRENCY = int(os.getenv('DOWNLOAD_FRAGMENT_CONCURRENCY', 4))
+DOWNLOAD_RETRIES = int(os.getenv('DOWNLOAD_RETRIES', 10))
+DOWNLOAD_BANDWIDTH_KBPS = int(os.getenv('DOWNLOAD_BANDWIDTH_KBPS', 0))
+
+# Rate limit buckets shared by all workers
+LIMITS_DB = PERSISTENT_DATA_DIR / 'limits.db'
+token_buckets.init(LIMITS_DB)
+
+# Admission control for public files: requests per minute per client IP (0 = unlimited),
+# MP3/ZIP transfers at once across all workers (0 = unlimited), and how many requests may
+# wait how long for one before getting 503. With MAX_CONCURRENT_TRANSFERS +
+# TRANSFER_QUEUE_SIZE below the number of gunicorn workers, pages and thumbnails always
+# find a free worker. asgi.py turns the transfer cap off unless it is set explicitly.
+# Each worker takes thumbnail requests from the shared budget RATE_LIMIT_THUMBNAILS_BATCH at
+# a time, so a page view's thumbnails cost a few writes to limits.db instead of one each.
+RATE_LIMIT_DOWNLOADS_PER_MINUTE = int(os.getenv('RATE_LIMIT_DOWNLOADS_PER_MINUTE', 30))
+RATE_LIMIT_THUMBNAILS_PER_MINUTE = int(os.getenv('RATE_LIMIT_THUMBNAILS_PER_MINUTE', 600))
+RATE_LIMIT_THUMBNAILS_BATCH = int(os.getenv('RATE_LIMIT_THUMBNAILS_BATCH', 10))
+MAX_CONCURRENT_TRANSFERS = int(os.getenv('MAX_CONCURRENT_TRANSFERS', 2))
+TRANSFER_QUEUE_SIZE = int(os.getenv('TRANSFER_QUEUE_SIZE', 1))
+TRANSFER_QUEUE_SECONDS = float(os.getenv('TRANSFER_QUEUE_SECONDS', 2))
+admission.init(
+    PERSISTENT_DATA_DIR / 'slots',
+    {
+        'downloads': (RATE_LIMIT_DOWNLOADS_PER_MINUTE, RATE_LIMIT_DOWNLOADS_PER_MINUTE),
+        'thumbnails': (RATE_LIMIT_THUMBNAILS_PER_MINUTE, RATE_LIMIT_THUMBNAILS_PER_MINUTE),
+    },
+    max_transfers=MAX_CONCURRENT_TRANSFERS,
+    queue_size=TRANSFER_QUEUE_SIZE,
+    queue_seconds=TRANSFER_QUEUE_SECONDS,
+    db_path=LIMITS_DB,
+    batches={'thumbnails': RATE_LIMIT_THUMBNAILS_BATCH},
+)
+
+# Reverse proxies in front of the app (Render has one); the client IP used for rate
+# limits is the one the last of them put in X-Forwarded-For (0 = the socket's address)
+PROXY_HOPS = int(os.getenv('PROXY_HOPS', 1))
+if PROXY_HOPS:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=PROXY_HOPS)
+
+# CRC-32 of song files, needed up front by the streamed ZIP export
+zip_export.init(CACHE_DB)
+
+# Memory of which yt-dlp cookie strategy works, with a circuit breaker
+download_strategies.init(
+    CACHE_DB,
+    failure_threshold=int(os.getenv('STRATEGY_FAILURE_THRESHOLD', 3)),
+    cooldown_seconds=int(os.getenv('STRATEGY_COOLDOWN_SECONDS', 15 * 60)),
+)
+
+# Request / yt-dlp / ffmpeg metrics, aggregated across workers for /metrics
+METRICS_DB = PERSISTENT_DATA_DIR / 'metrics.db'
+metrics.init(METRICS_DB, flush_interval=float(os.getenv('METRICS_FLUSH_SECONDS', 5)))
+
+# Song list pagination (public index, admin dashboard and /api/songs)
+PAGE_SIZE = int(os.getenv('PAGE_SIZE', 50))
+API_MAX_PAGE_SIZE = 500
+
+# Streamed pages are flushed to the client in chunks of about this many characters
+STREAM_CHUNK_SIZE = 8 * 1024
+
+# Homepage pages pre-rendered to static HTML (+ gzip/brotli) after every catalog change
+PAGES_DIR = PERSISTENT_DATA_DIR / 'pages'
+STATIC_HOMEPAGE = os.getenv('STATIC_HOMEPAGE', '1') == '1'
+HOMEPAGE_CACHE_CONTROL = 'no-cache'
+
+# 'mp3' re-encodes every download to 192 kbps MP3 at ingest; 'original' keeps
+# YouTube's m4a/opus stream and makes MP3s on demand in a size-bounded cache
+INGEST_AUDIO_FORMAT = os.getenv('INGEST_AUDIO_FORMAT', 'mp3')
+TRANSCODE_CACHE_DIR = PERSISTENT_DATA_DIR / 'transcoded'
+transcode.init(TRANSCODE_CACHE_DIR, max_bytes=int(os.getenv('TRANSCODE_CACHE_MAX_MB', 2048)) * 1024 * 1024)
+
+# Byte quota for downloads/ (0 = unlimited). Over it, the least recently downloaded
+# audio files are removed and fetched from YouTube again when someone asks for them
+STORAGE_QUOTA_MB = int(os.getenv('STORAGE_QUOTA_MB', 0))
+# Seconds a listener is asked to wait (Retry-After) while an evicted file is fetched again
+REFETCH_RETRY_AFTER = 30
+
+# Low-bitrate HLS variants for the in-page player, built in the background after ingest
+STREAMS_DIR = PERSISTENT_DATA_DIR / 'streams'
+STREAM_VARIANTS = os.getenv('STREAM_VARIANTS', '1') == '1'
+# Only Safari/iOS play HLS natively. With a URL of hls.js here, other browsers with Media
+# Source Extensions play the variants through it; without, they get the full MP3
+HLS_JS_URL = os.getenv('HLS_JS_URL', '')
+app.jinja_env.globals['HLS_JS_URL'] = HLS_JS_URL
+
+# Browser caching for served files. MP3s are revalidated with their ETag after
+# max-age; thumbnails with content-addressed names are cached forever.
+AUDIO_CACHE_CONTROL = os.getenv('AUDIO_CACHE_CONTROL', 'public, max-age=86400')
+THUMBNAIL_CACHE_CONTROL = os.getenv('THUMBNAIL_CACHE_CONTROL', 'public, max-age=604800')
 
 # Cookies file path (also in persistent storage)
 COOKIES_FILE = PERSISTENT_DATA_DIR / 'cookies.txt'
 
-print(f"[INIT] Persistent data directory: {PERSISTENT_DATA_DIR.absolute()}", flush=True)
-print(f"[INIT] Downloads directory: {DOWNLOADS_DIR.absolute()}", flush=True)
-print(f"[INIT] Thumbnails directory: {THUMBNAILS_DIR.absolute()}", flush=True)
-print(f"[INIT] Data file: {DATA_FILE.absolute()}", flush=True)
-print(f"[INIT] Cookies file: {COOKIES_FILE.absolute()}", flush=True)
+logger.info("Persistent data directory: %s", PERSISTENT_DATA_DIR.absolute())
+logger.debug("Downloads directory: %s", DOWNLOADS_DIR.absolute())
+logger.debug("Thumbnails directory: %s", THUMBNAILS_DIR.absolute())
+logger.debug("Catalog database: %s", CATALOG_DB.absolute())
+if imported_songs:
+    logger.info("Imported %d songs from %s", imported_songs, DATA_FILE.absolute())
+logger.debug("Cookies file: %s", COOKIES_FILE.absolute())
+logger.info("Jobs database: %s (%d concurrent downloads)", JOBS_DB.absolute(), DOWNLOAD_WORKERS)
 
 
-def load_data():
-    """Load songs data from JSON file."""
-    with open(DATA_FILE, 'r') as f:
-        return json.load(f)
+def search_youtube(query, num_results=5):
+    """Search YouTube for a song and return top results with metadata (cached)."""
+    cached = search_cache.get(query, num_results)
+    metrics.inc('search_cache_lookups_total', result='miss' if cached is None else 'hit')
+    if cached is not None:
+        return cached
+
+    start_time = time.time()
+    videos = _search_youtube_uncached(query, num_results)
+    elapsed = time.time() - start_time
+    metrics.observe('ytdlp_search_duration_seconds', elapsed)
+    logger.info("YouTube search took %.2fs", elapsed, extra={'query': query, 'results': len(videos)})
+    if videos:
+        search_cache.put(query, num_results, videos, elapsed)
+    return videos
 
 
-def save_data(data):
-    """Save songs data to JSON file."""
-    with open(DATA_FILE, 'w') as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+def youtube_dl(opts):
+    """A yt_dlp.YoutubeDL; yt-dlp is imported on first use, so workers that only serve public pages never load it."""
+    import yt_dlp
+    return yt_dlp.YoutubeDL(opts)
 
 
-def search_youtube(query, num_results=5):
-    """Search YouTube for a song and return top results with metadata."""
+def _search_youtube_uncached(query, num_results):
     ydl_opts = {
         'quiet': True,
         'no_warnings': True,
@@ -82,7 +265,7 @@ def search_youtube(query, num_results=5):
     }
 
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        with youtube_dl(ydl_opts) as ydl:
             result = ydl.extract_info(f"ytsearch{num_results}:{query}", download=False)
             if result and 'entries' in result and len(result['entries']) > 0:
                 videos = []
@@ -97,33 +280,17 @@ def search_youtube(query, num_results=5):
                     })
                 return videos
     except Exception as e:
-        print(f"Error searching YouTube: {e}")
+        logger.warning("Error searching YouTube: %s", e, extra={'query': query})
 
     return []
 
 
-def download_from_youtube(youtube_url, output_path, thumbnail_path=None):
-    """Download audio from YouTube as MP3 and optionally save thumbnail."""
-    print(f"  [download_from_youtube] Starting download for: {youtube_url}", flush=True)
+# yt-dlp format selection for every download
+DOWNLOAD_FORMAT = 'bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio/best'
 
-    # Check if cookies file exists
-    print(f"  [download_from_youtube] Checking for cookies.txt at {COOKIES_FILE}... {'FOUND' if COOKIES_FILE.exists() else 'NOT FOUND'}", flush=True)
 
-    ydl_opts = {
-        'format': 'bestaudio[ext=m4a]/bestaudio[ext=webm]/bestaudio/best',
-        'postprocessors': [{
-            'key': 'FFmpegExtractAudio',
-            'preferredcodec': 'mp3',
-            'preferredquality': '192',
-        }],
-        'outtmpl': str(output_path.with_suffix('')),
-        'quiet': False,
-        'no_warnings': False,
-        'writethumbnail': True if thumbnail_path else False,
-        'extract_audio': True,
-    }
-
-    # Try multiple strategies for cookie authentication
+def ydl_strategies(ydl_opts):
+    """(name, options) for each cookie strategy, in the order download_strategies prefers."""
     strategies = []
 
     # Strategy 1: Use cookies.txt if it exists
@@ -142,125 +309,961 @@ def download_from_youtube(youtube_url, output_path, thumbnail_path=None):
     # Strategy 3: Try without cookies (fallback)
     strategies.append(("no authentication", ydl_opts.copy()))
 
-    print(f"  [download_from_youtube] Will try {len(strategies)} strategies", flush=True)
+    # Last successful strategy first, repeatedly failing ones skipped for a while
+    return download_strategies.order(strategies)
+
+
+def resolve_formats(youtube_url):
+    """A video's info dict with its formats, extracted without downloading, and the strategy used (for format_cache)."""
+    strategy_name, opts = ydl_strategies({'format': DOWNLOAD_FORMAT, 'quiet': True, 'no_warnings': True})[0]
+    with youtube_dl(opts) as ydl:
+        info = ydl.extract_info(youtube_url, download=False)
+        return ydl.sanitize_info(info), strategy_name
+
+
+def bandwidth_throttle():
+    """
+    A yt-dlp progress hook that holds a download to the shared DOWNLOAD_BANDWIDTH_KBPS
+    budget: every ~quarter second of budget it draws the bytes received so far from
+    the 'download_bandwidth' bucket and sleeps off any debt, which stalls yt-dlp's
+    read loop (or that fragment's thread). None when there is no budget.
+    """
+    if DOWNLOAD_BANDWIDTH_KBPS <= 0:
+        return None
+    rate = DOWNLOAD_BANDWIDTH_KBPS * 1024
+    quantum = max(16 * 1024, min(256 * 1024, rate // 4))
+    state = {'file': None, 'seen': 0, 'pending': 0}
+    lock = threading.Lock()
+
+    def hook(d):
+        if d.get('status') != 'downloading':
+            return
+        with lock:
+            name = d.get('tmpfilename') or d.get('filename')
+            downloaded = d.get('downloaded_bytes') or 0
+            if name != state['file'] or downloaded < state['seen']:
+                # Next file (or a restart): bytes already on disk from a resume are free
+                state['file'], state['seen'] = name, downloaded
+                return
+            state['pending'] += downloaded - state['seen']
+            state['seen'] = downloaded
+            if state['pending'] < quantum:
+                return
+            amount, state['pending'] = state['pending'], 0
+        wait = token_buckets.reserve('download_bandwidth', amount, rate, burst=rate)
+        if wait > 0:
+            metrics.inc('download_throttle_seconds_total', wait)
+            time.sleep(wait)
+
+    return hook
+
+
+def is_partial_download(name):
+    """Whether a file is yt-dlp's unfinished download: a .part file, a fragment or fragment state."""
+    return name.endswith(('.part', '.ytdl')) or '.part-Frag' in name
+
+
+def has_partial_download(base_path):
+    """Whether yt-dlp left a partial download under this name."""
+    return any(is_partial_download(path.name) for path in base_path.parent.glob(f"{base_path.name}.*"))
+
+
+# Lock files that serialize downloads of the same video (by hash of its id)
+DOWNLOAD_LOCK_STRIPES = 64
+
+
+@contextmanager
+def download_slot(video_id):
+    """
+    Yield the private temporary path a video is downloaded to before it is moved into place.
+
+    With a video id the path is the same on every attempt, so a retried job
+    resumes the partial files of the one before, and an flock lets only one
+    job at a time download the video (or another video sharing its lock
+    stripe). Leftovers are deleted on success; after a failure the partial
+    downloads are kept for the next attempt (the storage reconciler removes
+    the ones nobody comes back for). Without a video id the path is random
+    and everything is deleted.
+    """
+    if not (video_id and re.fullmatch(r'[\w-]{1,64}', video_id)):
+        temp_path = DOWNLOADS_DIR / f".{uuid.uuid4().hex}.mp3"
+        try:
+            yield temp_path
+        finally:
+            remove_download_leftovers(temp_path)
+        return
+
+    temp_path = DOWNLOADS_DIR / f".dl-{video_id}.mp3"
+    # A fixed set of lock files, rather than one left behind for every video
+    stripe = zlib.crc32(video_id.encode()) % DOWNLOAD_LOCK_STRIPES
+    with open(DOWNLOADS_DIR / f".download-{stripe}.lock", 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield temp_path
+        except BaseException:
+            remove_download_leftovers(temp_path, keep_partial=True)
+            raise
+        else:
+            remove_download_leftovers(temp_path)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def remove_download_leftovers(temp_path, keep_partial=False):
+    """Delete the files yt-dlp and ingest left under a temporary download name."""
+    for leftover in DOWNLOADS_DIR.glob(f"{temp_path.stem}.*"):
+        if not (keep_partial and is_partial_download(leftover.name)):
+            leftover.unlink(missing_ok=True)
+
+
+def download_from_youtube(youtube_url, output_path, thumbnail_path=None, progress_hook=None, audio_format='mp3'):
+    """
+    Download audio from YouTube and optionally save the thumbnail.
+
+    With audio_format='mp3' the audio is re-encoded to output_path (.mp3).
+    With 'original' the downloaded m4a/opus stream is kept as-is (only
+    remuxed out of its container), next to output_path with the matching
+    extension. Returns the path of the audio file, or None on failure.
+
+    Formats resolved in advance (format_cache) skip yt-dlp's extraction.
+    Partial files left under output_path by an earlier attempt or strategy
+    are resumed, not fetched again; the caller decides when to delete them.
+    """
+    logger.info("Starting download", extra={'url': youtube_url})
+    logger.debug("cookies.txt at %s: %s", COOKIES_FILE, 'found' if COOKIES_FILE.exists() else 'not found')
+
+    # Time the ffmpeg post-processing (MP3 extraction) separately from the download
+    postprocessor_started = {}
+
+    def postprocessor_hook(d):
+        name = d.get('postprocessor')
+        if d.get('status') == 'started':
+            postprocessor_started[name] = time.perf_counter()
+        elif d.get('status') == 'finished' and name in postprocessor_started:
+            elapsed = time.perf_counter() - postprocessor_started.pop(name)
+            metrics.observe('ffmpeg_duration_seconds', elapsed, postprocessor=name)
+            logger.debug("%s took %.2fs", name, elapsed)
+
+    # Time to first byte of each attempt: extraction plus the start of the transfer
+    first_byte = {}
+
+    def first_byte_hook(d):
+        if d.get('status') == 'downloading' and d.get('downloaded_bytes') and 'at' not in first_byte:
+            first_byte['at'] = time.perf_counter()
+
+    if audio_format == 'original':
+        # 'best' copies the audio stream instead of re-encoding it
+        extract_audio = {'key': 'FFmpegExtractAudio', 'preferredcodec': 'best'}
+        audio_exts = [ext for ext in transcode.AUDIO_TYPES if ext != '.mp3'] + ['.mp3']
+    else:
+        extract_audio = {'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3', 'preferredquality': '192'}
+        audio_exts = ['.mp3']
+
+    ydl_opts = {
+        'format': DOWNLOAD_FORMAT,
+        'postprocessors': [extract_audio],
+        # Named after the downloaded format (<name>.m4a/.webm): a partial file is only resumed
+        # by the same kind of stream, and kept original audio gets its extension
+        'outtmpl': f"{output_path.with_suffix('')}.%(ext)s",
+        'quiet': False,
+        'no_warnings': False,
+        'writethumbnail': True if thumbnail_path else False,
+        'extract_audio': True,
+        'postprocessor_hooks': [postprocessor_hook],
+        'progress_hooks': [first_byte_hook] + ([progress_hook] if progress_hook else []),
+        # Resume .part files and fragment downloads instead of starting over
+        'continuedl': True,
+        'concurrent_fragment_downloads': max(1, DOWNLOAD_FRAGMENT_CONCURRENCY),
+        'retries': DOWNLOAD_RETRIES,
+        'fragment_retries': DOWNLOAD_RETRIES,
+    }
+    throttle = bandwidth_throttle()
+    if throttle:
+        ydl_opts['progress_hooks'].insert(0, throttle)
+
+    # Try multiple strategies for cookie authentication
+    strategies = ydl_strategies(ydl_opts)
+    video_id = catalog.extract_video_id(youtube_url)
+
+    logger.debug("Will try %d strategies: %s", len(strategies), ', '.join(name for name, _ in strategies))
 
     # Try each strategy until one works
     for strategy_index, (strategy_name, opts) in enumerate(strategies, 1):
+        strategy_start = time.time()
+        attempt_start = time.perf_counter()
+        first_byte.clear()
         try:
-            print(f"\n  [download_from_youtube] === STRATEGY {strategy_index}/{len(strategies)}: {strategy_name} ===", flush=True)
-            print(f"  [download_from_youtube] Downloading from: {youtube_url}", flush=True)
-            print(f"  [download_from_youtube] Output path: {output_path}", flush=True)
-
-            import time
-            strategy_start = time.time()
-
-            print(f"  [download_from_youtube] Creating YoutubeDL instance...", flush=True)
-            with yt_dlp.YoutubeDL(opts) as ydl:
-                print(f"  [download_from_youtube] Calling extract_info()...", flush=True)
-                info = ydl.extract_info(youtube_url, download=True)
-                print(f"  [download_from_youtube] extract_info() completed", flush=True)
+            logger.debug("Strategy %d/%d: %s (output %s)", strategy_index, len(strategies), strategy_name, output_path)
+            if has_partial_download(output_path.with_suffix('')):
+                logger.info("Resuming a partial download", extra={'url': youtube_url, 'strategy': strategy_name})
+                metrics.inc('download_resumes_total')
+            resolved = format_cache.get(video_id, strategy_name)
+            with youtube_dl(opts) as ydl:
+                if resolved is not None:
+                    try:
+                        ydl.process_ie_result(resolved, download=True)
+                    except Exception as e:
+                        # Expired or revoked stream URLs: extract again
+                        logger.info("Download with pre-resolved formats failed (%s), resolving again", e,
+                                    extra={'url': youtube_url})
+                        format_cache.discard(video_id)
+                        resolved = None
+                        ydl.extract_info(youtube_url, download=True)
+                else:
+                    ydl.extract_info(youtube_url, download=True)
 
             strategy_elapsed = time.time() - strategy_start
-            print(f"  [download_from_youtube] Strategy took {strategy_elapsed:.2f} seconds", flush=True)
-
-            # Check if the mp3 file was created
-            print(f"  [download_from_youtube] Checking if file exists at: {output_path}", flush=True)
-            if output_path.exists():
-                print(f"  [download_from_youtube] ✓ File created successfully: {output_path}", flush=True)
-                file_size = output_path.stat().st_size / (1024 * 1024)  # MB
-                print(f"  [download_from_youtube] File size: {file_size:.2f} MB", flush=True)
+            ttfb = first_byte['at'] - attempt_start if 'at' in first_byte else None
+            if ttfb is not None:
+                metrics.observe('ytdlp_download_ttfb_seconds', ttfb,
+                                formats='pre-resolved' if resolved is not None else 'extracted')
+
+            # Check if the audio file was created (yt-dlp names it after the codec)
+            base_path = output_path.with_suffix('')
+            audio_path = next((base_path.with_suffix(ext) for ext in audio_exts
+                               if base_path.with_suffix(ext).exists()), None)
+            if audio_path:
+                file_size = audio_path.stat().st_size / (1024 * 1024)  # MB
+                logger.debug("File created: %s (%.2f MB)", audio_path, file_size)
 
                 # Handle thumbnail if requested
                 if thumbnail_path:
-                    print(f"  [download_from_youtube] Processing thumbnail...", flush=True)
                     # yt-dlp saves thumbnail with same basename as audio file
                     possible_thumb_exts = ['.jpg', '.png', '.webp']
-                    base_path = output_path.with_suffix('')
                     for ext in possible_thumb_exts:
                         thumb_file = base_path.with_suffix(ext)
                         if thumb_file.exists():
                             # Move thumbnail to desired location
                             import shutil
                             shutil.move(str(thumb_file), str(thumbnail_path))
-                            print(f"  [download_from_youtube] ✓ Thumbnail saved: {thumbnail_path}", flush=True)
+                            logger.debug("Thumbnail saved: %s", thumbnail_path)
                             break
                     else:
-                        print(f"  [download_from_youtube] ⚠ No thumbnail found", flush=True)
+                        logger.warning("No thumbnail found", extra={'url': youtube_url})
 
-                print(f"  [download_from_youtube] === SUCCESS ===", flush=True)
-                return True
+                record_download_attempt(strategy_name, strategy_elapsed, 'success')
+                logger.info("Download succeeded in %.2fs", strategy_elapsed,
+                            extra={'url': youtube_url, 'strategy': strategy_name, 'mb': round(file_size, 2),
+                                   'ttfb': round(ttfb, 2) if ttfb is not None else None})
+                return audio_path
             else:
-                print(f"  [download_from_youtube] ✗ File not created at expected path: {output_path}", flush=True)
                 # Check if file exists without extension
-                base_path = output_path.with_suffix('')
-                if base_path.exists():
-                    print(f"  [download_from_youtube] Found file without .mp3 extension, renaming...", flush=True)
+                if base_path.exists() and audio_format == 'mp3':
+                    logger.debug("Found file without .mp3 extension, renaming")
                     base_path.rename(output_path)
-                    print(f"  [download_from_youtube] === SUCCESS (after rename) ===", flush=True)
-                    return True
+                    record_download_attempt(strategy_name, strategy_elapsed, 'success')
+                    logger.info("Download succeeded in %.2fs", strategy_elapsed,
+                                extra={'url': youtube_url, 'strategy': strategy_name})
+                    return output_path
                 else:
-                    print(f"  [download_from_youtube] File not found even without extension", flush=True)
+                    logger.warning("Output file not created at %s", output_path,
+                                   extra={'url': youtube_url, 'strategy': strategy_name})
+                    record_download_attempt(strategy_name, strategy_elapsed, 'failure', 'output file not created')
         except Exception as e:
-            import traceback
-            print(f"  [download_from_youtube] ✗ Strategy '{strategy_name}' FAILED", flush=True)
-            print(f"  [download_from_youtube] Error: {e}", flush=True)
-            print(f"  [download_from_youtube] Traceback:", flush=True)
-            traceback.print_exc()
-            sys.stdout.flush()
-            sys.stderr.flush()
+            logger.warning("Strategy '%s' failed: %s", strategy_name, e, exc_info=True,
+                           extra={'url': youtube_url, 'strategy': strategy_name})
+            record_download_attempt(strategy_name, time.time() - strategy_start, 'failure', e)
             # Continue to next strategy
             continue
 
     # All strategies failed
-    print(f"  [download_from_youtube] === ALL STRATEGIES FAILED ===", flush=True)
-    print(f"  [download_from_youtube] Error: All download strategies failed for {youtube_url}", flush=True)
-    print("  [download_from_youtube] Tip: For better reliability, export YouTube cookies to cookies.txt file", flush=True)
-    return False
+    logger.error("All download strategies failed (export YouTube cookies to cookies.txt for better reliability)",
+                 extra={'url': youtube_url})
+    return None
+
+
+def record_download_attempt(strategy_name, seconds, outcome, error=None):
+    """Feed one yt-dlp attempt to the strategy circuit breaker and the metrics."""
+    metrics.observe('ytdlp_download_duration_seconds', seconds, strategy=strategy_name, outcome=outcome)
+    if outcome == 'success':
+        download_strategies.record_success(strategy_name, seconds)
+    else:
+        download_strategies.record_failure(strategy_name, seconds, error)
+
+
+def make_progress_hook(progress):
+    """Adapt a job progress callback to a yt-dlp progress hook."""
+    def progress_hook(d):
+        total = d.get('total_bytes') or d.get('total_bytes_estimate')
+        downloaded = d.get('downloaded_bytes')
+        if d.get('status') == 'downloading':
+            percent = round(downloaded * 100 / total, 1) if total and downloaded is not None else None
+            progress(percent=percent, downloaded_bytes=downloaded, total_bytes=total)
+        elif d.get('status') == 'finished':
+            progress(percent=100.0, downloaded_bytes=downloaded, total_bytes=total)
+    return progress_hook
+
+
+def describe_audio(audio_path, title, media):
+    """Tag an audio file with its title and cover (media's thumbnail) and return its metadata fields, or {} on failure."""
+    cover = media.get('thumbnail_2x') or media.get('thumbnail')
+    try:
+        return audio_metadata.extract(audio_path, title, THUMBNAILS_DIR / cover if cover else None)
+    except Exception as e:
+        logger.warning("Reading audio metadata failed: %s", e, extra={'file': Path(audio_path).name})
+        return {}
+
+
+def ingest_song_files(youtube_url, title=None, progress_hook=None):
+    """
+    Download a YouTube video's audio and thumbnail into persistent storage.
+
+    Audio is stored as <video_id>.mp3 - or .m4a/.opus with
+    INGEST_AUDIO_FORMAT=original - or under its content hash if the URL has
+    no usable video id, so different songs never overwrite each other's
+    files. A video that is already in the catalog is not downloaded again:
+    its existing audio and thumbnail are reused. New MP3s are tagged with
+    title and cover art, and duration, bitrate, size and checksum are
+    recorded (audio_metadata.py).
+
+    Returns the catalog fields for the files (filename, video_id, thumbnail
+    ...); raises RuntimeError if every download strategy failed.
+    """
+    video_id = catalog.extract_video_id(youtube_url)
+    if video_id and not re.fullmatch(r'[\w-]{1,64}', video_id):
+        video_id = None
+
+    existing = catalog.get_song_by_video_id(video_id) if video_id else None
+    if existing and (DOWNLOADS_DIR / existing['filename']).exists():
+        logger.info("Video %s is already downloaded as %s (song %d) - reusing its files",
+                    video_id, existing['filename'], existing['id'])
+        return {field: existing[field] for field in catalog.MEDIA_FIELDS}
+
+    # Download under a private temporary name and move it into place afterwards,
+    # so concurrent jobs never write to (or serve) the same half-written file
+    with download_slot(video_id) as temp_path:
+        # yt-dlp's thumbnail lands here first; thumbnails.ingest() stores the real variants
+        thumbnail_path = THUMBNAILS_DIR / f"{temp_path.stem}.source"
+
+        start_time = time.time()
+        try:
+            audio_path = download_from_youtube(youtube_url, temp_path, thumbnail_path, progress_hook=progress_hook,
+                                               audio_format=INGEST_AUDIO_FORMAT)
+            logger.debug("download_from_youtube() completed in %.2fs, audio: %s", time.time() - start_time, audio_path)
+
+            if not audio_path:
+                raise RuntimeError('שגיאה בהורדה מיוטיוב. אולי צריך לעדכן cookies?')
+
+            stem = video_id or audio_metadata.file_sha256(audio_path)[:32]
+            filename = f"{stem}{audio_path.suffix}"
+
+            fields = {'filename': filename, 'video_id': video_id, 'thumbnail': None}
+            if thumbnail_path.exists():
+                try:
+                    fields.update(thumbnails.ingest(thumbnail_path, THUMBNAILS_DIR))
+                    logger.debug("Thumbnail: %s / %s", fields['thumbnail'], fields['thumbnail_2x'])
+                except Exception as e:
+                    logger.warning("Thumbnail ingest failed: %s", e, extra={'url': youtube_url})
+
+            # Tags are written before the file is moved into place, so it is never served half-tagged
+            fields.update(describe_audio(audio_path, title, fields))
+            os.replace(audio_path, DOWNLOADS_DIR / filename)
+            logger.info("Stored audio as %s", filename)
+            return fields
+        finally:
+            thumbnail_path.unlink(missing_ok=True)
+
+
+def refetch_audio(filename):
+    """Download an evicted audio file again from its song's YouTube URL, under the same name."""
+    song = catalog.get_song_by_filename(filename)
+    if song is None or not song['youtube_url']:
+        raise RuntimeError(f'אין קישור יוטיוב לקובץ {filename}')
+
+    extension = Path(filename).suffix
+    with download_slot(song['video_id']) as temp_path:
+        audio_path = download_from_youtube(song['youtube_url'], temp_path,
+                                           audio_format='mp3' if extension == '.mp3' else 'original')
+        if not audio_path:
+            raise RuntimeError('שגיאה בהורדה מיוטיוב. אולי צריך לעדכן cookies?')
+        if audio_path.suffix != extension:
+            raise RuntimeError(f"YouTube now serves {audio_path.suffix} audio for {filename}")
+        metadata = describe_audio(audio_path, song['display_name'], song)
+        os.replace(audio_path, DOWNLOADS_DIR / filename)
+        if metadata:
+            catalog.update_songs_with_file(filename, **metadata)
+
+
+def refetchable_audio_files():
+    """Audio files that refetch_audio() can restore: those of songs with a YouTube URL."""
+    return {song['filename'] for song in catalog.list_songs() if song['youtube_url']}
+
+
+def run_download_job(params, progress):
+    """Job handler: download a selected YouTube video and add it to the catalog."""
+    youtube_url = params['youtube_url']
+    search_query = params.get('search_query', '')
+
+    files = ingest_song_files(youtube_url, params['youtube_title'], progress_hook=make_progress_hook(progress))
+
+    song_id = catalog.add_song(
+        display_name=params['youtube_title'],
+        youtube_url=youtube_url,
+        search_query=search_query,
+        **files
+    )
+    logger.info("Song %d added to the catalog", song_id, extra={'url': youtube_url})
+    queue_stream_variants(files, params['youtube_title'])
+    storage.enforce()
+    return {'song_id': song_id}
+
+
+def queue_stream_variants(files, title):
+    """Schedule the HLS variants of newly ingested audio, unless they already exist."""
+    if STREAM_VARIANTS and not files.get('has_stream'):
+        jobs.enqueue('stream_variants', {'filename': files['filename'], 'youtube_title': title})
+
+
+def run_stream_job(params, progress):
+    """Job handler: build the low-bitrate HLS variants of a song's audio file."""
+    filename = params['filename']
+    source_path = storage.ensure(filename)
+    streaming.generate(source_path, STREAMS_DIR)
+    updated = catalog.update_songs_with_file(filename, has_stream=1)
+    return {'filename': filename, 'songs': updated}
+
+
+def queue_refetch(song):
+    """Schedule a job bringing back a song's evicted audio file, unless one is already pending."""
+    filename = song['filename']
+    if any(job['params'].get('filename') == filename
+           for job in jobs.list_jobs(jobs.PENDING_STATES, limit=500, kind='refetch')):
+        return
+    jobs.enqueue('refetch', {'filename': filename, 'youtube_title': song['display_name']})
+
+
+def run_refetch_job(params, progress):
+    """Job handler: download an evicted audio file again (storage.ensure waits for a fetch already running)."""
+    storage.ensure(params['filename'])
+    return {'filename': params['filename']}
+
+
+def run_reconcile_job(params, progress):
+    """Job handler: check the stored files against the catalog, optionally repairing what it finds."""
+    report = reconcile.scan(checksums=params.get('checksums', False), progress=progress)
+    if params.get('repair'):
+        report['repair'] = reconcile.repair(report)
+    return report
+
+
+def resolve_bulk_entries(entries):
+    """
+    Resolve pasted playlist URLs, video URLs and free-text queries to videos.
+
+    Uses one yt-dlp instance in flat-extraction mode, so playlists expand to
+    their entries without fetching every video page. Returns (videos, errors)
+    where each video is a dict with youtube_url, title and source. Both carry
+    entry_index, the position of their entry in entries.
+    """
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': 'in_playlist',
+    }
+
+    videos = []
+    errors = []
+    seen_ids = set()
+
+    def add_video(entry, source, entry_index):
+        video_id = entry.get('id') or catalog.extract_video_id(entry.get('url'))
+        if not video_id or video_id in seen_ids:
+            return
+        seen_ids.add(video_id)
+        videos.append({
+            'youtube_url': f"https://www.youtube.com/watch?v={video_id}",
+            'title': entry.get('title') or video_id,
+            'source': source,
+            'entry_index': entry_index,
+        })
+
+    with youtube_dl(ydl_opts) as ydl:
+        for entry_index, source in enumerate(entries):
+            target = source if re.match(r'^https?://', source) else f"ytsearch1:{source}"
+            try:
+                info = ydl.extract_info(target, download=False)
+            except Exception as e:
+                logger.warning("Bulk import could not resolve '%s': %s", source, e)
+                errors.append({'source': source, 'error': str(e), 'entry_index': entry_index})
+                continue
+
+            if info and info.get('entries') is not None:
+                resolved = [entry for entry in info['entries'] if entry]
+                if not resolved:
+                    errors.append({'source': source, 'error': 'לא נמצאו סרטונים', 'entry_index': entry_index})
+                for entry in resolved:
+                    add_video(entry, source, entry_index)
+            elif info:
+                add_video(info, source, entry_index)
+
+    return videos, errors
+
+
+def run_bulk_import_job(params, progress):
+    """
+    Job handler: import many songs at once.
+
+    Downloads run in parallel (BULK_IMPORT_CONCURRENCY at a time) and all
+    successful songs are added to the catalog in a single transaction.
+    """
+    entries = params['entries']
+    logger.info("Bulk import: resolving %d entries", len(entries))
+    videos, errors = resolve_bulk_entries(entries)
+    logger.info("Bulk import: resolved %d videos (%d entries failed)", len(videos), len(errors))
+
+    done = 0
+    progress(percent=0.0)
+
+    items = [None] * len(videos)
+    new_songs = {}
+    with ThreadPoolExecutor(max_workers=BULK_IMPORT_CONCURRENCY, thread_name_prefix='bulk') as pool:
+        futures = {pool.submit(ingest_song_files, video['youtube_url'], video['title']): index for index, video in enumerate(videos)}
+        for future in as_completed(futures):
+            index = futures[future]
+            video = videos[index]
+            item = {'source': video['source'], 'title': video['title'], 'youtube_url': video['youtube_url'],
+                    'entry_index': video['entry_index']}
+            try:
+                files = future.result()
+            except Exception as e:
+                item.update(status='failed', error=str(e))
+            else:
+                item['status'] = 'ok'
+                new_songs[index] = dict(
+                    files,
+                    display_name=video['title'],
+                    youtube_url=video['youtube_url'],
+                    search_query=None if video['source'].startswith('http') else video['source'],
+                )
+            items[index] = item
+            done += 1
+            progress(percent=round(done * 100 / len(videos), 1))
+    # In the order the entries were pasted; a playlist's videos stay in playlist order
+    report = sorted([dict(error, status='failed') for error in errors] + items,
+                    key=lambda item: item['entry_index'])
+
+    # One catalog write for the whole batch, in the order the entries were given
+    ordered = sorted(new_songs)
+    song_ids = catalog.add_songs([new_songs[index] for index in ordered])
+    for index, song_id in zip(ordered, song_ids):
+        items[index]['song_id'] = song_id
+
+    queued_streams = set()
+    for index in ordered:
+        song = new_songs[index]
+        if song['filename'] not in queued_streams:
+            queued_streams.add(song['filename'])
+            queue_stream_variants(song, song['display_name'])
+
+    storage.enforce()
+
+    succeeded = len(new_songs)
+    logger.info("Bulk import: imported %d songs, %d failed", succeeded, len(report) - succeeded)
+    return {'items': report, 'succeeded': succeeded, 'failed': len(report) - succeeded}
+
+
+jobs.init(JOBS_DB, {
+    'download': run_download_job,
+    'bulk_import': run_bulk_import_job,
+    'stream_variants': run_stream_job,
+    'reconcile': run_reconcile_job,
+    'refetch': run_refetch_job,
+}, max_running=DOWNLOAD_WORKERS)
+resumed_jobs = jobs.resume_pending()
+if resumed_jobs:
+    logger.info("Resumed %d queued download jobs", resumed_jobs)
+
+
+def render_static_page(page):
+    """HTML of one page of the unfiltered homepage, exactly as index() renders it."""
+    with app.test_request_context('/'):
+        return render_template('index.html', songs=page['songs'], page=page)
+
+
+storage.init(CACHE_DB, DOWNLOADS_DIR, STORAGE_QUOTA_MB * 1024 * 1024,
+             fetch=refetch_audio, refetchable=refetchable_audio_files)
+reconcile.init(CACHE_DB, DOWNLOADS_DIR, THUMBNAILS_DIR, STREAMS_DIR)
+format_cache.init(CACHE_DB, resolve_formats, ttl_seconds=PRERESOLVE_TTL)
+
+if STATIC_HOMEPAGE:
+    # Settings the pages are rendered with: a restart that changes one rebuilds them
+    static_pages.init(PAGES_DIR, lambda: catalog.list_all_pages(PAGE_SIZE), render_static_page,
+                      Path(app.root_path) / app.template_folder,
+                      settings={'PAGE_SIZE': PAGE_SIZE,
+                                **{name: value for name, value in app.jinja_env.globals.items()
+                                   if isinstance(value, (str, int, float, bool))}})
+    catalog.add_change_listener(static_pages.schedule)
 
 
 # ============ PUBLIC ROUTES ============
 
+@app.template_filter('duration')
+def format_duration(seconds):
+    """3:07 / 1:02:45 for a duration in seconds."""
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+@app.template_filter('megabytes')
+def format_megabytes(size):
+    """File size in MB with one decimal."""
+    return f"{size / (1024 * 1024):.1f} MB"
+
+
+def stream_page(template_name, **context):
+    """Render a template as a streamed response, flushed in STREAM_CHUNK_SIZE chunks."""
+    def coalesce(chunks):
+        buffer = []
+        size = 0
+        try:
+            for chunk in chunks:
+                buffer.append(chunk)
+                size += len(chunk)
+                if size >= STREAM_CHUNK_SIZE:
+                    yield ''.join(buffer)
+                    buffer = []
+                    size = 0
+            if buffer:
+                yield ''.join(buffer)
+        finally:
+            # Pops the request context stream_template() pushed, now and not whenever chunks is collected
+            chunks.close()
+
+    return app.response_class(coalesce(stream_template(template_name, **context)), mimetype='text/html')
+
+
+def requested_page(limit=PAGE_SIZE):
+    """The catalog page selected by ?q= (local search) or the ?after= / ?before= id cursors."""
+    query = request.args.get('q', '').strip()
+    after = request.args.get('after', type=int)
+    before = request.args.get('before', type=int)
+    if query:
+        return dict(catalog.search_songs_page(query, after=after, before=before, limit=limit), query=query)
+
+    return catalog.list_songs_page(after=after, before=before, limit=limit)
+
+
+def static_page_key():
+    """Key of the pre-rendered page for this request's query string, or None if it has none."""
+    if not request.args:
+        return 'index'
+    if len(request.args) == 1:
+        for cursor in ('after', 'before'):
+            song_id = request.args.get(cursor, type=int)
+            if song_id is not None:
+                return f'{cursor}-{song_id}'
+    return None
+
+
+def serve_static_page(key):
+    """The pre-rendered page as a file response, or None if there is no up-to-date copy."""
+    generation = catalog.generation()
+    path, encoding = static_pages.find(key, generation, lambda name: request.accept_encodings[name] > 0)
+    if path is None:
+        if not static_pages.is_current(generation):
+            static_pages.schedule()
+        metrics.inc('static_page_lookups_total', result='miss')
+        return None
+    try:
+        response = send_cached_file(path, mimetype='text/html', cache_control=HOMEPAGE_CACHE_CONTROL)
+    except FileNotFoundError:
+        # A newer build replaced it after the lookup
+        return None
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    metrics.inc('static_page_lookups_total', result='hit')
+    return response
+
+
 @app.route('/')
 def index():
-    """Public homepage showing all songs."""
-    data = load_data()
-    return render_template('index.html', songs=data['songs'])
+    """Public homepage showing one page of songs, from the pre-rendered copy when it is current."""
+    key = static_page_key() if STATIC_HOMEPAGE else None
+    if key is not None:
+        response = serve_static_page(key)
+        if response is not None:
+            return response
+
+    page = requested_page()
+    return stream_page('index.html', songs=page['songs'], page=page)
+
+
+# Fields /api/songs can return; download_url and thumbnail_url are computed
+API_SONG_FIELDS = (
+    'id', 'display_name', 'youtube_url', 'video_id', 'created_at',
+    'thumbnail', 'thumbnail_2x', 'thumbnail_width', 'thumbnail_height', 'thumbnail_mime',
+    'duration', 'bitrate', 'codec', 'file_size', 'sha256',
+    'download_url', 'thumbnail_url',
+)
+API_DEFAULT_FIELDS = ('id', 'display_name', 'download_url', 'thumbnail_url')
+
+
+def api_song(song, fields):
+    """Project a catalog song onto the requested API fields."""
+    result = {}
+    for field in fields:
+        if field == 'download_url':
+            result[field] = url_for('download_song', song_id=song['id'])
+        elif field == 'thumbnail_url':
+            result[field] = url_for('serve_thumbnail', filename=song['thumbnail']) if song['thumbnail'] else None
+        else:
+            result[field] = song[field]
+    return result
+
+
+@app.route('/api/songs')
+def api_songs():
+    """JSON song listing with id cursors (?after= / ?before=), ?q= search, ?limit= and ?fields= selection."""
+    fields = API_DEFAULT_FIELDS
+    if request.args.get('fields'):
+        fields = tuple(field.strip() for field in request.args['fields'].split(',') if field.strip())
+        unknown = [field for field in fields if field not in API_SONG_FIELDS]
+        if unknown:
+            return jsonify({
+                'error': f"unknown fields: {', '.join(unknown)}",
+                'available_fields': API_SONG_FIELDS,
+            }), 400
+
+    limit = min(max(request.args.get('limit', PAGE_SIZE, type=int), 1), API_MAX_PAGE_SIZE)
+    page = requested_page(limit)
+
+    def page_url(**cursor):
+        return url_for('api_songs', limit=limit, fields=request.args.get('fields'), q=page.get('query'), **cursor)
+
+    return jsonify({
+        'songs': [api_song(song, fields) for song in page['songs']],
+        'total': page['total'],
+        'next_after': page['next_after'],
+        'prev_before': page['prev_before'],
+        'next': page_url(after=page['next_after']) if page['next_after'] is not None else None,
+        'prev': page_url(before=page['prev_before']) if page['prev_before'] is not None else None,
+    })
+
+
+def song_download_name(song, extension='.mp3'):
+    """The file name a phone saves a song under: its display name, not the storage name."""
+    name = re.sub(r'[\x00-\x1f\\/:*?"<>|]+', ' ', song['display_name'])
+    name = re.sub(r'\s+', ' ', name).strip() or song['video_id'] or 'song'
+    return f"{name}{extension}"
+
+
+def wants_original_audio(original_type):
+    """
+    Whether to serve a song's stored m4a/opus instead of an MP3.
+
+    ?format=original / ?format=mp3 decide explicitly; otherwise the Accept
+    header must prefer the original type over audio/mpeg. Clients sending
+    */* (most phones) get MP3.
+    """
+    requested = request.args.get('format')
+    if requested in ('original', 'mp3'):
+        return requested == 'original'
+    return request.accept_mimetypes.best_match(['audio/mpeg', original_type]) == original_type
+
+
+def admission_rejected(rejection):
+    """The 429/503 answer to a public file request that admission control turned away."""
+    if rejection.status == 429:
+        message = "יותר מדי בקשות, נסו שוב בעוד רגע"
+    else:
+        message = "השרת עמוס כרגע, נסו שוב בעוד רגע"
+    response = Response(message, status=rejection.status, mimetype='text/plain')
+    response.headers['Retry-After'] = str(rejection.retry_after)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+def is_range_continuation():
+    """
+    A Range request starting past the first byte: a player seeking in or
+    resuming a track it already started, not a new download.
+    """
+    byte_range = request.range
+    return (byte_range is not None and byte_range.units == 'bytes'
+            and len(byte_range.ranges) == 1 and byte_range.ranges[0][0] > 0)
+
+
+def admit_transfer(lane):
+    """
+    Run a large file request through admission control: the client's rate
+    limit (Range continuations of a file it was sent are free, see
+    admission.check_continuation), then a transfer slot. Returns
+    (release, None) - release frees the slot - or (None, rejection response).
+    """
+    try:
+        if is_range_continuation():
+            admission.check_continuation(request.remote_addr, lane, request.full_path, request.headers.get('If-Range'))
+        else:
+            admission.check_rate(request.remote_addr, lane)
+        return admission.acquire_transfer(lane), None
+    except admission.Rejected as e:
+        return None, admission_rejected(e)
+
+
+def remember_transfer(response, lane):
+    """Let the client resume a file it was admitted to in full with If-Range continuations."""
+    etag = response.headers.get('ETag')
+    if etag and response.status_code in (200, 206) and not is_range_continuation():
+        admission.remember_transfer(request.remote_addr, lane, request.full_path, etag)
+    return response
+
+
+def release_when_sent(response, release):
+    """Hold a transfer slot until a non-file response has been sent (file responses release it through on_close)."""
+    response = app.make_response(response)
+    if response.direct_passthrough:
+        return response
+    response.call_on_close(release)
+    return response
 
 
 @app.route('/download/<int:song_id>')
 def download_song(song_id):
     """Download a specific song as MP3."""
-    data = load_data()
+    release, rejected = admit_transfer('downloads')
+    if rejected:
+        return rejected
+    try:
+        return remember_transfer(release_when_sent(send_song_file(song_id, release), release), 'downloads')
+    except BaseException:
+        release()
+        raise
+
+
+def send_song_file(song_id, on_close):
+    """The response of download_song(); on_close goes to the file response."""
+    song = catalog.get_song(song_id)
 
-    if song_id >= len(data['songs']):
+    if song is None:
         return "שיר לא נמצא", 404
 
-    song = data['songs'][song_id]
     file_path = DOWNLOADS_DIR / song['filename']
 
     if not file_path.exists():
-        return "קובץ לא נמצא", 404
+        if not song['youtube_url']:
+            return "קובץ לא נמצא", 404
+        # Evicted to stay within STORAGE_QUOTA_MB - fetch it again in the background.
+        # A yt-dlp download can outlast the worker timeout and would hold a transfer slot.
+        queue_refetch(song)
+        response = Response("השיר נטען מחדש, נסו שוב בעוד חצי דקה", status=503, mimetype='text/plain')
+        response.headers['Retry-After'] = str(REFETCH_RETRY_AFTER)
+        response.headers['Cache-Control'] = 'no-store'
+        return response
+    storage.touch(song['filename'])
+
+    mimetype = transcode.audio_type(file_path)
+    negotiated = mimetype != 'audio/mpeg'
+    if negotiated and not wants_original_audio(mimetype):
+        try:
+            file_path = transcode.get_mp3(file_path)
+            mimetype = 'audio/mpeg'
+        except Exception as e:
+            logger.error("MP3 transcode failed, serving the original: %s", e, extra={'song_id': song_id})
 
-    return send_file(
+    response = send_cached_file(
         file_path,
-        as_attachment=True,
-        download_name=song['filename'],
-        mimetype='audio/mpeg'
+        mimetype=mimetype,
+        cache_control=AUDIO_CACHE_CONTROL,
+        download_name=song_download_name(song, file_path.suffix),
+        on_close=on_close
+    )
+    if negotiated and 'format' not in request.args:
+        response.vary.add('Accept')
+    return response
+
+
+@app.route('/download/zip')
+def download_zip():
+    """Download all songs, or the ?id= selection, as one ZIP built while it is sent."""
+    release, rejected = admit_transfer('downloads')
+    if rejected:
+        return rejected
+    try:
+        return remember_transfer(release_when_sent(send_zip(), release), 'downloads')
+    except BaseException:
+        release()
+        raise
+
+
+def send_zip():
+    """The response of download_zip()."""
+    song_ids = list(dict.fromkeys(request.args.getlist('id', type=int)))
+    if song_ids:
+        songs = [song for song in map(catalog.get_song, song_ids) if song is not None]
+    else:
+        songs = catalog.list_songs()
+    if not songs:
+        return "לא נבחרו שירים", 404
+
+    names = zip_export.unique_names(song_download_name(song, Path(song['filename']).suffix) for song in songs)
+    archive = zip_export.Archive(
+        (name, DOWNLOADS_DIR / song['filename'], song['created_at'] or 0)
+        for name, song in zip(names, songs)
     )
+    return send_generated(
+        archive.read, archive.size, archive.etag, archive.mtime,
+        mimetype='application/zip',
+        cache_control='no-cache',
+        download_name='שירים.zip'
+    )
+
+
+@app.route('/stream/<int:song_id>/<path:name>')
+def stream_file(song_id, name):
+    """HLS playlists and segments of a song's low-bitrate variants."""
+    song = catalog.get_song(song_id)
+    if song is None:
+        return "שיר לא נמצא", 404
+
+    resolved = streaming.file_path(STREAMS_DIR, song['filename'], name)
+    if resolved is None or not resolved[0].exists():
+        return "קובץ לא נמצא", 404
+
+    path, mimetype = resolved
+    return send_cached_file(path, mimetype=mimetype, cache_control=AUDIO_CACHE_CONTROL)
 
 
 @app.route('/thumbnails/<path:filename>')
 def serve_thumbnail(filename):
     """Serve thumbnail images from persistent storage."""
+    try:
+        admission.check_rate(request.remote_addr, 'thumbnails')
+    except admission.Rejected as e:
+        return admission_rejected(e)
+
     thumbnail_path = THUMBNAILS_DIR / filename
 
     if not thumbnail_path.exists():
         return "תמונה לא נמצאה", 404
 
-    return send_file(
-        thumbnail_path,
-        mimetype='image/jpeg'
-    )
+    if is_content_addressed(filename):
+        mimetype = mimetypes.guess_type(filename)[0] or 'image/jpeg'
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        # Legacy <video_id>.jpg files may really be WebP/PNG - check the bytes
+        with open(thumbnail_path, 'rb') as f:
+            mimetype = thumbnails.sniff_image_type(f.read(16))[0]
+        cache_control = THUMBNAIL_CACHE_CONTROL
+
+    return send_cached_file(thumbnail_path, mimetype=mimetype, cache_control=cache_control)
+
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics summed over all workers."""
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return "Unauthorized", 401
+
+    job_counts = jobs.count_by_status()
+    body = metrics.render(gauges=[
+        ('catalog_songs', 'Songs in the catalog', [({}, catalog.count_songs())]),
+        ('jobs', 'Background jobs by status', [({'status': status}, count) for status, count in job_counts.items()]),
+        ('transcode_cache_bytes', 'Size of the on-demand MP3 cache', [({}, transcode.stats()['bytes'])]),
+        ('downloads_bytes', 'Size of the stored audio files (see STORAGE_QUOTA_MB)', [({}, storage.stats()['bytes'])]),
+    ])
+    return Response(body, mimetype='text/plain; version=0.0.4')
 
 
 # ============ ADMIN ROUTES ============
@@ -298,8 +1301,12 @@ def admin_dashboard():
     if 'admin' not in session:
         return redirect(url_for('admin_login'))
 
-    data = load_data()
-    return render_template('admin_dashboard.html', songs=data['songs'])
+    page = requested_page()
+    return stream_page('admin_dashboard.html',
+                       songs=page['songs'],
+                       page=page,
+                       pending_jobs=jobs.list_jobs(jobs.PENDING_STATES),
+                       failed_jobs=jobs.list_recent_failures())
 
 
 @app.route('/admin/add-song', methods=['GET', 'POST'])
@@ -308,40 +1315,29 @@ def admin_add_song():
     if 'admin' not in session:
         return redirect(url_for('admin_login'))
 
-    if request.method == 'POST':
-        print("\n" + "="*80, flush=True)
-        print("SEARCH REQUEST STARTED", flush=True)
-        print("="*80, flush=True)
-
-        search_query = request.form.get('search_query', '').strip()
-
-        print(f"Search Query: {search_query}", flush=True)
+    # A GET with ?search_query= re-runs a search, e.g. after a failed download
+    if request.method == 'POST' or request.args.get('search_query'):
+        search_query = (request.form.get('search_query') or request.args.get('search_query', '')).strip()
 
         if not search_query:
-            print("ERROR: Missing search_query", flush=True)
             return render_template('admin_add_song.html', error='נא למלא שדה חיפוש')
 
         # Search YouTube
-        print("\n>>> CALLING search_youtube()...", flush=True)
-        import time
-        start_time = time.time()
         search_results = search_youtube(search_query)
-        elapsed_time = time.time() - start_time
-        print(f"<<< search_youtube() COMPLETED in {elapsed_time:.2f} seconds", flush=True)
-        print(f"Found {len(search_results)} results", flush=True)
 
         if not search_results:
-            print("ERROR: No search results found", flush=True)
+            logger.info("No YouTube results", extra={'query': search_query})
             return render_template('admin_add_song.html', error='לא נמצא שיר ביוטיוב')
 
+        # The admin usually picks one of the first results - get its download started early
+        if PRERESOLVE_RESULTS:
+            format_cache.schedule(search_results[:PRERESOLVE_RESULTS])
+
         # Show search results
         # For backward compatibility with the template, we'll pass the query as both song_name and artist_name
-        print("\n>>> Rendering search results page...", flush=True)
-        print("="*80, flush=True)
-        print("SEARCH REQUEST COMPLETED", flush=True)
-        print("="*80 + "\n", flush=True)
         return render_template('admin_search_results.html',
                              results=search_results,
+                             existing_songs=catalog.search_songs(search_query, limit=5),
                              song_name=search_query,
                              artist_name='')
 
@@ -351,99 +1347,123 @@ def admin_add_song():
 @app.route('/admin/ping', methods=['GET', 'POST'])
 def admin_ping():
     """Simple test endpoint to verify requests reach the server."""
-    print("!!! PING ENDPOINT HIT !!!", flush=True)
-    print(f"Method: {request.method}", flush=True)
-    print(f"Form data: {dict(request.form)}", flush=True)
+    logger.info("Ping", extra={'method': request.method, 'form': dict(request.form)})
     return jsonify({'status': 'ok', 'message': 'Server is reachable'})
 
 
+@app.route('/admin/catalog-cache')
+def admin_catalog_cache():
+    """Catalog read-cache hit/miss counters for the worker serving this request."""
+    if 'admin' not in session:
+        return redirect(url_for('admin_login'))
+
+    return jsonify(catalog.cache_stats())
+
+
 @app.route('/admin/download-song', methods=['POST'])
 def admin_download_song():
-    """Download selected song from YouTube."""
-    import sys
-    sys.stdout.flush()
-    sys.stderr.flush()
-    print("\n" + "="*80, flush=True)
-    print("!!! DOWNLOAD ROUTE HIT !!!", flush=True)
-    print("DOWNLOAD REQUEST STARTED", flush=True)
-    print(f"Request method: {request.method}", flush=True)
-    print(f"Request path: {request.path}", flush=True)
-    print(f"Request form keys: {list(request.form.keys())}", flush=True)
-    print("="*80, flush=True)
-
+    """Queue a download of the selected song from YouTube."""
     if 'admin' not in session:
-        print("ERROR: User not authenticated", flush=True)
         return redirect(url_for('admin_login'))
 
     youtube_url = request.form.get('youtube_url')
     youtube_title = request.form.get('youtube_title')
-    youtube_thumbnail = request.form.get('youtube_thumbnail')
     song_name = request.form.get('song_name', '')
     artist_name = request.form.get('artist_name', '')
 
     # Combine song_name and artist_name if both exist, otherwise use just song_name
     search_query = f"{song_name} {artist_name}".strip() if artist_name else song_name
 
-    print(f"Search Query: {search_query}", flush=True)
-    print(f"YouTube URL: {youtube_url}", flush=True)
-    print(f"YouTube Title: {youtube_title}", flush=True)
-
     if not youtube_url or not youtube_title:
-        print("ERROR: Missing youtube_url or youtube_title", flush=True)
+        logger.warning("Download request without youtube_url or youtube_title", extra={'form': list(request.form.keys())})
         return redirect(url_for('admin_add_song'))
 
-    # Generate filename from search query
-    safe_name = re.sub(r'[^\w\s-]', '', search_query)
-    safe_name = re.sub(r'[-\s]+', '-', safe_name)
-    filename = f"{safe_name}.mp3"
+    job_id = jobs.enqueue('download', {
+        'youtube_url': youtube_url,
+        'youtube_title': youtube_title,
+        'search_query': search_query,
+    })
 
-    # Generate thumbnail filename
-    video_id = youtube_url.split('watch?v=')[-1]
-    thumbnail_filename = f"{video_id}.jpg"
-    thumbnail_path = THUMBNAILS_DIR / thumbnail_filename
+    logger.info("Download queued as job %d", job_id, extra={'url': youtube_url, 'query': search_query})
 
-    print(f"Output filename: {filename}", flush=True)
-    print(f"Thumbnail filename: {thumbnail_filename}", flush=True)
-    print("\n>>> CALLING download_from_youtube()...", flush=True)
+    if request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json':
+        return jsonify({
+            'job_id': job_id,
+            'status_url': url_for('admin_job_status', job_id=job_id),
+        }), 202
 
-    # Download from YouTube
-    output_path = DOWNLOADS_DIR / filename
+    return redirect(url_for('admin_dashboard'))
 
-    import time
-    start_time = time.time()
-    success = download_from_youtube(youtube_url, output_path, thumbnail_path)
-    elapsed_time = time.time() - start_time
 
-    print(f"<<< download_from_youtube() COMPLETED in {elapsed_time:.2f} seconds", flush=True)
-    print(f"Success: {success}", flush=True)
+@app.route('/admin/bulk-import', methods=['GET', 'POST'])
+def admin_bulk_import():
+    """Import a YouTube playlist or a pasted list of URLs / search queries."""
+    if 'admin' not in session:
+        return redirect(url_for('admin_login'))
 
-    if not success:
-        print("ERROR: Download failed, re-rendering search results", flush=True)
-        search_results = search_youtube(search_query)
-        return render_template('admin_search_results.html',
-                             results=search_results,
-                             song_name=search_query,
-                             artist_name='',
-                             error='שגיאה בהורדה מיוטיוב. אולי צריך לעדכן cookies?')
-
-    print("\n>>> Adding song to database...", flush=True)
-    # Add to songs list
-    data = load_data()
-    data['songs'].append({
-        'display_name': youtube_title,
-        'filename': filename,
-        'youtube_url': youtube_url,
-        'thumbnail': thumbnail_filename if thumbnail_path.exists() else None
-    })
-    save_data(data)
-    print("<<< Song added to database successfully", flush=True)
+    if request.method == 'POST':
+        entries = [line.strip() for line in request.form.get('entries', '').splitlines() if line.strip()]
+        if not entries:
+            return render_template('admin_bulk_import.html', error='נא להדביק קישור לפלייליסט, קישורים או שמות שירים')
 
-    print("\n>>> Redirecting to admin dashboard...", flush=True)
-    print("="*80, flush=True)
-    print("DOWNLOAD REQUEST COMPLETED", flush=True)
-    print("="*80 + "\n", flush=True)
+        job_id = jobs.enqueue('bulk_import', {'entries': entries})
+        logger.info("Bulk import queued as job %d (%d entries)", job_id, len(entries))
+        return redirect(url_for('admin_bulk_import_report', job_id=job_id))
 
-    return redirect(url_for('admin_dashboard'))
+    return render_template('admin_bulk_import.html')
+
+
+@app.route('/admin/bulk-import/<int:job_id>')
+def admin_bulk_import_report(job_id):
+    """Progress and per-item report of a bulk import job."""
+    if 'admin' not in session:
+        return redirect(url_for('admin_login'))
+
+    job = jobs.get_job(job_id)
+    if job is None or job['kind'] != 'bulk_import':
+        return "ייבוא לא נמצא", 404
+
+    return render_template('admin_bulk_import_report.html', job=job)
+
+
+@app.route('/admin/storage', methods=['GET', 'POST'])
+def admin_storage():
+    """Check the stored files against the catalog and show the latest report."""
+    if 'admin' not in session:
+        return redirect(url_for('admin_login'))
+
+    if request.method == 'POST':
+        job_id = jobs.enqueue('reconcile', {
+            'repair': request.form.get('action') == 'repair',
+            'checksums': bool(request.form.get('checksums')),
+        })
+        logger.info("Storage check queued as job %d", job_id)
+        return redirect(url_for('admin_storage'))
+
+    latest = jobs.list_jobs(limit=1, kind='reconcile')
+    return render_template('admin_storage.html', job=latest[0] if latest else None)
+
+
+@app.route('/admin/jobs')
+def admin_jobs():
+    """Pending and recent download jobs as JSON."""
+    if 'admin' not in session:
+        return redirect(url_for('admin_login'))
+
+    return jsonify({'jobs': jobs.list_jobs()})
+
+
+@app.route('/admin/jobs/<int:job_id>')
+def admin_job_status(job_id):
+    """Status, progress and elapsed time of a single download job."""
+    if 'admin' not in session:
+        return redirect(url_for('admin_login'))
+
+    job = jobs.get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'job not found'}), 404
+
+    return jsonify(job)
 
 
 @app.route('/admin/song/<int:song_id>/edit', methods=['GET', 'POST'])
@@ -452,13 +1472,11 @@ def admin_edit_song(song_id):
     if 'admin' not in session:
         return redirect(url_for('admin_login'))
 
-    data = load_data()
+    song = catalog.get_song(song_id)
 
-    if song_id >= len(data['songs']):
+    if song is None:
         return "שיר לא נמצא", 404
 
-    song = data['songs'][song_id]
-
     if request.method == 'POST':
         new_name = request.form.get('display_name')
 
@@ -466,8 +1484,7 @@ def admin_edit_song(song_id):
             return render_template('admin_edit_song.html', song=song, song_id=song_id, error='נא למלא שם')
 
         # Update song name
-        data['songs'][song_id]['display_name'] = new_name
-        save_data(data)
+        catalog.update_song(song_id, display_name=new_name)
 
         return redirect(url_for('admin_dashboard'))
 
@@ -480,21 +1497,20 @@ def admin_delete_song(song_id):
     if 'admin' not in session:
         return redirect(url_for('admin_login'))
 
-    data = load_data()
+    song = catalog.delete_song(song_id)
 
-    if song_id >= len(data['songs']):
+    if song is None:
         return "שיר לא נמצא", 404
 
-    song = data['songs'][song_id]
-
-    # Delete file
-    file_path = DOWNLOADS_DIR / song['filename']
-    if file_path.exists():
-        file_path.unlink()
-
-    # Remove from data
-    data['songs'].pop(song_id)
-    save_data(data)
+    # Remove files only when no other song (same video added twice) still uses them
+    for column, name in song['orphaned_files'].items():
+        directory = DOWNLOADS_DIR if column == 'filename' else THUMBNAILS_DIR
+        (directory / name).unlink(missing_ok=True)
+        if column == 'filename':
+            transcode.discard(name)
+            streaming.remove(STREAMS_DIR, name)
+            zip_export.forget(DOWNLOADS_DIR / name)
+        logger.info("Removed unreferenced file %s", name, extra={'song_id': song_id})
 
     return redirect(url_for('admin_dashboard'))
 
@@ -505,6 +1521,9 @@ def admin_cookies():
     if 'admin' not in session:
         return redirect(url_for('admin_login'))
 
+    def render_cookies_page(**kwargs):
+        return render_template('admin_cookies.html', strategy_stats=download_strategies.stats(), **kwargs)
+
     current_cookies = None
     cookies_exist = COOKIES_FILE.exists()
 
@@ -515,7 +1534,7 @@ def admin_cookies():
             if len(current_cookies) > 500:
                 current_cookies = current_cookies[:500] + '\n... (truncated)'
         except Exception as e:
-            print(f"Error reading cookies.txt: {e}", flush=True)
+            logger.warning("Error reading cookies.txt: %s", e)
 
     if request.method == 'POST':
         action = request.form.get('action')
@@ -524,53 +1543,48 @@ def admin_cookies():
             cookies_content = request.form.get('cookies_content', '').strip()
 
             if not cookies_content:
-                return render_template('admin_cookies.html',
-                                     error='תוכן ה-cookies ריק',
-                                     current_cookies=current_cookies,
-                                     cookies_exist=cookies_exist)
+                return render_cookies_page(error='תוכן ה-cookies ריק',
+                                           current_cookies=current_cookies,
+                                           cookies_exist=cookies_exist)
 
             # Basic validation - check if it looks like Netscape cookie format
             lines = [line.strip() for line in cookies_content.split('\n') if line.strip()]
             if not any(line.startswith('#') or '\t' in line for line in lines):
-                return render_template('admin_cookies.html',
-                                     error='הפורמט של ה-cookies נראה לא תקין. צריך להיות בפורמט Netscape',
-                                     current_cookies=current_cookies,
-                                     cookies_exist=cookies_exist)
+                return render_cookies_page(error='הפורמט של ה-cookies נראה לא תקין. צריך להיות בפורמט Netscape',
+                                           current_cookies=current_cookies,
+                                           cookies_exist=cookies_exist)
 
             # Save cookies.txt
             try:
                 COOKIES_FILE.write_text(cookies_content)
-                print(f"✓ cookies.txt updated successfully ({len(cookies_content)} bytes)", flush=True)
-                return render_template('admin_cookies.html',
-                                     success='קובץ cookies.txt עודכן בהצלחה!',
-                                     current_cookies=cookies_content[:500] + '\n... (truncated)' if len(cookies_content) > 500 else cookies_content,
-                                     cookies_exist=True)
+                download_strategies.reset()
+                logger.info("cookies.txt updated (%d bytes)", len(cookies_content))
+                return render_cookies_page(success='קובץ cookies.txt עודכן בהצלחה!',
+                                           current_cookies=cookies_content[:500] + '\n... (truncated)' if len(cookies_content) > 500 else cookies_content,
+                                           cookies_exist=True)
             except Exception as e:
-                print(f"Error writing cookies.txt: {e}", flush=True)
-                return render_template('admin_cookies.html',
-                                     error=f'שגיאה בשמירת הקובץ: {str(e)}',
-                                     current_cookies=current_cookies,
-                                     cookies_exist=cookies_exist)
+                logger.error("Error writing cookies.txt: %s", e)
+                return render_cookies_page(error=f'שגיאה בשמירת הקובץ: {str(e)}',
+                                           current_cookies=current_cookies,
+                                           cookies_exist=cookies_exist)
 
         elif action == 'delete':
             if COOKIES_FILE.exists():
                 try:
                     COOKIES_FILE.unlink()
-                    print("✓ cookies.txt deleted", flush=True)
-                    return render_template('admin_cookies.html',
-                                         success='קובץ cookies.txt נמחק בהצלחה',
-                                         current_cookies=None,
-                                         cookies_exist=False)
+                    download_strategies.reset()
+                    logger.info("cookies.txt deleted")
+                    return render_cookies_page(success='קובץ cookies.txt נמחק בהצלחה',
+                                               current_cookies=None,
+                                               cookies_exist=False)
                 except Exception as e:
-                    print(f"Error deleting cookies.txt: {e}", flush=True)
-                    return render_template('admin_cookies.html',
-                                         error=f'שגיאה במחיקת הקובץ: {str(e)}',
-                                         current_cookies=current_cookies,
-                                         cookies_exist=cookies_exist)
-
-    return render_template('admin_cookies.html',
-                         current_cookies=current_cookies,
-                         cookies_exist=cookies_exist)
+                    logger.error("Error deleting cookies.txt: %s", e)
+                    return render_cookies_page(error=f'שגיאה במחיקת הקובץ: {str(e)}',
+                                               current_cookies=current_cookies,
+                                               cookies_exist=cookies_exist)
+
+    return render_cookies_page(current_cookies=current_cookies,
+                               cookies_exist=cookies_exist)
 
 
 if __name__ == '__main__':
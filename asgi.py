@@ -0,0 +1,247 @@
+"""
+ASGI entry point: many concurrent downloads from a single process.
+
+Under gunicorn's sync workers every /download/<id> holds a worker for the
+whole transfer, so a handful of slow phones can block the site. Here the
+Flask app runs unchanged in a thread pool, but file responses (MP3s,
+stream segments, thumbnails - everything send_cached_file() returns) are
+handed back to the event loop and sent from there:
+
+- the view runs in a worker thread only until the response headers are
+  ready; the transfer itself holds no thread
+- file chunks are read in the loop's default executor and sent with
+  await, so a client that reads slowly is given the next chunk only
+  when it has taken the previous one (ASYNC_CHUNK_KB per connection,
+  plus the server's socket buffer)
+- a client that accepts nothing for ASYNC_SEND_TIMEOUT seconds is
+  dropped, and a disconnect stops the transfer
+
+Other responses (pages, JSON, admin) are streamed from their worker
+thread with the same backpressure.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --limit-concurrency 4000
+"""
+
+import asyncio
+import io
+import logging
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+# Transfers here hold no thread, so the sync-worker transfer cap (admission.py)
+# would only bring back the download limit this server removes
+os.environ.setdefault('MAX_CONCURRENT_TRANSFERS', '0')
+
+from app import app as flask_app  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+# Threads running Flask views (page renders, admin requests, file lookups)
+ASYNC_THREADS = int(os.getenv('ASYNC_THREADS', '16'))
+
+# Bytes read from disk and queued per connection at a time
+ASYNC_CHUNK_BYTES = int(os.getenv('ASYNC_CHUNK_KB', '64')) * 1024
+
+# Drop clients that accept no data for this long
+ASYNC_SEND_TIMEOUT = float(os.getenv('ASYNC_SEND_TIMEOUT', '60'))
+
+# Request bodies are small forms (and cookies.txt uploads)
+MAX_BODY_BYTES = 16 * 1024 * 1024
+
+SERVER_SOFTWARE = 'dumb-music-player-asgi'
+
+_executor = ThreadPoolExecutor(max_workers=ASYNC_THREADS, thread_name_prefix='asgi')
+
+
+class FileTransfer:
+    """
+    wsgi.file_wrapper for this server: marks a response body as an open file
+    to be sent by the event loop. The file is positioned at the start of the
+    body, and exactly Content-Length bytes are sent.
+    """
+
+    def __init__(self, filelike, block_size=None):
+        self.filelike = filelike
+        # The server's chunk size, not the app's hint
+        self.block_size = ASYNC_CHUNK_BYTES
+
+    def __iter__(self):
+        # Only used if something wraps the response and iterates it in a thread
+        while True:
+            chunk = self.filelike.read(self.block_size)
+            if not chunk:
+                break
+            yield chunk
+
+    def close(self):
+        self.filelike.close()
+
+
+def _wsgi_string(value):
+    # PEP 3333: native strings holding the request's bytes as latin-1
+    return value.encode('utf-8').decode('latin-1')
+
+
+def build_environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope."""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': _wsgi_string(scope.get('root_path', '')),
+        'PATH_INFO': _wsgi_string(scope['path']),
+        'QUERY_STRING': scope['query_string'].decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'SERVER_SOFTWARE': SERVER_SOFTWARE,
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        'wsgi.file_wrapper': FileTransfer,
+    }
+    for raw_name, raw_value in scope['headers']:
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = name
+        else:
+            key = f'HTTP_{name}'
+        if key in environ:
+            value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value
+        environ[key] = value
+    return environ
+
+
+async def read_body(receive):
+    """The whole request body, or None if it is larger than MAX_BODY_BYTES."""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return b''
+        chunk = message.get('body', b'')
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            return None
+        chunks.append(chunk)
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+def _response_start(status, headers):
+    return {
+        'type': 'http.response.start',
+        'status': int(status.split(' ', 1)[0]),
+        'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+    }
+
+
+def _call_flask(environ, send, loop):
+    """
+    Run the Flask app in a worker thread. A file body is returned to the
+    caller together with the response start; any other body is sent from
+    here, waiting for each chunk to be taken.
+    """
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['message'] = _response_start(status, headers)
+        started['length'] = next((int(value) for name, value in headers
+                                  if name.lower() == 'content-length'), None)
+
+    def send_sync(message):
+        asyncio.run_coroutine_threadsafe(
+            asyncio.wait_for(send(message), ASYNC_SEND_TIMEOUT), loop
+        ).result()
+
+    result = flask_app(environ, start_response)
+    if isinstance(result, FileTransfer):
+        return started, result
+
+    try:
+        send_sync(started['message'])
+        for chunk in result:
+            if chunk:
+                send_sync({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        send_sync({'type': 'http.response.body', 'body': b''})
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return started, None
+
+
+async def send_file(transfer, length, send, disconnected):
+    """Send length bytes (to EOF if None) of an open file, one chunk at a time."""
+    loop = asyncio.get_running_loop()
+    remaining = length
+    try:
+        while not disconnected.is_set():
+            size = transfer.block_size if remaining is None else min(transfer.block_size, remaining)
+            chunk = await loop.run_in_executor(None, transfer.filelike.read, size) if size else b''
+            if remaining is not None:
+                remaining -= len(chunk)
+            done = not chunk or remaining == 0
+            await asyncio.wait_for(
+                send({'type': 'http.response.body', 'body': chunk, 'more_body': not done}),
+                ASYNC_SEND_TIMEOUT,
+            )
+            if done:
+                break
+    except asyncio.TimeoutError:
+        logger.info("Dropped a client that accepted no data for %.0fs", ASYNC_SEND_TIMEOUT,
+                    extra={'remaining_bytes': remaining})
+    finally:
+        transfer.close()
+
+
+async def _watch_disconnect(receive, disconnected):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            disconnected.set()
+            return
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI application serving the Flask app."""
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    body = await read_body(receive)
+    if body is None:
+        await send(_response_start('413 Payload Too Large', [('Content-Length', '0')]))
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    loop = asyncio.get_running_loop()
+    environ = build_environ(scope, body)
+    started, transfer = await loop.run_in_executor(_executor, _call_flask, environ, send, loop)
+    if transfer is None:
+        return
+
+    disconnected = asyncio.Event()
+    watcher = asyncio.ensure_future(_watch_disconnect(receive, disconnected))
+    try:
+        await send(started['message'])
+        await send_file(transfer, started['length'], send, disconnected)
+    finally:
+        watcher.cancel()
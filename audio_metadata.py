@@ -0,0 +1,125 @@
+"""
+Audio metadata, read and written once when a file is stored.
+
+The catalog used to know only a song's names, so showing its duration or
+size meant probing the file on every request, and the MP3s went out with
+whatever tags YouTube's stream had. Every stored audio file now goes
+through one pass that:
+
+- writes ID3 tags into MP3s: the song's title and its thumbnail as cover
+  art (ffmpeg remux, the audio itself is copied untouched). m4a/opus files
+  are not tagged
+- reads duration, bitrate and codec with ffprobe
+- records the final size and SHA-256 of the file
+
+extract() returns these as catalog fields (FIELDS), stored with the song,
+so pages and /api/songs show them without touching the disk.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import time
+from pathlib import Path
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Catalog fields filled by extract()
+FIELDS = ('duration', 'bitrate', 'codec', 'file_size', 'sha256')
+
+# Cover art formats ID3 players understand
+COVER_TYPES = ('.jpg', '.png')
+
+TIMEOUT_SECONDS = 120
+
+
+def probe(path):
+    """Duration (seconds), bitrate (bits/s) and codec of an audio file. Raises RuntimeError if ffprobe fails."""
+    try:
+        result = subprocess.run(
+            ['ffprobe', '-v', 'error', '-select_streams', 'a:0',
+             '-show_entries', 'format=duration,bit_rate:stream=codec_name', '-of', 'json', str(path)],
+            capture_output=True, text=True, timeout=TIMEOUT_SECONDS,
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        raise RuntimeError(f"ffprobe failed: {e}")
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe failed: {result.stderr.strip()[-500:]}")
+
+    info = json.loads(result.stdout or '{}')
+    fmt = info.get('format', {})
+    streams = info.get('streams') or [{}]
+    duration = fmt.get('duration')
+    bitrate = fmt.get('bit_rate')
+    return {
+        'duration': round(float(duration), 2) if duration not in (None, 'N/A') else None,
+        'bitrate': int(bitrate) if bitrate not in (None, 'N/A') else None,
+        'codec': streams[0].get('codec_name'),
+    }
+
+
+def write_tags(path, title, cover_path=None):
+    """
+    Set the ID3 title (and cover art, if given) of an MP3 in place. The
+    tagged copy is written next to it and replaces it atomically. Raises
+    RuntimeError if ffmpeg fails.
+    """
+    path = Path(path)
+    # Same prefix as the file: ingest's leftover cleanup also catches it
+    target = path.with_name(f"{path.name}.tags")
+    command = ['ffmpeg', '-nostdin', '-loglevel', 'error', '-y', '-i', str(path)]
+    if cover_path:
+        command += ['-i', str(cover_path), '-map', '0:a', '-map', '1:0',
+                    '-metadata:s:v', 'title=Album cover', '-metadata:s:v', 'comment=Cover (front)',
+                    '-disposition:v', 'attached_pic']
+    else:
+        command += ['-map', '0:a']
+    command += ['-c', 'copy', '-id3v2_version', '3', '-metadata', f'title={title}', '-f', 'mp3', str(target)]
+
+    start = time.perf_counter()
+    try:
+        try:
+            result = subprocess.run(command, capture_output=True, text=True, timeout=TIMEOUT_SECONDS)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            raise RuntimeError(f"ffmpeg failed: {e}")
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed: {result.stderr.strip()[-500:]}")
+        os.replace(target, path)
+    finally:
+        target.unlink(missing_ok=True)
+    metrics.observe('ffmpeg_duration_seconds', time.perf_counter() - start, postprocessor='ID3Tags')
+
+
+def file_sha256(path):
+    """Hex SHA-256 of a file, read in 1 MB blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def extract(path, title=None, cover_path=None):
+    """
+    Tag an MP3 (when a title is given) and return its catalog FIELDS.
+    Cover art that is not a JPEG or PNG is skipped. Tagging problems are
+    logged and the file is kept as it was; raises RuntimeError only if
+    the file cannot be probed.
+    """
+    path = Path(path)
+    if title and path.suffix.lower() == '.mp3':
+        if cover_path and (Path(cover_path).suffix.lower() not in COVER_TYPES or not Path(cover_path).exists()):
+            cover_path = None
+        try:
+            write_tags(path, title, cover_path)
+        except RuntimeError as e:
+            logger.warning("Could not tag %s: %s", path.name, e)
+
+    fields = probe(path)
+    fields['file_size'] = path.stat().st_size
+    fields['sha256'] = file_sha256(path)
+    return fields
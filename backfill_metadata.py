@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Backfill script: tag the MP3s of songs added before ingest-time metadata
+(title and cover art) and record their duration, bitrate, codec, size and
+checksum in the catalog. Run this on Render via Shell once after deploying.
+It is safe to re-run - songs that already have metadata are skipped.
+"""
+
+import argparse
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import audio_metadata
+import catalog
+
+
+def backfill_metadata(workers, batch_size):
+    persistent_dir = Path(os.getenv('PERSISTENT_DATA_PATH', 'persistent_data'))
+    downloads_dir = persistent_dir / 'downloads'
+    thumbnails_dir = persistent_dir / 'thumbnails'
+    catalog.init_db(persistent_dir / 'catalog.db')
+
+    # Songs of the same video share one audio file: tag it once, with the first song's name
+    pending = {}
+    for song in catalog.list_songs():
+        if song['sha256'] is None and song['filename'] not in pending:
+            pending[song['filename']] = song
+    if not pending:
+        print("✓ All songs already have metadata - nothing to do")
+        return
+
+    print(f"Reading metadata of {len(pending)} audio files with {workers} workers...")
+
+    def describe(song):
+        source = downloads_dir / song['filename']
+        if not source.exists():
+            return song['filename'], None, 'file missing'
+        cover = song['thumbnail_2x'] or song['thumbnail']
+        try:
+            fields = audio_metadata.extract(source, song['display_name'], thumbnails_dir / cover if cover else None)
+            return song['filename'], fields, None
+        except Exception as e:
+            return song['filename'], None, str(e)
+
+    batch = []
+    done = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for filename, fields, error in pool.map(describe, pending.values()):
+            if error:
+                print(f"✗ {filename}: {error}")
+                continue
+            batch.append((filename, fields))
+            if len(batch) >= batch_size:
+                catalog.update_files(batch)
+                done += len(batch)
+                batch = []
+    if batch:
+        catalog.update_files(batch)
+        done += len(batch)
+    print(f"✓ Recorded metadata of {done} audio files")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4, help='files processed in parallel (default 4)')
+    parser.add_argument('--batch-size', type=int, default=50, help='songs written per catalog transaction (default 50)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    backfill_metadata(args.workers, args.batch_size)
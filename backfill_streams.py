@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Backfill script: build the low-bitrate HLS variants of songs added before
+streaming playback existed, and mark them as streamable in the catalog.
+Run this on Render via Shell once after deploying streaming playback.
+It is safe to re-run - songs that already have variants are skipped.
+"""
+
+import argparse
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import catalog
+import streaming
+
+
+def backfill_streams(workers):
+    persistent_dir = Path(os.getenv('PERSISTENT_DATA_PATH', 'persistent_data'))
+    downloads_dir = persistent_dir / 'downloads'
+    streams_dir = persistent_dir / 'streams'
+    catalog.init_db(persistent_dir / 'catalog.db')
+
+    # Songs of the same video share one audio file and one set of variants
+    pending = sorted({song['filename'] for song in catalog.list_songs() if not song['has_stream']})
+    if not pending:
+        print("✓ All songs already have streaming variants - nothing to do")
+        return
+
+    print(f"Building streaming variants for {len(pending)} audio files with {workers} workers...")
+
+    def build(filename):
+        source = downloads_dir / filename
+        if not source.exists():
+            return filename, 'file missing'
+        try:
+            streaming.generate(source, streams_dir)
+            return filename, None
+        except Exception as e:
+            return filename, str(e)
+
+    built = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for filename, error in pool.map(build, pending):
+            if error:
+                print(f"✗ {filename}: {error}")
+                continue
+            catalog.update_songs_with_file(filename, has_stream=1)
+            built += 1
+    print(f"✓ Built streaming variants for {built} audio files")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=2, help='parallel ffmpeg encodes (default 2)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    backfill_streams(args.workers)
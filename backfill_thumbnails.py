@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Backfill script: convert existing thumbnails to the small content-addressed
+1x/2x JPEG variants and record their size and type in the catalog.
+Run this on Render via Shell once after deploying the thumbnail pipeline.
+It is safe to re-run - songs that were already converted are skipped.
+"""
+
+import argparse
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import catalog
+import thumbnails
+
+
+def backfill_thumbnails(workers):
+    persistent_dir = Path(os.getenv('PERSISTENT_DATA_PATH', 'persistent_data'))
+    thumbnails_dir = persistent_dir / 'thumbnails'
+    catalog.init_db(persistent_dir / 'catalog.db')
+
+    pending = [song for song in catalog.list_songs()
+               if song['thumbnail'] and not song['thumbnail_mime']]
+    if not pending:
+        print("✓ All thumbnails are already converted - nothing to do")
+        return
+
+    print(f"Converting {len(pending)} thumbnails with {workers} workers...")
+
+    def convert(song):
+        source = thumbnails_dir / song['thumbnail']
+        if not source.exists():
+            return song, None, 'file missing'
+        try:
+            return song, thumbnails.ingest(source, thumbnails_dir), None
+        except Exception as e:
+            return song, None, str(e)
+
+    updates = {}
+    old_files = set()
+    saved_bytes = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for song, fields, error in pool.map(convert, pending):
+            if error:
+                print(f"✗ Song {song['id']} ({song['display_name']}): {error}")
+                continue
+            old_file = thumbnails_dir / song['thumbnail']
+            new_file = thumbnails_dir / fields['thumbnail']
+            saved_bytes += old_file.stat().st_size - new_file.stat().st_size
+            updates[song['id']] = fields
+            if fields['thumbnail'] != song['thumbnail']:
+                old_files.add(song['thumbnail'])
+
+    # One catalog write for the whole batch
+    catalog.update_songs(updates)
+    print(f"✓ Converted {len(updates)} thumbnails ({saved_bytes / 1024:.0f} KB smaller at 1x)")
+
+    # Remove originals that no song references any more
+    still_used = set()
+    for song in catalog.list_songs():
+        still_used.update(name for name in (song['thumbnail'], song['thumbnail_2x']) if name)
+    removed = 0
+    for name in old_files - still_used:
+        (thumbnails_dir / name).unlink(missing_ok=True)
+        removed += 1
+    print(f"✓ Removed {removed} original thumbnail files")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4, help='parallel conversions (default 4)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    backfill_thumbnails(args.workers)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Benchmark homepage latency while one client bulk-downloads MP3s, with and
+without admission control.
+
+Generates a catalog (generate_catalog.py) and starts the app under
+gunicorn (--workers sync workers) twice:
+
+- off: no rate limits and no transfer cap
+- on: the default limits (RATE_LIMIT_*, MAX_CONCURRENT_TRANSFERS,
+  TRANSFER_QUEUE_*)
+
+In each mode --bulk-clients threads from one IP download MP3s back to back
+at --client-kbps each, retrying at once when they are turned away (a
+script that ignores Retry-After). Meanwhile a probe from another IP loads
+/ and a thumbnail every --probe-interval seconds. The JSON report has the
+probe latency p50/p95/max and failures, and the bulk client's answers by
+status code with the bytes it got per second.
+
+    python benchmarks/bench_admission.py --bulk-clients 8 --duration 20
+"""
+
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(REPO_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+
+import generate_catalog  # noqa: E402
+from bench_slow_clients import wait_until_up  # noqa: E402
+
+BULK_IP = '203.0.113.7'
+PROBE_IP = '198.51.100.1'
+
+READ_SIZE = 16 * 1024
+
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000, 1)
+
+
+def get(port, path, ip, timeout, rate=None):
+    """GET a path as client ip, reading the body at rate bytes/s. Returns (status, bytes read)."""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    try:
+        conn.request('GET', path, headers={'X-Forwarded-For': ip})
+        response = conn.getresponse()
+        size = 0
+        start = time.perf_counter()
+        while True:
+            chunk = response.read(READ_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if rate:
+                ahead = size / rate - (time.perf_counter() - start)
+                if ahead > 0:
+                    time.sleep(ahead)
+        return response.status, size
+    finally:
+        conn.close()
+
+
+def bulk_client(args, port, deadline, stats, lock, index):
+    song_id = index
+    while time.monotonic() < deadline:
+        song_id = song_id % args.songs + 1
+        try:
+            status, size = get(port, f'/download/{song_id}', BULK_IP, timeout=30, rate=args.client_kbps * 1024)
+        except OSError:
+            status, size = 'error', 0
+        with lock:
+            stats['statuses'][str(status)] = stats['statuses'].get(str(status), 0) + 1
+            stats['bytes'] += size
+        if status != 200:
+            time.sleep(0.1)
+
+
+def probe(args, port, deadline, latencies, failures):
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        try:
+            for path in ('/', f'/thumbnails/{args.thumbnail}'):
+                status, _ = get(port, path, PROBE_IP, timeout=args.probe_timeout)
+                if status >= 500 or status == 429:
+                    raise OSError(f'{path}: {status}')
+            latencies.append(time.perf_counter() - start)
+        except OSError:
+            failures.append(time.perf_counter() - start)
+        time.sleep(args.probe_interval)
+
+
+def run_mode(mode, args, data_dir, port):
+    env = dict(os.environ, PERSISTENT_DATA_PATH=str(data_dir), LOG_LEVEL='ERROR',
+               PYTHONPATH=os.pathsep.join([str(BENCH_DIR / 'fake_yt_dlp'), str(REPO_DIR)]))
+    if mode == 'off':
+        env.update(RATE_LIMIT_DOWNLOADS_PER_MINUTE='0', RATE_LIMIT_THUMBNAILS_PER_MINUTE='0',
+                   MAX_CONCURRENT_TRANSFERS='0')
+    command = [sys.executable, '-m', 'gunicorn', '--workers', str(args.workers), '--timeout', '120',
+               '--bind', f'127.0.0.1:{port}', 'app:app']
+    process = subprocess.Popen(command, cwd=REPO_DIR, env=env)
+    try:
+        wait_until_up(process, port)
+        time.sleep(1)
+        deadline = time.monotonic() + args.duration
+        stats, lock = {'statuses': {}, 'bytes': 0}, threading.Lock()
+        latencies, failures = [], []
+        threads = [threading.Thread(target=bulk_client, args=(args, port, deadline, stats, lock, index))
+                   for index in range(args.bulk_clients)]
+        threads.append(threading.Thread(target=probe, args=(args, port, deadline, latencies, failures)))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return {
+            'probe_p50_ms': percentile(latencies, 50),
+            'probe_p95_ms': percentile(latencies, 95),
+            'probe_max_ms': percentile(latencies, 100),
+            'probe_failures': len(failures),
+            'bulk_statuses': stats['statuses'],
+            'bulk_kbps': round(stats['bytes'] / 1024 / args.duration),
+        }
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--bulk-clients', type=int, default=8, help='parallel downloads of the bulk client (default 8)')
+    parser.add_argument('--client-kbps', type=int, default=256, help='download rate per connection in KB/s (default 256)')
+    parser.add_argument('--duration', type=float, default=20, help='seconds per mode (default 20)')
+    parser.add_argument('--probe-interval', type=float, default=0.5, help='seconds between probes (default 0.5)')
+    parser.add_argument('--probe-timeout', type=float, default=10,
+                        help='a probe that waits longer counts as failed (default 10)')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn sync workers (default 4)')
+    parser.add_argument('--songs', type=int, default=200, help='catalog size (default 200)')
+    parser.add_argument('--mp3-bytes', type=int, default=4 * 1024 * 1024, help='MP3 size (default 4 MB)')
+    parser.add_argument('--port', type=int, default=8767)
+    args = parser.parse_args()
+
+    report = {'config': vars(args), 'modes': {}}
+    with tempfile.TemporaryDirectory(prefix='bench-admission-') as tmp:
+        generate_catalog.generate(tmp, args.songs, args.mp3_bytes, thumbnail_count=10)
+        args.thumbnail = sorted(os.listdir(Path(tmp) / 'thumbnails'))[0]
+        for mode in ('off', 'on'):
+            report['modes'][mode] = run_mode(mode, args, tmp, args.port)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
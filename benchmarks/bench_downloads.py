@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+Benchmark download_from_youtube() transfers: resume, fragment concurrency
+and the shared bandwidth budget.
+
+Runs the app in-process with the real yt-dlp against fake_media_server.py
+(ffmpeg must be on PATH) and reports as JSON:
+
+- resume: the progressive file's first connection is cut after
+  --drop-fraction of it and the attempt fails (DOWNLOAD_RETRIES=0). The
+  retry downloads to a new temporary name (what ingest did before) or to
+  the same one (download_slot()); bytes the server sent for each
+- fragments: time to download the DASH format with
+  DOWNLOAD_FRAGMENT_CONCURRENCY=1 and =--fragment-concurrency
+- bandwidth: --parallel simultaneous downloads without a budget and with
+  DOWNLOAD_BANDWIDTH_KBPS=--budget-kbps; combined KB/s
+
+    python benchmarks/bench_downloads.py --seconds 120 --budget-kbps 1024
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(REPO_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+
+import fake_media_server  # noqa: E402
+
+
+def server_bytes(server):
+    # The handler counts a response after its last write; let it finish
+    time.sleep(0.2)
+    with urllib.request.urlopen(server.url('/stats')) as response:
+        return sum(json.load(response)['bytes_sent'].values())
+
+
+def download(app, url, output_path):
+    start = time.perf_counter()
+    audio_path = app.download_from_youtube(url, output_path, audio_format='original')
+    return audio_path, time.perf_counter() - start
+
+
+def bench_resume(app, server, work_dir, drop_fraction):
+    size = (server.media_dir / 'audio.m4a').stat().st_size
+    server.drop_paths = {'/audio.m4a'}
+    server.drop_after = int(size * drop_fraction)
+    app.DOWNLOAD_RETRIES = 0
+    report = {'file_bytes': size}
+    for mode in ('new-name', 'same-name'):
+        server.reset()
+        first_path = work_dir / f'.{uuid.uuid4().hex}.mp3'
+        failed, _ = download(app, server.url('/audio.m4a'), first_path)
+        assert failed is None, 'the first attempt should have been cut off'
+        first_bytes = server_bytes(server)
+        retry_path = first_path if mode == 'same-name' else work_dir / f'.{uuid.uuid4().hex}.mp3'
+        audio_path, seconds = download(app, server.url('/audio.m4a'), retry_path)
+        assert audio_path is not None, 'the retry failed'
+        report[mode] = {'retry_bytes': server_bytes(server) - first_bytes, 'retry_seconds': round(seconds, 2)}
+    server.drop_paths = set()
+    server.reset()
+    app.DOWNLOAD_RETRIES = 10
+    return report
+
+
+def bench_fragments(app, server, work_dir, concurrency):
+    report = {}
+    for degree in (1, concurrency):
+        app.DOWNLOAD_FRAGMENT_CONCURRENCY = degree
+        audio_path, seconds = download(app, server.url('/dash/manifest.mpd'), work_dir / f'.{uuid.uuid4().hex}.mp3')
+        assert audio_path is not None, 'DASH download failed'
+        report[f'concurrency_{degree}_seconds'] = round(seconds, 2)
+    return report
+
+
+def bench_bandwidth(app, server, work_dir, parallel, budget_kbps):
+    report = {'budget_kbps': budget_kbps}
+    for mode, kbps in (('unlimited', 0), ('budget', budget_kbps)):
+        app.DOWNLOAD_BANDWIDTH_KBPS = kbps
+        server.reset()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=parallel) as pool:
+            results = list(pool.map(
+                lambda _: download(app, server.url('/audio.m4a'), work_dir / f'.{uuid.uuid4().hex}.mp3'),
+                range(parallel)))
+        elapsed = time.perf_counter() - start
+        assert all(audio_path for audio_path, _ in results), 'a parallel download failed'
+        report[mode] = {'seconds': round(elapsed, 2),
+                        'combined_kbps': round(server_bytes(server) / 1024 / elapsed)}
+    app.DOWNLOAD_BANDWIDTH_KBPS = 0
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seconds', type=int, default=120, help='length of the served audio (default 120)')
+    parser.add_argument('--server-kbps', type=int, default=512,
+                        help='send rate per connection of the media server in KB/s (default 512)')
+    parser.add_argument('--latency', type=float, default=0.2, help='media server latency per request (default 0.2)')
+    parser.add_argument('--drop-fraction', type=float, default=0.6,
+                        help='part of the file sent before the connection is cut (default 0.6)')
+    parser.add_argument('--fragment-concurrency', type=int, default=4, help='parallel fragments (default 4)')
+    parser.add_argument('--parallel', type=int, default=3, help='simultaneous downloads (default 3)')
+    parser.add_argument('--budget-kbps', type=int, default=1024, help='shared bandwidth budget (default 1024)')
+    args = parser.parse_args()
+
+    server = fake_media_server.start(seconds=args.seconds, kbps=args.server_kbps, latency=args.latency)
+    try:
+        with tempfile.TemporaryDirectory(prefix='bench-downloads-') as tmp:
+            os.environ.update({
+                'PERSISTENT_DATA_PATH': tmp,
+                'LOG_LEVEL': 'ERROR',
+                'STATIC_HOMEPAGE': '0',
+                'PRERESOLVE_RESULTS': '0',
+                'STRATEGY_FAILURE_THRESHOLD': '1000000',
+            })
+            import app
+
+            work_dir = Path(tmp) / 'work'
+            work_dir.mkdir()
+            report = {
+                'config': vars(args),
+                'resume': bench_resume(app, server, work_dir, args.drop_fraction),
+                'fragments': bench_fragments(app, server, work_dir, args.fragment_concurrency),
+                'bandwidth': bench_bandwidth(app, server, work_dir, args.parallel, args.budget_kbps),
+            }
+    finally:
+        fake_media_server.stop(server)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Benchmark download time-to-first-byte with and without pre-resolved formats.
+
+Runs the app in-process against the stand-in yt-dlp (fake_yt_dlp/) and
+plays the admin flow --rounds times per mode: search (POST
+/admin/add-song), look at the results for --think-seconds, then download
+the top result. Two modes are compared:
+
+- off: PRERESOLVE_RESULTS=0 - the download starts with a full extraction
+- on: the top results are resolved in the background while the results
+  page is shown, and the download uses the cached info
+
+Time to first byte is measured from the start of download_from_youtube()
+to its first progress report with data. Prints p50/p95 per mode as JSON.
+
+    python benchmarks/bench_preresolve.py --rounds 10 --resolve-seconds 2
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(REPO_DIR))
+sys.path.insert(0, str(BENCH_DIR / 'fake_yt_dlp'))
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))], 3)
+
+
+def search(app, client):
+    """Search like the admin does and return the top result."""
+    query = f'bench {uuid.uuid4().hex[:8]}'
+    response = client.post('/admin/add-song', data={'search_query': query})
+    assert response.status_code == 200, response.status_code
+    return app.search_youtube(query)[0]
+
+
+def download(app, url, output_dir):
+    first_byte = {}
+
+    def hook(d):
+        if d.get('status') == 'downloading' and d.get('downloaded_bytes') and 'at' not in first_byte:
+            first_byte['at'] = time.perf_counter()
+
+    output_path = Path(output_dir) / f'{uuid.uuid4().hex}.mp3'
+    start = time.perf_counter()
+    audio_path = app.download_from_youtube(url, output_path, progress_hook=hook)
+    total = time.perf_counter() - start
+    if audio_path is None:
+        raise RuntimeError(f'download of {url} failed')
+    audio_path.unlink()
+    return first_byte['at'] - start, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=10, help='downloads per mode (default 10)')
+    parser.add_argument('--think-seconds', type=float, default=3.0,
+                        help='time the admin spends on the results page (default 3)')
+    parser.add_argument('--resolve-seconds', type=float, default=1.5,
+                        help="fake yt-dlp's extraction time per video (default 1.5)")
+    parser.add_argument('--download-seconds', type=float, default=2.0,
+                        help="fake yt-dlp's transfer time per video (default 2)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='bench-preresolve-') as tmp:
+        os.environ.update({
+            'PERSISTENT_DATA_PATH': tmp,
+            'LOG_LEVEL': 'WARNING',
+            'STATIC_HOMEPAGE': '0',
+            'FAKE_YTDLP_SEARCH_SECONDS': '0.2',
+            'FAKE_YTDLP_RESOLVE_SECONDS': str(args.resolve_seconds),
+            'FAKE_YTDLP_DOWNLOAD_SECONDS': str(args.download_seconds),
+            'FAKE_YTDLP_FFMPEG_SECONDS': '0',
+            'FAKE_YTDLP_MP3_BYTES': str(256 * 1024),
+            'FAKE_YTDLP_JITTER': '0.1',
+        })
+        import app
+
+        client = app.app.test_client()
+        with client.session_transaction() as session:
+            session['admin'] = True
+
+        preresolve_results = app.PRERESOLVE_RESULTS or 2
+        report = {'config': vars(args), 'modes': {}}
+        for mode in ('off', 'on'):
+            app.PRERESOLVE_RESULTS = preresolve_results if mode == 'on' else 0
+            ttfb, totals = [], []
+            for _ in range(args.rounds):
+                top = search(app, client)
+                time.sleep(args.think_seconds)
+                first_byte, total = download(app, top['url'], tmp)
+                ttfb.append(first_byte)
+                totals.append(total)
+            report['modes'][mode] = {
+                'ttfb_p50_s': percentile(ttfb, 50),
+                'ttfb_p95_s': percentile(ttfb, 95),
+                'download_p50_s': percentile(totals, 50),
+            }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark the local catalog search on a synthetic catalog.
+
+Builds a throwaway catalog.db with --songs random Hebrew/English titles,
+then times catalog.search_songs() and catalog.search_songs_page() (the
+first page with and without its match count cached, and the page
+following it) for a mix of queries (substrings
+of 3+ letters, short prefixes, multi-word, niqqud and final-letter
+variants, no-match) and prints p50/p95/p99 latency per query kind as JSON.
+
+    python benchmarks/bench_search.py --songs 100000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import catalog  # noqa: E402
+
+HEBREW_WORDS = ['שלום', 'אהבה', 'לילה', 'ירושלים', 'שמש', 'ים', 'חלום', 'לב', 'עולם', 'זמן',
+                'שיר', 'מלך', 'ארץ', 'אור', 'דרך', 'בית', 'נשמה', 'כוכב', 'רוח', 'עצוב']
+HEBREW_PREFIXES = ['', '', '', 'ה', 'ו', 'ב', 'ל', 'וה', 'מה']
+LATIN_WORDS = ['love', 'night', 'dance', 'dream', 'summer', 'heart', 'live', 'remix', 'official',
+               'music', 'video', 'Café', 'Beyoncé', 'Queen', 'Rock', 'Blue', 'Sky', 'Fire']
+
+QUERIES = {
+    'substring': ['ירושל', 'חלומ', 'dance', 'eyonc', 'נשמה', 'summ'],
+    'prefix': ['ש', 'לי', 'b', 'da', 'כו'],
+    'multi_word': ['שלום עולם', 'love night', 'ה לב', 'official video'],
+    'normalized': ['שָׁלוֹם', 'CAFE', 'ירושלימ', 'מֶלֶךְ'],
+    'no_match': ['zzzz', 'קקקק', 'xyz'],
+}
+
+
+def synthetic_song(i, rng):
+    words = []
+    for _ in range(rng.randint(2, 6)):
+        if rng.random() < 0.6:
+            words.append(rng.choice(HEBREW_PREFIXES) + rng.choice(HEBREW_WORDS))
+        else:
+            words.append(rng.choice(LATIN_WORDS))
+    name = ' '.join(words)
+    return {
+        'display_name': name,
+        'filename': f'{i}.mp3',
+        'search_query': name.split()[0] if rng.random() < 0.5 else None,
+    }
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--songs', type=int, default=100_000, help='catalog size (default 100000)')
+    parser.add_argument('--rounds', type=int, default=200, help='timed runs per query (default 200)')
+    parser.add_argument('--limit', type=int, default=50, help='results per query (default 50)')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        catalog.init_db(os.path.join(tmp, 'catalog.db'))
+
+        start = time.perf_counter()
+        batch = []
+        for i in range(args.songs):
+            batch.append(synthetic_song(i, rng))
+            if len(batch) == 5000:
+                catalog.add_songs(batch)
+                batch = []
+        if batch:
+            catalog.add_songs(batch)
+        build_seconds = time.perf_counter() - start
+
+        report = {'songs': args.songs, 'build_seconds': round(build_seconds, 2), 'queries': {}}
+        for kind, queries in QUERIES.items():
+            samples = {'search_songs': [], 'search_songs_page': [], 'search_songs_page_cold': [],
+                       'search_songs_page_next': []}
+            hits = []
+            totals = []
+            for query in queries:
+                calls = {
+                    'search_songs': lambda: catalog.search_songs(query, limit=args.limit),
+                    'search_songs_page': lambda: catalog.search_songs_page(query, limit=args.limit),
+                    'search_songs_page_cold': lambda: (catalog._search_counts.clear(),
+                                                       catalog.search_songs_page(query, limit=args.limit))[1],
+                }
+                next_after = calls['search_songs_page']()['next_after']
+                if next_after is not None:
+                    calls['search_songs_page_next'] = lambda: catalog.search_songs_page(
+                        query, after=next_after, limit=args.limit)
+                for name, call in calls.items():
+                    call()  # warm up
+                    for _ in range(args.rounds):
+                        t0 = time.perf_counter()
+                        results = call()
+                        samples[name].append((time.perf_counter() - t0) * 1000)
+                    if name == 'search_songs':
+                        hits.append(len(results))
+                    elif name == 'search_songs_page':
+                        totals.append(results['total'])
+            report['queries'][kind] = {
+                name: {
+                    'p50_ms': round(percentile(timings, 50), 3),
+                    'p95_ms': round(percentile(timings, 95), 3),
+                    'p99_ms': round(percentile(timings, 99), 3),
+                }
+                for name, timings in samples.items() if timings
+            }
+            report['queries'][kind]['results'] = dict(zip(queries, hits))
+            report['queries'][kind]['totals'] = dict(zip(queries, totals))
+
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
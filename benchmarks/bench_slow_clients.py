@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Benchmark concurrent slow MP3 downloads: sync gunicorn workers vs asgi.py.
+
+Generates a catalog (generate_catalog.py), starts the app under each
+--servers mode and opens --clients connections that download MP3s at
+--client-kbps each (small receive buffers, like phones on a slow link).
+While they run, a probe client loads / every --probe-interval seconds.
+For each mode the JSON report has:
+
+- clients whose response started within --ttfb-timeout, and the time to
+  first byte p50/p95
+- total bytes delivered per second to the slow clients
+- probe latency p50/p95 and probes that failed or timed out
+
+    python benchmarks/bench_slow_clients.py --clients 1000 --duration 20
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(REPO_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+
+import generate_catalog  # noqa: E402
+
+SERVERS = {
+    'gunicorn': lambda args, port: [
+        sys.executable, '-m', 'gunicorn', '--workers', str(args.workers), '--timeout', '120',
+        '--bind', f'127.0.0.1:{port}', 'app:app'],
+    'asgi': lambda args, port: [
+        sys.executable, '-m', 'uvicorn', '--host', '127.0.0.1', '--port', str(port),
+        '--no-access-log', '--limit-concurrency', str(args.clients + 100), 'asgi:app'],
+}
+
+RECEIVE_BUFFER = 16 * 1024
+
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000, 1)
+
+
+async def slow_download(port, song_id, rate, deadline, stats):
+    """Download /download/<song_id> at rate bytes/s until the deadline."""
+    loop = asyncio.get_running_loop()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+    sock.setblocking(False)
+    start = time.monotonic()
+    try:
+        await loop.sock_connect(sock, ('127.0.0.1', port))
+        reader, writer = await asyncio.open_connection(sock=sock, limit=RECEIVE_BUFFER)
+        writer.write(f'GET /download/{song_id} HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n'.encode())
+        await writer.drain()
+        first = await asyncio.wait_for(reader.read(4096), deadline - time.monotonic())
+        if not first:
+            stats['errors'] += 1
+            return
+        stats['ttfb'].append(time.monotonic() - start)
+        stats['bytes'] += len(first)
+        chunk = max(1024, rate // 10)
+        while time.monotonic() < deadline:
+            data = await reader.read(chunk)
+            if not data:
+                break
+            stats['bytes'] += len(data)
+            await asyncio.sleep(len(data) / rate)
+        writer.close()
+    except (OSError, asyncio.TimeoutError):
+        stats['errors'] += 1
+    finally:
+        sock.close()
+
+
+async def probe(port, interval, timeout, deadline, stats):
+    """Time GET / while the slow downloads are running."""
+    while time.monotonic() < deadline:
+        start = time.monotonic()
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+            writer.write(b'GET / HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n')
+            await writer.drain()
+            response = await asyncio.wait_for(reader.read(), timeout)
+            writer.close()
+            if response.startswith(b'HTTP/1.1 200'):
+                stats['probe'].append(time.monotonic() - start)
+            else:
+                stats['probe_errors'] += 1
+        except (OSError, asyncio.TimeoutError):
+            stats['probe_errors'] += 1
+        await asyncio.sleep(max(0.0, interval - (time.monotonic() - start)))
+
+
+async def drive(args, port, songs):
+    stats = {'ttfb': [], 'bytes': 0, 'errors': 0, 'probe': [], 'probe_errors': 0}
+    start = time.monotonic()
+    deadline = start + args.duration
+    rate = args.client_kbps * 1024
+    tasks = [asyncio.ensure_future(slow_download(port, songs[i % len(songs)], rate, deadline, stats))
+             for i in range(args.clients)]
+    # Let the downloads connect before probing
+    await asyncio.sleep(min(2.0, args.duration / 4))
+    tasks.append(asyncio.ensure_future(probe(port, args.probe_interval, args.ttfb_timeout, deadline, stats)))
+    await asyncio.gather(*tasks)
+    elapsed = time.monotonic() - start
+
+    started = [t for t in stats['ttfb'] if t <= args.ttfb_timeout]
+    return {
+        'clients': args.clients,
+        'clients_started': len(started),
+        'client_errors': stats['errors'],
+        'ttfb_p50_ms': percentile(stats['ttfb'], 50),
+        'ttfb_p95_ms': percentile(stats['ttfb'], 95),
+        'delivered_mb_per_second': round(stats['bytes'] / elapsed / (1024 * 1024), 2),
+        'probe_requests': len(stats['probe']),
+        'probe_p50_ms': percentile(stats['probe'], 50),
+        'probe_p95_ms': percentile(stats['probe'], 95),
+        'probe_errors': stats['probe_errors'],
+    }
+
+
+def wait_until_up(process, port):
+    for _ in range(300):
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited with code {process.returncode}')
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError('server did not start within 30 seconds')
+
+
+def run_mode(mode, args, data_dir, port):
+    # All clients come from one IP and the point is many transfers at once: no admission control
+    env = dict(os.environ, PERSISTENT_DATA_PATH=str(data_dir), LOG_LEVEL='WARNING',
+               PYTHONPATH=os.pathsep.join([str(BENCH_DIR / 'fake_yt_dlp'), str(REPO_DIR)]),
+               RATE_LIMIT_DOWNLOADS_PER_MINUTE='0', RATE_LIMIT_THUMBNAILS_PER_MINUTE='0',
+               MAX_CONCURRENT_TRANSFERS='0')
+    process = subprocess.Popen(SERVERS[mode](args, port), cwd=REPO_DIR, env=env)
+    try:
+        wait_until_up(process, port)
+        time.sleep(1)
+        return asyncio.run(drive(args, port, list(range(1, args.songs + 1))))
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--servers', default='gunicorn,asgi', help='modes to compare (default gunicorn,asgi)')
+    parser.add_argument('--clients', type=int, default=500, help='concurrent slow downloads (default 500)')
+    parser.add_argument('--client-kbps', type=int, default=32, help='download rate per client in KB/s (default 32)')
+    parser.add_argument('--duration', type=float, default=20, help='seconds per mode (default 20)')
+    parser.add_argument('--ttfb-timeout', type=float, default=10,
+                        help='a download or probe that waits longer counts as failed (default 10)')
+    parser.add_argument('--probe-interval', type=float, default=0.5, help='seconds between probes (default 0.5)')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn sync workers (default 4)')
+    parser.add_argument('--songs', type=int, default=200, help='catalog size (default 200)')
+    parser.add_argument('--mp3-bytes', type=int, default=4 * 1024 * 1024, help='MP3 size (default 4 MB)')
+    parser.add_argument('--port', type=int, default=8766)
+    args = parser.parse_args()
+
+    # Thousands of sockets on both ends
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (max(soft, min(hard, args.clients * 2 + 1024)), hard))
+
+    report = {'config': vars(args), 'modes': {}}
+    with tempfile.TemporaryDirectory(prefix='bench-slow-') as tmp:
+        generate_catalog.generate(tmp, args.songs, args.mp3_bytes, thumbnail_count=10)
+        for mode in args.servers.split(','):
+            report['modes'][mode] = run_mode(mode, args, tmp, args.port)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
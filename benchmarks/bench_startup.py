@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Benchmark worker startup time and memory with and without eager imports.
+
+Each round starts a fresh interpreter that imports app (what a gunicorn
+worker does), records the import time and resident memory, serves the
+public routes (/, /api/songs, /download/<id>, /thumbnails/<file>) through
+the test client and then makes the first admin-side yt-dlp call. Two modes
+are compared:
+
+- lazy: the app as shipped - yt-dlp and Pillow load on first admin use
+- eager: yt_dlp, requests and PIL.Image imported before app, like every
+  worker used to do
+
+Uses the real yt-dlp package (its import cost is what is measured) and a
+small catalog from generate_catalog.py. Prints medians as JSON.
+
+    python benchmarks/bench_startup.py --rounds 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(REPO_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+
+import generate_catalog  # noqa: E402
+
+HEAVY_MODULES = ('yt_dlp', 'requests', 'PIL.Image')
+
+# Runs in the child interpreter; argv[1] is the mode
+CHILD = '''
+import json, sys, time
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+
+start = time.perf_counter()
+if sys.argv[1] == 'eager':
+    import yt_dlp, requests, PIL.Image
+import app
+startup = time.perf_counter() - start
+after_import = rss_mb()
+
+client = app.app.test_client()
+songs = client.get('/api/songs?limit=5&fields=id,thumbnail_url').get_json()['songs']
+client.get('/').close()
+for song in songs:
+    client.get(f"/download/{song['id']}").close()
+    if song.get('thumbnail_url'):
+        client.get(song['thumbnail_url']).close()
+public_modules = [name for name in %r if name in sys.modules]
+after_public = rss_mb()
+
+start = time.perf_counter()
+app.youtube_dl({'quiet': True}).close()
+first_admin = time.perf_counter() - start
+
+print(json.dumps({
+    'startup_ms': startup * 1000,
+    'rss_after_import_mb': after_import,
+    'rss_after_public_mb': after_public,
+    'heavy_modules_after_public': public_modules,
+    'first_admin_call_ms': first_admin * 1000,
+    'rss_after_admin_mb': rss_mb(),
+}))
+''' % (HEAVY_MODULES,)
+
+
+def run_child(mode, data_dir):
+    env = dict(os.environ, PERSISTENT_DATA_PATH=str(data_dir), LOG_LEVEL='WARNING')
+    output = subprocess.run([sys.executable, '-c', CHILD, mode], cwd=REPO_DIR, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(samples):
+    summary = {}
+    for key, value in samples[0].items():
+        if isinstance(value, list):
+            summary[key] = value
+        else:
+            summary[key] = round(statistics.median(sample[key] for sample in samples), 1)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=10, help='fresh interpreters per mode (default 10)')
+    parser.add_argument('--songs', type=int, default=1000, help='catalog size (default 1000)')
+    args = parser.parse_args()
+
+    report = {'rounds': args.rounds, 'songs': args.songs, 'modes': {}}
+    with tempfile.TemporaryDirectory(prefix='bench-startup-') as tmp:
+        generate_catalog.generate(tmp, args.songs, mp3_bytes=64 * 1024, thumbnail_count=10)
+        run_child('lazy', tmp)  # warm the OS page cache and the catalog's first-start work
+        samples = {'lazy': [], 'eager': []}
+        for _ in range(args.rounds):
+            for mode in samples:
+                samples[mode].append(run_child(mode, tmp))
+        for mode, mode_samples in samples.items():
+            report['modes'][mode] = summarize(mode_samples)
+
+    lazy, eager = report['modes']['lazy'], report['modes']['eager']
+    report['saved'] = {
+        'startup_ms': round(eager['startup_ms'] - lazy['startup_ms'], 1),
+        'rss_per_public_worker_mb': round(eager['rss_after_public_mb'] - lazy['rss_after_public_mb'], 1),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+"""
+Local HTTP stand-in for YouTube's media servers, for the download benchmarks.
+
+Generates a stereo test tone with ffmpeg and serves it the two ways
+YouTube serves audio formats:
+
+- /audio.m4a: one progressive file, with Range requests
+- /dash/manifest.mpd: a DASH manifest whose audio is split into
+  --segment-seconds fragments
+
+Every response starts after --latency seconds and is sent at --kbps per
+connection, like YouTube's per-request latency and per-stream throttling,
+so fetching fragments in parallel pays off the same way. The first
+response for each path in --drop-paths that gets past --drop-after bytes
+is cut there (a connection reset in the middle of a transfer). The bytes sent per path
+are counted: GET /stats returns them as JSON, POST /stats/reset clears
+them and re-arms the drops.
+
+Import it and call start() from a benchmark, or run it on its own:
+
+    python benchmarks/fake_media_server.py --port 8765 --seconds 180
+"""
+
+import argparse
+import json
+import re
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+CHUNK_SIZE = 16 * 1024
+
+CONTENT_TYPES = {
+    '.m4a': 'audio/mp4',
+    '.mpd': 'application/dash+xml',
+    '.m4s': 'video/iso.segment',
+}
+
+
+def generate_media(media_dir, seconds, bitrate_kbps, segment_seconds):
+    """Encode a test tone as /audio.m4a and as DASH fragments under /dash."""
+    tone = ['ffmpeg', '-nostdin', '-loglevel', 'error', '-y',
+            '-f', 'lavfi', '-i', f'sine=frequency=440:duration={seconds}',
+            '-f', 'lavfi', '-i', f'sine=frequency=660:duration={seconds}',
+            '-filter_complex', 'amerge=inputs=2', '-c:a', 'aac', '-b:a', f'{bitrate_kbps}k']
+    subprocess.run(tone + [str(media_dir / 'audio.m4a')], check=True)
+    dash_dir = media_dir / 'dash'
+    dash_dir.mkdir()
+    subprocess.run(tone + ['-f', 'dash', '-seg_duration', str(segment_seconds),
+                           '-use_template', '1', '-use_timeline', '0',
+                           str(dash_dir / 'manifest.mpd')], check=True)
+
+
+class MediaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, media_dir, kbps, latency, drop_paths, drop_after):
+        super().__init__(address, MediaHandler)
+        self.media_dir = media_dir
+        self.rate = kbps * 1024
+        self.latency = latency
+        self.drop_paths = set(drop_paths)
+        self.drop_after = drop_after
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.bytes_sent = {}
+            self.requests = 0
+            self.armed_drops = set(self.drop_paths)
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self.server_address[1]}{path}'
+
+
+class MediaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, data):
+        body = json.dumps(data).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _take_drop(self):
+        # Armed until a response actually gets that far (yt-dlp's first probe of a URL reads little)
+        with self.server.lock:
+            if self.path not in self.server.armed_drops:
+                return False
+            self.server.armed_drops.discard(self.path)
+            return True
+
+    def do_POST(self):
+        if self.path == '/stats/reset':
+            self.server.reset()
+            self._json({'ok': True})
+        else:
+            self.send_error(404)
+
+    def do_HEAD(self):
+        self.do_GET(head=True)
+
+    def do_GET(self, head=False):
+        server = self.server
+        if self.path == '/stats':
+            with server.lock:
+                return self._json({'requests': server.requests, 'bytes_sent': dict(server.bytes_sent)})
+
+        path = (server.media_dir / self.path.split('?')[0].lstrip('/')).resolve()
+        if server.media_dir not in path.parents or not path.is_file():
+            return self.send_error(404)
+
+        size = path.stat().st_size
+        start, end = 0, size - 1
+        match = re.fullmatch(r'bytes=(\d*)-(\d*)', self.headers.get('Range', ''))
+        if match and match.group(1):
+            start = int(match.group(1))
+            end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+            if start >= size:
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+        with server.lock:
+            server.requests += 1
+
+        time.sleep(server.latency)
+        self.send_response(206 if match and match.group(1) else 200)
+        self.send_header('Content-Type', CONTENT_TYPES.get(path.suffix, 'application/octet-stream'))
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        if match and match.group(1):
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.end_headers()
+        if head:
+            return
+
+        began = time.perf_counter()
+        sent = 0
+        with open(path, 'rb') as f:
+            f.seek(start)
+            position = start
+            while position <= end:
+                if sent >= server.drop_after and self._take_drop():
+                    break
+                chunk = f.read(min(CHUNK_SIZE, end + 1 - position))
+                if not chunk:
+                    break
+                try:
+                    self.wfile.write(chunk)
+                except (BrokenPipeError, ConnectionResetError):
+                    break
+                position += len(chunk)
+                sent += len(chunk)
+                # Hold the connection to --kbps
+                ahead = sent / server.rate - (time.perf_counter() - began)
+                if ahead > 0:
+                    time.sleep(ahead)
+
+        with server.lock:
+            server.bytes_sent[self.path] = server.bytes_sent.get(self.path, 0) + sent
+        if position <= end:
+            # Dropped: reset the connection instead of finishing the response
+            self.close_connection = True
+            try:
+                self.connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def start(seconds=180, bitrate_kbps=256, segment_seconds=2, kbps=512, latency=0.2,
+          drop_paths=(), drop_after=512 * 1024, port=0):
+    """Generate the media into a temporary directory and serve it from a background thread. Returns the server."""
+    media_dir = Path(tempfile.mkdtemp(prefix='fake-media-')).resolve()
+    generate_media(media_dir, seconds, bitrate_kbps, segment_seconds)
+    server = MediaServer(('127.0.0.1', port), media_dir, kbps, latency, drop_paths, drop_after)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def stop(server):
+    server.shutdown()
+    shutil.rmtree(server.media_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--seconds', type=int, default=180, help='length of the audio (default 180)')
+    parser.add_argument('--bitrate', type=int, default=256, help='audio bitrate in kbps (default 256)')
+    parser.add_argument('--segment-seconds', type=int, default=2, help='DASH fragment length (default 2)')
+    parser.add_argument('--kbps', type=int, default=512, help='send rate per connection in KB/s (default 512)')
+    parser.add_argument('--latency', type=float, default=0.2, help='seconds before each response (default 0.2)')
+    parser.add_argument('--drop-paths', nargs='*', default=[], help='paths whose first request is cut short')
+    parser.add_argument('--drop-after', type=int, default=512 * 1024, help='bytes sent before the cut')
+    args = parser.parse_args()
+
+    server = start(args.seconds, args.bitrate, args.segment_seconds, args.kbps, args.latency,
+                   args.drop_paths, args.drop_after, args.port)
+    print(f"Serving {server.url('/audio.m4a')} and {server.url('/dash/manifest.mpd')}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        stop(server)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+"""
+Stand-in for yt_dlp used by the benchmarks - no network, predictable timing.
+
+Put benchmarks/fake_yt_dlp first on PYTHONPATH and `import yt_dlp` in
+app.py picks this up. It supports what app.py uses:
+
+- ytsearchN:<query> returns N fake videos after FAKE_YTDLP_SEARCH_SECONDS
+- resolving a video (watch page, player, formats) takes
+  FAKE_YTDLP_RESOLVE_SECONDS, with or without download. process_ie_result()
+  downloads from an info dict resolved earlier without that delay, and
+  fails like a 403 once its format URLs have expired
+- playlist URLs (containing "list=") expand to FAKE_YTDLP_PLAYLIST_SIZE entries
+- downloads take FAKE_YTDLP_DOWNLOAD_SECONDS, report progress through
+  progress_hooks, "run" FFmpegExtractAudio for FAKE_YTDLP_FFMPEG_SECONDS
+  through postprocessor_hooks and write an MP3 of FAKE_YTDLP_MP3_BYTES
+  (an .m4a when FFmpegExtractAudio keeps the original codec) plus a
+  WebP/PNG thumbnail when writethumbnail is set
+- URLs containing "fail" raise DownloadError, like a blocked video
+
+Latencies get +/-FAKE_YTDLP_JITTER (fraction) of random jitter.
+"""
+
+import hashlib
+import os
+import random
+import time
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+__version__ = 'fake'
+
+
+def _env_float(name, default):
+    return float(os.getenv(name, default))
+
+
+SEARCH_SECONDS = _env_float('FAKE_YTDLP_SEARCH_SECONDS', 1.0)
+RESOLVE_SECONDS = _env_float('FAKE_YTDLP_RESOLVE_SECONDS', 1.0)
+DOWNLOAD_SECONDS = _env_float('FAKE_YTDLP_DOWNLOAD_SECONDS', 3.0)
+FFMPEG_SECONDS = _env_float('FAKE_YTDLP_FFMPEG_SECONDS', 1.0)
+MP3_BYTES = int(_env_float('FAKE_YTDLP_MP3_BYTES', 4 * 1024 * 1024))
+PLAYLIST_SIZE = int(_env_float('FAKE_YTDLP_PLAYLIST_SIZE', 10))
+JITTER = _env_float('FAKE_YTDLP_JITTER', 0.2)
+
+PROGRESS_STEPS = 10
+
+# Lifetime of the signed format URLs in a resolved info dict
+FORMAT_URL_SECONDS = 6 * 60 * 60
+
+
+class DownloadError(Exception):
+    pass
+
+
+def _sleep(seconds):
+    if seconds > 0:
+        time.sleep(seconds * random.uniform(1 - JITTER, 1 + JITTER))
+
+
+def _video_id(seed):
+    return hashlib.sha1(seed.encode('utf-8')).hexdigest()[:11]
+
+
+def _video(video_id, title):
+    return {
+        'id': video_id,
+        'url': f'https://www.youtube.com/watch?v={video_id}',
+        'title': title,
+        'thumbnail': f'https://i.ytimg.com/vi/{video_id}/hqdefault.jpg',
+        'duration': 180 + int(video_id[:2], 16),
+        'channel': 'Fake Channel',
+    }
+
+
+def _write_thumbnail(path):
+    try:
+        from PIL import Image
+        Image.new('RGB', (1280, 720), (200, 30, 30)).save(str(path.with_suffix('.webp')), 'WEBP')
+    except Exception:
+        # PNG signature without image data - exercises the "keep original" path
+        path.with_suffix('.png').write_bytes(b'\x89PNG\r\n\x1a\n' + b'\0' * 64)
+
+
+class YoutubeDL:
+    def __init__(self, params=None):
+        self.params = params or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def extract_info(self, url, download=True):
+        if url.startswith('ytsearch'):
+            prefix, query = url.split(':', 1)
+            count = int(prefix[len('ytsearch'):] or 1)
+            _sleep(SEARCH_SECONDS)
+            return {'_type': 'playlist', 'entries': [
+                _video(_video_id(f'{query}:{i}'), f'{query} ({i + 1})') for i in range(count)
+            ]}
+
+        if 'fail' in url:
+            _sleep(SEARCH_SECONDS)
+            raise DownloadError(f'ERROR: [youtube] Video unavailable: {url}')
+
+        query = parse_qs(urlparse(url).query)
+        if 'list' in query and 'v' not in query:
+            _sleep(SEARCH_SECONDS)
+            return {'_type': 'playlist', 'entries': [
+                _video(_video_id(f"{query['list'][0]}:{i}"), f'Playlist song {i + 1}')
+                for i in range(PLAYLIST_SIZE)
+            ]}
+
+        video_id = query.get('v', [url.rstrip('/').rsplit('/', 1)[-1]])[0]
+        info = _video(video_id, f'Fake song {video_id}')
+        if self.params.get('extract_flat'):
+            _sleep(SEARCH_SECONDS / 2)
+            return info
+
+        _sleep(RESOLVE_SECONDS)
+        expire = int(time.time() + FORMAT_URL_SECONDS)
+        info['formats'] = [
+            {'format_id': '140', 'ext': 'm4a', 'acodec': 'mp4a.40.2', 'abr': 129.5,
+             'url': f'https://rr1---sn-fake.googlevideo.com/videoplayback?id={video_id}&itag=140&expire={expire}'},
+            {'format_id': '251', 'ext': 'webm', 'acodec': 'opus', 'abr': 135.2,
+             'url': f'https://rr1---sn-fake.googlevideo.com/videoplayback?id={video_id}&itag=251&expire={expire}'},
+        ]
+        if download:
+            self._download(info)
+        return info
+
+    def process_ie_result(self, info, download=True):
+        expire = min(int(parse_qs(urlparse(f['url']).query)['expire'][0]) for f in info['formats'])
+        if expire < time.time():
+            raise DownloadError('ERROR: unable to download video data: HTTP Error 403: Forbidden')
+        if download:
+            self._download(info)
+        return info
+
+    @staticmethod
+    def sanitize_info(info, remove_private_keys=False):
+        return dict(info)
+
+    def _download(self, info):
+        base = Path(self.params.get('outtmpl', info['id']))
+        hooks = self.params.get('progress_hooks', [])
+        for step in range(1, PROGRESS_STEPS + 1):
+            _sleep(DOWNLOAD_SECONDS / PROGRESS_STEPS)
+            for hook in hooks:
+                hook({'status': 'downloading', 'downloaded_bytes': MP3_BYTES * step // PROGRESS_STEPS,
+                      'total_bytes': MP3_BYTES, 'info_dict': info})
+        for hook in hooks:
+            hook({'status': 'finished', 'downloaded_bytes': MP3_BYTES, 'total_bytes': MP3_BYTES,
+                  'info_dict': info})
+
+        pp_hooks = self.params.get('postprocessor_hooks', [])
+        for hook in pp_hooks:
+            hook({'status': 'started', 'postprocessor': 'ExtractAudio', 'info_dict': info})
+        _sleep(FFMPEG_SECONDS)
+
+        codecs = [pp.get('preferredcodec') for pp in self.params.get('postprocessors', [])
+                  if pp.get('key') == 'FFmpegExtractAudio']
+        extension = '.m4a' if 'best' in codecs else '.mp3'
+        with open(base.with_suffix(extension), 'wb') as f:
+            f.write(b'ID3\x04\x00\x00\x00\x00\x00\x00')
+            f.write(os.urandom(min(MP3_BYTES, 64 * 1024)))
+            f.truncate(max(MP3_BYTES, 10))
+        if self.params.get('writethumbnail'):
+            _write_thumbnail(base)
+
+        for hook in pp_hooks:
+            hook({'status': 'finished', 'postprocessor': 'ExtractAudio', 'info_dict': info})
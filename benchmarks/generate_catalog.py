@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Generate a synthetic persistent data directory for benchmarks.
+
+Creates catalog.db with --songs songs, an MP3 file per song (sparse, of
+--mp3-bytes) and --thumbnails distinct content-addressed 1x/2x JPEG
+thumbnails shared round-robin between the songs - the layout the app
+itself produces.
+
+    python benchmarks/generate_catalog.py /tmp/bench-data --songs 10000
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import sys
+from io import BytesIO
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import catalog  # noqa: E402
+
+WORDS = ['שלום', 'אהבה', 'לילה', 'ירושלים', 'שמש', 'חלום', 'לב', 'עולם', 'שיר', 'אור',
+         'love', 'night', 'dance', 'dream', 'summer', 'heart', 'live', 'remix', 'official']
+
+BATCH_SIZE = 5000
+
+
+def make_thumbnails(thumbnails_dir, count, rng):
+    """Write count 1x/2x JPEG pairs and return their catalog fields."""
+    from PIL import Image
+
+    fields = []
+    for _ in range(count):
+        color = tuple(rng.randrange(256) for _ in range(3))
+        names = {}
+        for variant, size in (('thumbnail', (80, 60)), ('thumbnail_2x', (160, 120))):
+            buffer = BytesIO()
+            Image.new('RGB', size, color).save(buffer, 'JPEG', quality=80)
+            data = buffer.getvalue()
+            name = hashlib.sha256(data).hexdigest()[:32] + '.jpg'
+            (thumbnails_dir / name).write_bytes(data)
+            names[variant] = name
+        fields.append(dict(names, thumbnail_width=80, thumbnail_height=60, thumbnail_mime='image/jpeg'))
+    return fields
+
+
+def write_mp3(path, size):
+    with open(path, 'wb') as f:
+        f.write(b'ID3\x04\x00\x00\x00\x00\x00\x00')
+        f.truncate(max(size, 10))
+
+
+def generate(data_dir, songs, mp3_bytes, thumbnail_count, seed=42):
+    data_dir = Path(data_dir)
+    downloads_dir = data_dir / 'downloads'
+    thumbnails_dir = data_dir / 'thumbnails'
+    downloads_dir.mkdir(parents=True, exist_ok=True)
+    thumbnails_dir.mkdir(parents=True, exist_ok=True)
+
+    rng = random.Random(seed)
+    catalog.init_db(data_dir / 'catalog.db')
+    thumbnail_fields = make_thumbnails(thumbnails_dir, thumbnail_count, rng) if thumbnail_count else [{}]
+
+    batch = []
+    for i in range(songs):
+        video_id = hashlib.sha1(f'bench:{i}'.encode()).hexdigest()[:11]
+        filename = f'{video_id}.mp3'
+        write_mp3(downloads_dir / filename, mp3_bytes)
+        name = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(2, 5)))
+        batch.append(dict(
+            thumbnail_fields[i % len(thumbnail_fields)],
+            display_name=name,
+            filename=filename,
+            video_id=video_id,
+            youtube_url=f'https://www.youtube.com/watch?v={video_id}',
+            search_query=name.split()[0],
+        ))
+        if len(batch) == BATCH_SIZE:
+            catalog.add_songs(batch)
+            batch = []
+    if batch:
+        catalog.add_songs(batch)
+    return catalog.count_songs()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('data_dir', help='directory to use as PERSISTENT_DATA_PATH')
+    parser.add_argument('--songs', type=int, default=10_000, help='number of songs (default 10000)')
+    parser.add_argument('--mp3-bytes', type=int, default=4 * 1024 * 1024,
+                        help='size of each MP3 file (default 4 MB, written sparse)')
+    parser.add_argument('--thumbnails', type=int, default=100,
+                        help='distinct thumbnails shared by the songs (default 100, 0 for none)')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    total = generate(args.data_dir, args.songs, args.mp3_bytes, args.thumbnails, args.seed)
+    print(f"✓ {args.data_dir}: {total} songs, {args.thumbnails} thumbnails, "
+          f"{args.mp3_bytes / (1024 * 1024):.1f} MB per MP3")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Load test the app against a synthetic catalog with a stubbed yt-dlp.
+
+By default this generates a catalog (benchmarks/generate_catalog.py) in a
+temporary directory, starts the app under gunicorn with
+benchmarks/fake_yt_dlp first on PYTHONPATH, and then, for --duration
+seconds:
+
+- --concurrency clients request /, a random page of /, /download/<id> and
+  /thumbnails/<file> (reading the whole body)
+- --admin-clients admins loop through the add/delete flow: search, queue a
+  download, wait for the job, delete the new song
+
+The report (stdout, or --output) is JSON with requests, errors,
+throughput and p50/p95/p99 latency per route, so runs can be compared
+over time. Use --url to test an already running server instead.
+
+    python benchmarks/load_test.py --songs 10000 --concurrency 200 --duration 30
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+BENCH_DIR = Path(__file__).resolve().parent
+REPO_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(REPO_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+
+import generate_catalog  # noqa: E402
+
+ADMIN_PASSWORD = 'bench'
+
+# Relative weight of each public route in the request mix
+PUBLIC_MIX = (
+    ('index', 3),
+    ('index_page', 2),
+    ('download', 3),
+    ('thumbnail', 4),
+)
+
+
+class Recorder:
+    """Thread-safe latency samples per route."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._errors = {}
+        self._bytes = {}
+
+    def record(self, route, seconds, ok=True, size=0):
+        with self._lock:
+            self._samples.setdefault(route, []).append(seconds)
+            self._bytes[route] = self._bytes.get(route, 0) + size
+            if not ok:
+                self._errors[route] = self._errors.get(route, 0) + 1
+
+    def report(self, elapsed):
+        def percentile(ordered, pct):
+            return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+        routes = {}
+        with self._lock:
+            for route, samples in sorted(self._samples.items()):
+                ordered = sorted(samples)
+                routes[route] = {
+                    'requests': len(ordered),
+                    'errors': self._errors.get(route, 0),
+                    'throughput_rps': round(len(ordered) / elapsed, 2),
+                    'mb_per_second': round(self._bytes[route] / elapsed / (1024 * 1024), 2),
+                    'p50_ms': round(percentile(ordered, 50) * 1000, 2),
+                    'p95_ms': round(percentile(ordered, 95) * 1000, 2),
+                    'p99_ms': round(percentile(ordered, 99) * 1000, 2),
+                    'max_ms': round(ordered[-1] * 1000, 2),
+                }
+        return routes
+
+
+def timed_get(session, recorder, route, url, **kwargs):
+    start = time.perf_counter()
+    size = 0
+    ok = False
+    try:
+        with session.get(url, stream=True, timeout=120, **kwargs) as response:
+            for chunk in response.iter_content(64 * 1024):
+                size += len(chunk)
+            ok = response.status_code < 400
+    except requests.RequestException:
+        pass
+    recorder.record(route, time.perf_counter() - start, ok, size)
+    return ok
+
+
+def public_client(base_url, songs, deadline, recorder, rng):
+    routes = [route for route, weight in PUBLIC_MIX for _ in range(weight)]
+    thumbnails = [song['thumbnail_url'] for song in songs if song.get('thumbnail_url')]
+    session = requests.Session()
+    while time.monotonic() < deadline:
+        route = rng.choice(routes)
+        if route == 'index':
+            timed_get(session, recorder, route, f'{base_url}/')
+        elif route == 'index_page':
+            timed_get(session, recorder, route, f'{base_url}/?after={rng.choice(songs)["id"]}')
+        elif route == 'download':
+            timed_get(session, recorder, route, f'{base_url}/download/{rng.choice(songs)["id"]}')
+        elif route == 'thumbnail' and thumbnails:
+            timed_get(session, recorder, route, base_url + rng.choice(thumbnails))
+
+
+def admin_client(base_url, deadline, recorder, rng):
+    session = requests.Session()
+    session.post(f'{base_url}/admin/login', data={'password': ADMIN_PASSWORD}, timeout=30)
+    while time.monotonic() < deadline:
+        query = f'bench song {rng.randrange(10 ** 9)}'
+
+        start = time.perf_counter()
+        response = session.post(f'{base_url}/admin/add-song', data={'search_query': query}, timeout=120)
+        recorder.record('admin_search', time.perf_counter() - start, response.ok, len(response.content))
+
+        # The fake yt-dlp derives video ids from the query, so each flow adds a new video
+        video_id = hashlib.sha1(f'{query}:0'.encode()).hexdigest()[:11]
+        start = time.perf_counter()
+        response = session.post(
+            f'{base_url}/admin/download-song',
+            data={'youtube_url': f'https://www.youtube.com/watch?v={video_id}',
+                  'youtube_title': query, 'song_name': query},
+            headers={'Accept': 'application/json'}, timeout=30,
+        )
+        recorder.record('admin_enqueue', time.perf_counter() - start, response.status_code == 202)
+        if response.status_code != 202:
+            continue
+
+        status_url = base_url + response.json()['status_url']
+        job = {}
+        while time.monotonic() < deadline + 300:
+            time.sleep(0.25)
+            job = session.get(status_url, timeout=30).json()
+            if job.get('status') in ('succeeded', 'failed'):
+                break
+        recorder.record('download_job', time.perf_counter() - start, job.get('status') == 'succeeded')
+
+        song_id = (job.get('result') or {}).get('song_id')
+        if song_id:
+            start = time.perf_counter()
+            response = session.post(f'{base_url}/admin/song/{song_id}/delete', timeout=30,
+                                    allow_redirects=False)
+            recorder.record('admin_delete', time.perf_counter() - start, response.status_code == 302)
+
+
+def fetch_songs(base_url, limit):
+    songs = []
+    url = f'{base_url}/api/songs?limit=500&fields=id,thumbnail_url'
+    while url and len(songs) < limit:
+        page = requests.get(url, timeout=60).json()
+        songs.extend(page['songs'])
+        url = base_url + page['next'] if page.get('next') else None
+    return songs[:limit]
+
+
+def start_server(args, data_dir, port):
+    env = dict(
+        os.environ,
+        PERSISTENT_DATA_PATH=str(data_dir),
+        PYTHONPATH=os.pathsep.join([str(BENCH_DIR / 'fake_yt_dlp'), str(REPO_DIR)]),
+        ADMIN_PASSWORD=ADMIN_PASSWORD,
+        LOG_LEVEL=os.getenv('LOG_LEVEL', 'WARNING'),
+        FAKE_YTDLP_MP3_BYTES=str(args.mp3_bytes),
+        # Every simulated client comes from one IP: admission control off unless asked for
+        RATE_LIMIT_DOWNLOADS_PER_MINUTE=os.getenv('RATE_LIMIT_DOWNLOADS_PER_MINUTE', '0'),
+        RATE_LIMIT_THUMBNAILS_PER_MINUTE=os.getenv('RATE_LIMIT_THUMBNAILS_PER_MINUTE', '0'),
+        MAX_CONCURRENT_TRANSFERS=os.getenv('MAX_CONCURRENT_TRANSFERS', '0'),
+    )
+    if args.server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', '--workers', str(args.workers),
+                   '--threads', str(args.threads), '--timeout', '120',
+                   '--bind', f'127.0.0.1:{port}', 'app:app']
+    else:
+        command = [sys.executable, '-c',
+                   f'from app import app; app.run(host="127.0.0.1", port={port}, threaded=True)']
+    process = subprocess.Popen(command, cwd=REPO_DIR, env=env)
+
+    base_url = f'http://127.0.0.1:{port}'
+    for _ in range(300):
+        if process.poll() is not None:
+            raise RuntimeError(f'server exited with code {process.returncode}')
+        try:
+            requests.get(f'{base_url}/api/songs?limit=1', timeout=1)
+            return process, base_url
+        except requests.RequestException:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError('server did not start within 30 seconds')
+
+
+def run(args, base_url):
+    songs = fetch_songs(base_url, args.sample_songs)
+    if not songs:
+        raise RuntimeError('the catalog is empty')
+
+    recorder = Recorder()
+    deadline = time.monotonic() + args.duration
+    threads = [
+        threading.Thread(target=public_client, args=(base_url, songs, deadline, recorder, random.Random(i)))
+        for i in range(args.concurrency)
+    ] + [
+        threading.Thread(target=admin_client, args=(base_url, deadline, recorder, random.Random(-1 - i)))
+        for i in range(args.admin_clients)
+    ]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return recorder.report(time.monotonic() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help='test this running server instead of starting one')
+    parser.add_argument('--data-dir', help='persistent data directory (default: a new temporary one)')
+    parser.add_argument('--songs', type=int, default=10_000, help='songs to generate (default 10000)')
+    parser.add_argument('--mp3-bytes', type=int, default=4 * 1024 * 1024, help='MP3 size (default 4 MB)')
+    parser.add_argument('--thumbnails', type=int, default=100, help='distinct thumbnails (default 100)')
+    parser.add_argument('--concurrency', type=int, default=50, help='public clients (default 50)')
+    parser.add_argument('--admin-clients', type=int, default=2, help='admin add/delete loops (default 2)')
+    parser.add_argument('--duration', type=float, default=30, help='seconds of load (default 30)')
+    parser.add_argument('--sample-songs', type=int, default=2000, help='songs to pick requests from')
+    parser.add_argument('--server', choices=('gunicorn', 'werkzeug'), default='gunicorn')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers (default 4)')
+    parser.add_argument('--threads', type=int, default=1, help='gunicorn threads per worker (default 1)')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--output', help='write the JSON report to this file')
+    args = parser.parse_args()
+
+    report = {'config': {key: value for key, value in vars(args).items() if key != 'output'}}
+    if args.url:
+        report['routes'] = run(args, args.url.rstrip('/'))
+    else:
+        with tempfile.TemporaryDirectory(prefix='bench-data-') as tmp:
+            data_dir = Path(args.data_dir or tmp)
+            if not (data_dir / 'catalog.db').exists():
+                generate_catalog.generate(data_dir, args.songs, args.mp3_bytes, args.thumbnails)
+            process, base_url = start_server(args, data_dir, args.port)
+            try:
+                report['routes'] = run(args, base_url)
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
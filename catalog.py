@@ -0,0 +1,579 @@
+"""
+SQLite-backed song catalog.
+
+All songs live in a single SQLite database on the persistent disk. The
+database runs in WAL mode so the gunicorn workers can read concurrently
+while one of them writes, and every change is a row-level statement inside
+its own transaction - no more rewriting the whole catalog per request.
+
+The same transactions keep the full-text search index (search_index.py)
+in sync with the songs table.
+
+Reads go through a per-worker cache of the parsed catalog and an id -> song
+map. Every write bumps a generation counter in the meta table inside the
+same transaction, so each worker only re-reads the songs table when some
+worker actually changed it. Change listeners (add_change_listener) are
+called after such a transaction commits in this process.
+"""
+
+import json
+import logging
+import os
+from bisect import bisect_left, bisect_right
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+
+import search_index
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+SONG_FIELDS = (
+    'display_name', 'filename', 'youtube_url', 'video_id', 'thumbnail', 'search_query',
+    'thumbnail_2x', 'thumbnail_width', 'thumbnail_height', 'thumbnail_mime', 'has_stream',
+    'duration', 'bitrate', 'codec', 'file_size', 'sha256',
+)
+
+# Fields describing a song's files on disk, shared by every song of the same video
+MEDIA_FIELDS = (
+    'filename', 'video_id', 'thumbnail', 'thumbnail_2x',
+    'thumbnail_width', 'thumbnail_height', 'thumbnail_mime', 'has_stream',
+    'duration', 'bitrate', 'codec', 'file_size', 'sha256',
+)
+
+# Columns holding file names; several songs can reference the same file
+FILE_COLUMNS = ('filename', 'thumbnail', 'thumbnail_2x')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS songs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    display_name TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    youtube_url TEXT,
+    video_id TEXT,
+    thumbnail TEXT,
+    search_query TEXT,
+    created_at REAL NOT NULL,
+    thumbnail_2x TEXT,
+    thumbnail_width INTEGER,
+    thumbnail_height INTEGER,
+    thumbnail_mime TEXT,
+    has_stream INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_songs_video_id ON songs(video_id);
+CREATE INDEX IF NOT EXISTS idx_songs_filename ON songs(filename);
+CREATE INDEX IF NOT EXISTS idx_songs_thumbnail ON songs(thumbnail);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Columns added after the first release, added in place to existing databases
+ADDED_COLUMNS = {
+    'thumbnail_2x': 'TEXT',
+    'thumbnail_width': 'INTEGER',
+    'thumbnail_height': 'INTEGER',
+    'thumbnail_mime': 'TEXT',
+    'has_stream': 'INTEGER NOT NULL DEFAULT 0',
+    'duration': 'REAL',
+    'bitrate': 'INTEGER',
+    'codec': 'TEXT',
+    'file_size': 'INTEGER',
+    'sha256': 'TEXT',
+}
+
+_db = None
+
+# Per-worker read cache, replaced wholesale (never mutated) on reload
+_cache = {'generation': None, 'songs': [], 'ids': [], 'by_id': {}}
+_cache_lock = threading.Lock()
+_cache_stats = {'hits': 0, 'misses': 0}
+
+# Per-worker match counts of recent searches: normalized query -> (generation, total)
+_search_counts = {}
+SEARCH_COUNT_CACHE_SIZE = 1000
+
+# Callbacks run after a transaction that changed the catalog has committed
+_change_listeners = []
+_writes = threading.local()
+
+
+def init_db(db_path):
+    """Open (creating if needed) the catalog database at db_path."""
+    global _db
+    _db = Database(db_path, SCHEMA + search_index.SCHEMA)
+    _add_missing_columns()
+    _ensure_search_index()
+
+
+def _add_missing_columns():
+    with _db.transaction() as conn:
+        existing = {row['name'] for row in conn.execute('PRAGMA table_info(songs)')}
+        for name, column_type in ADDED_COLUMNS.items():
+            if name not in existing:
+                conn.execute(f'ALTER TABLE songs ADD COLUMN {name} {column_type}')
+
+
+def _ensure_search_index():
+    """Build the search index on first start, or after the normalization changed."""
+    with _db.transaction() as conn:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'search_index_version'").fetchone()
+        if row is not None and row[0] == search_index.INDEX_VERSION:
+            return
+        indexed = search_index.rebuild(conn)
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('search_index_version', ?)",
+            (search_index.INDEX_VERSION,)
+        )
+    logger.info("Built search index for %d songs", indexed)
+
+
+def _connect():
+    if _db is None:
+        raise RuntimeError('catalog.init_db() has not been called')
+    return _db.connect()
+
+
+@contextmanager
+def _transaction():
+    if _db is None:
+        raise RuntimeError('catalog.init_db() has not been called')
+    _writes.changed = False
+    with _db.transaction() as conn:
+        yield conn
+    if _writes.changed:
+        _writes.changed = False
+        for callback in _change_listeners:
+            try:
+                callback()
+            except Exception:
+                logger.exception("Catalog change listener %r failed", callback)
+
+
+def add_change_listener(callback):
+    """Call callback() (in the writing thread) after every committed catalog change in this process."""
+    _change_listeners.append(callback)
+
+
+def _get_generation(conn):
+    row = conn.execute("SELECT value FROM meta WHERE key = 'generation'").fetchone()
+    return int(row[0]) if row is not None else 0
+
+
+def _bump_generation(conn):
+    """Mark the catalog as changed. Must run inside the writing transaction."""
+    conn.execute(
+        "INSERT INTO meta (key, value) VALUES ('generation', 1) "
+        "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+    )
+    _writes.changed = True
+
+
+def generation():
+    """Current catalog generation; changes whenever any process changes the catalog."""
+    return _get_generation(_connect())
+
+
+def _cached_catalog():
+    """Return the current catalog snapshot, re-reading it only if the generation changed."""
+    global _cache
+    conn = _connect()
+    snapshot = _cache
+    if snapshot['generation'] == _get_generation(conn):
+        _cache_stats['hits'] += 1
+        return snapshot
+
+    with _cache_lock:
+        # Another thread may have reloaded while we waited for the lock
+        generation = _get_generation(conn)
+        if _cache['generation'] == generation:
+            _cache_stats['hits'] += 1
+            return _cache
+
+        _cache_stats['misses'] += 1
+        with _db.snapshot() as conn:
+            generation = _get_generation(conn)
+            rows = conn.execute('SELECT * FROM songs ORDER BY id').fetchall()
+
+        songs = [_row_to_song(row) for row in rows]
+        _cache = {
+            'generation': generation,
+            'songs': songs,
+            'ids': [song['id'] for song in songs],
+            'by_id': {song['id']: song for song in songs},
+        }
+        return _cache
+
+
+def cache_stats():
+    """Return read-cache hit/miss counters for this worker."""
+    snapshot = _cache
+    lookups = _cache_stats['hits'] + _cache_stats['misses']
+    return {
+        'pid': os.getpid(),
+        'hits': _cache_stats['hits'],
+        'misses': _cache_stats['misses'],
+        'hit_rate': round(_cache_stats['hits'] / lookups, 4) if lookups else None,
+        'generation': snapshot['generation'],
+        'songs': len(snapshot['songs']),
+    }
+
+
+def _row_to_song(row):
+    return dict(row) if row is not None else None
+
+
+def extract_video_id(youtube_url):
+    """Extract the YouTube video id from a watch/short URL."""
+    if not youtube_url:
+        return None
+    parsed = urlparse(youtube_url)
+    if parsed.query:
+        video_ids = parse_qs(parsed.query).get('v')
+        if video_ids:
+            return video_ids[0]
+    if parsed.netloc.endswith('youtu.be'):
+        return parsed.path.lstrip('/') or None
+    return youtube_url.split('watch?v=')[-1] or None
+
+
+# ============ READS ============
+
+# Songs returned from the cache are shared between requests - treat them as read-only.
+
+def list_songs():
+    """Return all songs ordered by id."""
+    return list(_cached_catalog()['songs'])
+
+
+def count_songs():
+    """Return the number of songs in the catalog."""
+    return len(_cached_catalog()['songs'])
+
+
+def get_song(song_id):
+    """Return the song with the given id, or None."""
+    return _cached_catalog()['by_id'].get(song_id)
+
+
+def list_songs_page(after=None, before=None, limit=50):
+    """
+    Return one page of songs using id cursors.
+
+    after returns the songs following that id, before the songs preceding
+    it. Cursors are song ids, so pages stay correct when songs are deleted.
+    Returns a dict with songs, total, and the prev_before / next_after
+    cursors (None at either end of the catalog).
+    """
+    snapshot = _cached_catalog()
+    return _page(snapshot['songs'], snapshot['ids'], after, before, limit)
+
+
+def _page(songs, ids, after, before, limit):
+    """The page of songs (sorted by id, ids their ids) that list_songs_page() describes."""
+    if before is not None:
+        end = bisect_left(ids, before)
+        start = max(0, end - limit)
+    else:
+        start = bisect_right(ids, after) if after is not None else 0
+        end = min(len(songs), start + limit)
+
+    page = songs[start:end]
+    return {
+        'songs': page,
+        'total': len(songs),
+        'prev_before': page[0]['id'] if page and start > 0 else None,
+        'next_after': page[-1]['id'] if page and end < len(songs) else None,
+    }
+
+
+def list_all_pages(limit=50):
+    """
+    Split the whole catalog into the pages list_songs_page() returns when
+    following the next_after cursors from the first page.
+
+    Returns (generation, pages) from one consistent snapshot. An empty
+    catalog has a single empty page.
+    """
+    snapshot = _cached_catalog()
+    songs = snapshot['songs']
+    pages = []
+    for start in range(0, max(len(songs), 1), limit):
+        page = songs[start:start + limit]
+        pages.append({
+            'songs': page,
+            'total': len(songs),
+            'prev_before': page[0]['id'] if start > 0 else None,
+            'next_after': page[-1]['id'] if start + limit < len(songs) else None,
+        })
+    return snapshot['generation'], pages
+
+
+def search_songs(query, limit=50):
+    """Return songs whose name or original search query match every word of query."""
+    song_ids = search_index.search(_connect(), query, limit)
+    by_id = _cached_catalog()['by_id']
+    return [by_id[song_id] for song_id in song_ids if song_id in by_id]
+
+
+def search_songs_page(query, after=None, before=None, limit=50):
+    """
+    Like list_songs_page(), over the songs search_songs() matches: total
+    counts every match, and the cursors page through them.
+    """
+    conn = _connect()
+    snapshot = _cached_catalog()
+    # One id past the page tells whether there is a next (or previous) page
+    if before is not None:
+        song_ids = search_index.search(conn, query, limit + 1, before=before)
+        has_prev = len(song_ids) > limit
+        song_ids = song_ids[-limit:]
+        has_next = bool(search_index.search(conn, query, 1, after=before - 1))
+    else:
+        song_ids = search_index.search(conn, query, limit + 1, after=after)
+        has_next = len(song_ids) > limit
+        song_ids = song_ids[:limit]
+        first = search_index.search(conn, query, 1) if after is not None else []
+        has_prev = bool(first) and first[0] <= after
+
+    page = [snapshot['by_id'][song_id] for song_id in song_ids if song_id in snapshot['by_id']]
+    return {
+        'songs': page,
+        'total': _search_count(conn, query, snapshot['generation']),
+        'prev_before': page[0]['id'] if page and has_prev else None,
+        'next_after': page[-1]['id'] if page and has_next else None,
+    }
+
+
+def _search_count(conn, query, generation):
+    """Number of songs matching query, counted once per catalog generation in this worker."""
+    key = search_index.normalize(query)
+    cached = _search_counts.get(key)
+    if cached is not None and cached[0] == generation:
+        return cached[1]
+
+    total = search_index.count(conn, query)
+    if len(_search_counts) >= SEARCH_COUNT_CACHE_SIZE:
+        _search_counts.clear()
+    _search_counts[key] = (generation, total)
+    return total
+
+
+def get_song_by_filename(filename):
+    """Return a song stored under the given audio file name (preferring one with a YouTube URL), or None."""
+    row = _connect().execute(
+        'SELECT * FROM songs WHERE filename = ? ORDER BY youtube_url IS NULL, id LIMIT 1', (filename,)
+    ).fetchone()
+    return _row_to_song(row)
+
+
+def get_song_by_video_id(video_id):
+    """Return the first song downloaded from the given YouTube video, or None."""
+    row = _connect().execute(
+        'SELECT * FROM songs WHERE video_id = ? ORDER BY id LIMIT 1', (video_id,)
+    ).fetchone()
+    return _row_to_song(row)
+
+
+# ============ WRITES ============
+
+def _insert_song(conn, song, now):
+    unknown = set(song) - set(SONG_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown song fields: {', '.join(sorted(unknown))}")
+    song = dict(song)
+    if not song.get('video_id'):
+        song['video_id'] = extract_video_id(song.get('youtube_url'))
+    columns = [name for name in SONG_FIELDS if name in song] + ['created_at']
+    cursor = conn.execute(
+        f"INSERT INTO songs ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+        [song[name] for name in columns[:-1]] + [now]
+    )
+    search_index.index_song(conn, cursor.lastrowid, song)
+    return cursor.lastrowid
+
+
+def add_song(display_name, filename, youtube_url=None, thumbnail=None, search_query=None, video_id=None, **fields):
+    """Insert a new song and return its id."""
+    song = dict(fields, display_name=display_name, filename=filename, youtube_url=youtube_url,
+                thumbnail=thumbnail, search_query=search_query, video_id=video_id)
+    with _transaction() as conn:
+        song_id = _insert_song(conn, song, time.time())
+        _bump_generation(conn)
+        return song_id
+
+
+def add_songs(songs):
+    """Insert several songs (dicts of song fields) in one transaction and return their ids, in order."""
+    song_ids = []
+    if not songs:
+        return song_ids
+    now = time.time()
+    with _transaction() as conn:
+        for song in songs:
+            song_ids.append(_insert_song(conn, song, now))
+        _bump_generation(conn)
+    return song_ids
+
+
+def _reindex_if_searchable(conn, song_id, fields):
+    if 'display_name' in fields or 'search_query' in fields:
+        row = conn.execute('SELECT display_name, search_query FROM songs WHERE id = ?', (song_id,)).fetchone()
+        if row is not None:
+            search_index.index_song(conn, song_id, dict(row))
+
+
+def update_song(song_id, **fields):
+    """Update the given fields of a song. Returns False if the song does not exist."""
+    unknown = set(fields) - set(SONG_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown song fields: {', '.join(sorted(unknown))}")
+    if not fields:
+        return get_song(song_id) is not None
+
+    assignments = ', '.join(f"{name} = ?" for name in fields)
+    with _transaction() as conn:
+        cursor = conn.execute(
+            f'UPDATE songs SET {assignments} WHERE id = ?',
+            (*fields.values(), song_id)
+        )
+        if cursor.rowcount != 1:
+            return False
+        _reindex_if_searchable(conn, song_id, fields)
+        _bump_generation(conn)
+        return True
+
+
+def update_songs(updates):
+    """Apply {song_id: {field: value}} updates in one transaction. Returns the number of songs changed."""
+    changed = 0
+    if not updates:
+        return changed
+    with _transaction() as conn:
+        for song_id, fields in updates.items():
+            unknown = set(fields) - set(SONG_FIELDS)
+            if unknown:
+                raise ValueError(f"Unknown song fields: {', '.join(sorted(unknown))}")
+            if not fields:
+                continue
+            assignments = ', '.join(f"{name} = ?" for name in fields)
+            cursor = conn.execute(
+                f'UPDATE songs SET {assignments} WHERE id = ?', (*fields.values(), song_id)
+            )
+            changed += cursor.rowcount
+            _reindex_if_searchable(conn, song_id, fields)
+        if changed:
+            _bump_generation(conn)
+    return changed
+
+
+def update_songs_with_file(filename, **fields):
+    """Update every song stored under an audio filename. Returns the number of songs changed."""
+    return update_files([(filename, fields)])
+
+
+def update_files(updates):
+    """
+    Apply (filename, fields) updates to the songs stored under each audio
+    filename, in one transaction. Returns the number of songs changed.
+    """
+    changed = 0
+    with _transaction() as conn:
+        for filename, fields in updates:
+            unknown = set(fields) - set(SONG_FIELDS)
+            if unknown:
+                raise ValueError(f"Unknown song fields: {', '.join(sorted(unknown))}")
+            assignments = ', '.join(f"{name} = ?" for name in fields)
+            changed += conn.execute(
+                f'UPDATE songs SET {assignments} WHERE filename = ?', (*fields.values(), filename)
+            ).rowcount
+        if changed:
+            _bump_generation(conn)
+    return changed
+
+
+def clear_file_reference(column, name):
+    """Set a file column to NULL wherever it holds name (the file is gone). Returns the number of songs changed."""
+    if column not in FILE_COLUMNS or column == 'filename':
+        raise ValueError(f"Cannot clear {column}")
+    with _transaction() as conn:
+        cursor = conn.execute(f'UPDATE songs SET {column} = NULL WHERE {column} = ?', (name,))
+        if cursor.rowcount:
+            _bump_generation(conn)
+        return cursor.rowcount
+
+
+def _file_references(conn, filename):
+    """Number of songs referencing a file name in any file column."""
+    return sum(
+        conn.execute(f'SELECT COUNT(*) FROM songs WHERE {column} = ?', (filename,)).fetchone()[0]
+        for column in FILE_COLUMNS
+    )
+
+
+def delete_song(song_id):
+    """
+    Delete a song and return the removed row, or None if it did not exist.
+
+    Audio and thumbnail files can be shared by several songs, so the returned
+    row has an 'orphaned_files' dict ({column: file name}) of the files that
+    no remaining song references. Only those are safe to remove from disk.
+    """
+    with _transaction() as conn:
+        row = conn.execute('SELECT * FROM songs WHERE id = ?', (song_id,)).fetchone()
+        if row is None:
+            return None
+        conn.execute('DELETE FROM songs WHERE id = ?', (song_id,))
+        search_index.remove_song(conn, song_id)
+        _bump_generation(conn)
+
+        song = _row_to_song(row)
+        song['orphaned_files'] = {
+            column: song[column] for column in FILE_COLUMNS
+            if song[column] and _file_references(conn, song[column]) == 0
+        }
+        return song
+
+
+# ============ LEGACY IMPORT ============
+
+def import_json(data_file):
+    """
+    Import songs from the legacy data.json format.
+
+    Runs at most once per database: the import is recorded in the meta table,
+    so songs deleted later are not resurrected on the next start. Returns the
+    number of imported songs.
+    """
+    data_file = Path(data_file)
+    if not data_file.exists():
+        return 0
+
+    with open(data_file, 'r') as f:
+        data = json.load(f)
+
+    with _transaction() as conn:
+        already = conn.execute("SELECT value FROM meta WHERE key = 'json_imported'").fetchone()
+        if already is not None:
+            return 0
+
+        now = time.time()
+        songs = data.get('songs', [])
+        for song in songs:
+            _insert_song(conn, {
+                'display_name': song.get('display_name', ''),
+                'filename': song.get('filename', ''),
+                'youtube_url': song.get('youtube_url'),
+                'thumbnail': song.get('thumbnail'),
+                'search_query': song.get('search_query'),
+            }, now)
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('json_imported', ?)",
+            (json.dumps({'file': str(data_file), 'songs': len(songs), 'at': now}),)
+        )
+        _bump_generation(conn)
+        return len(songs)
@@ -0,0 +1,60 @@
+"""
+Shared SQLite plumbing for the persistent-disk databases.
+
+Each Database keeps one connection per thread (reopened after gunicorn
+forks a worker), runs in WAL mode so readers never block the writer, and
+serializes writers across workers with BEGIN IMMEDIATE transactions.
+"""
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+
+class Database:
+    """A SQLite database file shared by all gunicorn workers."""
+
+    def __init__(self, path, schema=''):
+        self.path = Path(path)
+        self._local = threading.local()
+        if schema:
+            self.connect().executescript(schema)
+
+    def connect(self):
+        """Return this thread's connection, reopening it after a fork."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(str(self.path), timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=30000')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """Run a block as a single write transaction, serialized across workers."""
+        conn = self.connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    @contextmanager
+    def snapshot(self):
+        """Run several reads against one consistent view of the database."""
+        conn = self.connect()
+        conn.execute('BEGIN')
+        try:
+            yield conn
+        finally:
+            conn.execute('COMMIT')
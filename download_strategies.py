@@ -0,0 +1,159 @@
+"""
+Adaptive ordering of the yt-dlp cookie strategies.
+
+download_from_youtube() can authenticate in several ways (cookies.txt,
+Chrome cookies, no authentication). Trying them in a fixed order means a
+stale cookies.txt costs a full failed yt-dlp attempt on every download.
+This module remembers, across all gunicorn workers (in cache.db), how each
+strategy has been doing:
+
+- the strategy that succeeded most recently is tried first
+- a strategy that failed failure_threshold times in a row is skipped for
+  cooldown_seconds (circuit breaker), then given one more try
+- attempts, successes and total latency are kept for the cookies page
+
+The state is reset whenever the admin uploads or deletes cookies.txt.
+"""
+
+import logging
+import time
+
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS download_strategies (
+    name TEXT PRIMARY KEY,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    successes INTEGER NOT NULL DEFAULT 0,
+    consecutive_failures INTEGER NOT NULL DEFAULT 0,
+    total_seconds REAL NOT NULL DEFAULT 0,
+    success_seconds REAL NOT NULL DEFAULT 0,
+    last_success_at REAL,
+    last_failure_at REAL,
+    open_until REAL,
+    last_error TEXT
+);
+"""
+
+_db = None
+_failure_threshold = 3
+_cooldown_seconds = 15 * 60
+
+
+def init(db_path, failure_threshold=_failure_threshold, cooldown_seconds=_cooldown_seconds):
+    """Open the strategy state database and set the circuit breaker limits."""
+    global _db, _failure_threshold, _cooldown_seconds
+    _db = Database(db_path, SCHEMA)
+    _failure_threshold = max(1, failure_threshold)
+    _cooldown_seconds = cooldown_seconds
+
+
+def _states():
+    rows = _db.connect().execute('SELECT * FROM download_strategies').fetchall()
+    return {row['name']: dict(row) for row in rows}
+
+
+def order(strategies):
+    """
+    Reorder [(name, opts), ...] for the next download.
+
+    The most recently successful strategy goes first and strategies with an
+    open circuit are dropped. If every circuit is open, all strategies are
+    tried in their default order rather than failing without an attempt.
+    """
+    states = _states()
+    now = time.time()
+
+    def is_open(name):
+        state = states.get(name)
+        return bool(state and state['open_until'] and state['open_until'] > now)
+
+    available = [strategy for strategy in strategies if not is_open(strategy[0])]
+    skipped = [name for name, _ in strategies if is_open(name)]
+    if not available:
+        logger.warning("All strategies are cooling down - trying all of them")
+        return list(strategies)
+    if skipped:
+        logger.info("Skipping strategies with an open circuit: %s", ', '.join(skipped))
+
+    def last_success(strategy):
+        state = states.get(strategy[0])
+        return state['last_success_at'] if state and state['last_success_at'] else 0
+
+    preferred = max(available, key=last_success)
+    if last_success(preferred):
+        available.remove(preferred)
+        available.insert(0, preferred)
+    return available
+
+
+def record_success(name, seconds):
+    """Remember that a strategy worked, closing its circuit."""
+    now = time.time()
+    with _db.transaction() as conn:
+        conn.execute(
+            'INSERT INTO download_strategies (name) VALUES (?) ON CONFLICT(name) DO NOTHING', (name,)
+        )
+        conn.execute(
+            'UPDATE download_strategies SET attempts = attempts + 1, successes = successes + 1, '
+            'consecutive_failures = 0, total_seconds = total_seconds + ?, '
+            'success_seconds = success_seconds + ?, last_success_at = ?, open_until = NULL '
+            'WHERE name = ?',
+            (seconds, seconds, now, name)
+        )
+
+
+def record_failure(name, seconds, error):
+    """Remember that a strategy failed, opening its circuit after repeated failures."""
+    now = time.time()
+    with _db.transaction() as conn:
+        conn.execute(
+            'INSERT INTO download_strategies (name) VALUES (?) ON CONFLICT(name) DO NOTHING', (name,)
+        )
+        conn.execute(
+            'UPDATE download_strategies SET attempts = attempts + 1, '
+            'consecutive_failures = consecutive_failures + 1, total_seconds = total_seconds + ?, '
+            'last_failure_at = ?, last_error = ? WHERE name = ?',
+            (seconds, now, str(error)[:500], name)
+        )
+        failures = conn.execute(
+            'SELECT consecutive_failures FROM download_strategies WHERE name = ?', (name,)
+        ).fetchone()[0]
+        if failures >= _failure_threshold:
+            conn.execute(
+                'UPDATE download_strategies SET open_until = ? WHERE name = ?',
+                (now + _cooldown_seconds, name)
+            )
+            logger.warning("Strategy '%s' failed %d times in a row - skipping it for %d minutes",
+                           name, failures, _cooldown_seconds // 60)
+
+
+def reset():
+    """Forget all strategy history (e.g. after new cookies were uploaded)."""
+    with _db.transaction() as conn:
+        conn.execute('DELETE FROM download_strategies')
+    logger.info("Strategy history reset")
+
+
+def stats():
+    """Per-strategy success rate, latency and circuit state, for the admin page."""
+    now = time.time()
+    result = []
+    for state in sorted(_states().values(), key=lambda s: -(s['last_success_at'] or 0)):
+        attempts = state['attempts']
+        successes = state['successes']
+        result.append({
+            'name': state['name'],
+            'attempts': attempts,
+            'successes': successes,
+            'success_rate': round(successes * 100 / attempts) if attempts else None,
+            'avg_seconds': round(state['total_seconds'] / attempts, 1) if attempts else None,
+            'avg_success_seconds': round(state['success_seconds'] / successes, 1) if successes else None,
+            'consecutive_failures': state['consecutive_failures'],
+            'cooldown_remaining': int(state['open_until'] - now)
+            if state['open_until'] and state['open_until'] > now else 0,
+            'last_error': state['last_error'],
+        })
+    return result
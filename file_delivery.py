@@ -0,0 +1,193 @@
+"""
+Cache-friendly file responses for MP3s and thumbnails.
+
+send_file() in Flask re-sends whole files and sets no Cache-Control, so
+every seek or reconnect re-downloads the complete MP3 and every page view
+re-fetches every thumbnail. send_cached_file() adds:
+
+- strong ETags derived from the file identity (inode, size, mtime)
+- If-None-Match / If-Modified-Since handling that answers 304
+- single byte-range requests (206 / 416), honouring If-Range
+- Cache-Control chosen by the caller (immutable for content-addressed files)
+- zero-copy delivery: under gunicorn the open file is handed back through
+  wsgi.file_wrapper, which gunicorn sends with sendfile(2), also for ranges
+
+send_generated() gives the same validators and ranges to deterministic
+content built on the fly (the ZIP export).
+"""
+
+import io
+import os
+import re
+import unicodedata
+from urllib.parse import quote
+
+from flask import Response, request
+from werkzeug.http import dump_options_header, http_date, is_resource_modified, quote_etag
+
+CHUNK_SIZE = 64 * 1024
+
+# WSGI servers whose wsgi.file_wrapper stops after Content-Length bytes
+LENGTH_AWARE_SERVERS = ('gunicorn', 'dumb-music-player-asgi')
+
+# Content-addressed names start with a hex content digest (see thumbnail ingest)
+CONTENT_ADDRESSED_RE = re.compile(r'^[0-9a-f]{32,64}(?:[@_.-][\w@.-]*)?$')
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def file_etag(stat):
+    """Strong validator for a file: changes whenever the file is replaced or rewritten."""
+    return f"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"
+
+
+def is_content_addressed(filename):
+    """True if the file name is derived from the file's contents and can never change."""
+    return bool(CONTENT_ADDRESSED_RE.match(os.path.basename(filename)))
+
+
+def content_disposition(download_name):
+    """Attachment header that keeps Hebrew file names intact (RFC 6266 filename*)."""
+    try:
+        download_name.encode('ascii')
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        quoted = quote(download_name, safe="!#$&+-.^_`|~")
+        return dump_options_header('attachment', {'filename': simple, 'filename*': f"UTF-8''{quoted}"})
+    return dump_options_header('attachment', {'filename': download_name})
+
+
+def _if_range_matches(etag, mtime):
+    """A Range request only applies if its If-Range validator still matches."""
+    if_range = request.if_range
+    if if_range.etag:
+        return if_range.etag == etag
+    if if_range.date:
+        return int(mtime) <= if_range.date.timestamp()
+    return True
+
+
+def _iter_file(f, length):
+    """Yield length bytes from the current position of f, then close it."""
+    try:
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def _file_body(f, start, length, file_size):
+    """Wrap an open file for the WSGI server, positioned at start."""
+    f.seek(start)
+    file_wrapper = request.environ.get('wsgi.file_wrapper')
+    # gunicorn (via sendfile when it can) and asgi.py send exactly
+    # Content-Length bytes from the file's current offset; other servers
+    # may send to EOF.
+    server = request.environ.get('SERVER_SOFTWARE', '')
+    if file_wrapper and (start + length == file_size or server.startswith(LENGTH_AWARE_SERVERS)):
+        return file_wrapper(f, CHUNK_SIZE)
+    return _iter_file(f, length)
+
+
+def _negotiate(etag, mtime, size, cache_control, download_name):
+    """
+    Validator, conditional-GET and range handling shared by the senders.
+
+    Returns (response, None) when the answer is a 304 or 416, otherwise
+    (None, (headers, start, length, status)).
+    """
+    headers = {
+        'ETag': quote_etag(etag),
+        'Last-Modified': http_date(mtime),
+        'Cache-Control': cache_control,
+        'Accept-Ranges': 'bytes',
+    }
+
+    if not is_resource_modified(request.environ, etag=etag, last_modified=http_date(mtime)):
+        return Response(status=304, headers=headers), None
+
+    if download_name:
+        headers['Content-Disposition'] = content_disposition(download_name)
+
+    start, length, status = 0, size, 200
+
+    byte_range = request.range
+    if byte_range is not None and _if_range_matches(etag, mtime):
+        if byte_range.units == 'bytes' and len(byte_range.ranges) == 1:
+            span = byte_range.range_for_length(size)
+            if span is None:
+                headers['Content-Range'] = f"bytes */{size}"
+                return Response(status=416, headers=headers), None
+            start, stop = span
+            length = stop - start
+            status = 206
+            headers['Content-Range'] = f"bytes {start}-{stop - 1}/{size}"
+        # Multiple ranges are legal to ignore: fall through to a full 200
+
+    return None, (headers, start, length, status)
+
+
+class _NotifyingFile(io.BufferedReader):
+    """A file opened for reading that calls on_close once it is closed - when the server is done sending it."""
+
+    def __init__(self, path, on_close):
+        super().__init__(io.FileIO(path, 'rb'))
+        self._on_close = on_close
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            on_close, self._on_close = self._on_close, None
+            if on_close:
+                on_close()
+
+
+def send_cached_file(path, mimetype, cache_control, download_name=None, on_close=None):
+    """
+    Serve a file with validators, conditional GET and byte-range support.
+
+    cache_control is the Cache-Control header value; download_name, if given,
+    makes the response an attachment with that file name. on_close is
+    called when the file has been sent (or the transfer given up); it is not
+    called for 304/416 answers, which send no file.
+    """
+    stat = os.stat(path)
+    response, prepared = _negotiate(file_etag(stat), stat.st_mtime, stat.st_size, cache_control, download_name)
+    if response is not None:
+        return response
+    headers, start, length, status = prepared
+
+    f = _NotifyingFile(path, on_close) if on_close else open(path, 'rb')
+    response = Response(
+        _file_body(f, start, length, stat.st_size),
+        status=status,
+        headers=headers,
+        mimetype=mimetype,
+        direct_passthrough=True,
+    )
+    response.content_length = length
+    return response
+
+
+def send_generated(body, size, etag, mtime, mimetype, cache_control, download_name=None):
+    """
+    Serve content produced on the fly, like send_cached_file().
+
+    The content must be deterministic for its etag: body(start, length)
+    yields exactly length bytes starting at offset start, so ranges of it
+    can be resumed.
+    """
+    response, prepared = _negotiate(etag, mtime, size, cache_control, download_name)
+    if response is not None:
+        return response
+    headers, start, length, status = prepared
+
+    response = Response(body(start, length), status=status, headers=headers, mimetype=mimetype)
+    response.content_length = length
+    return response
@@ -0,0 +1,134 @@
+"""
+Pre-resolved YouTube format info for the videos an admin is about to add.
+
+A download used to start from nothing: yt-dlp fetches the watch page and
+the player, extracts and selects formats, and only then moves the first
+byte of audio. On the search results page the admin almost always picks
+one of the top results, so while the page is shown those videos are
+resolved in the background (extract_info without downloading). The info
+dicts are kept in cache.db for a short TTL, keyed by video id, so any
+worker running the download job can hand them straight to yt-dlp's
+downloader.
+
+Stream URLs in the info are signed and expire, so entries live for
+minutes rather than hours. An entry is only used by the cookie strategy
+it was resolved with, and a download that fails with it is retried with
+a fresh extraction.
+"""
+
+import json
+import logging
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS resolved_formats (
+    video_id TEXT PRIMARY KEY,
+    strategy TEXT NOT NULL,
+    info BLOB NOT NULL,
+    resolve_seconds REAL NOT NULL,
+    resolved_at REAL NOT NULL
+);
+"""
+
+_db = None
+_resolve = None
+_ttl_seconds = 10 * 60
+_executor = None
+
+# Video ids being resolved by this worker
+_in_flight = set()
+_in_flight_lock = threading.Lock()
+
+
+def init(db_path, resolve, ttl_seconds=_ttl_seconds, max_workers=2):
+    """
+    Open the cache. resolve(youtube_url) returns (info, strategy name) for
+    a video, extracted without downloading.
+    """
+    global _db, _resolve, _ttl_seconds, _executor
+    _db = Database(db_path, SCHEMA)
+    _resolve = resolve
+    _ttl_seconds = ttl_seconds
+    _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='resolve')
+
+
+def _is_fresh(video_id):
+    row = _db.connect().execute(
+        'SELECT resolved_at FROM resolved_formats WHERE video_id = ?', (video_id,)
+    ).fetchone()
+    return row is not None and time.time() - row['resolved_at'] < _ttl_seconds
+
+
+def schedule(videos):
+    """Resolve search results ({'id', 'url'} dicts) in the background, unless they are cached or in progress."""
+    if _executor is None:
+        return
+    for video in videos:
+        video_id = video['id']
+        if _is_fresh(video_id):
+            continue
+        with _in_flight_lock:
+            if video_id in _in_flight:
+                continue
+            _in_flight.add(video_id)
+        _executor.submit(_resolve_into_cache, video_id, video['url'])
+
+
+def _resolve_into_cache(video_id, youtube_url):
+    start = time.perf_counter()
+    try:
+        info, strategy = _resolve(youtube_url)
+        elapsed = time.perf_counter() - start
+        put(video_id, strategy, info, elapsed)
+        logger.info("Pre-resolved formats of %s in %.2fs", video_id, elapsed, extra={'strategy': strategy})
+    except Exception as e:
+        logger.info("Pre-resolving %s failed: %s", video_id, e)
+    finally:
+        with _in_flight_lock:
+            _in_flight.discard(video_id)
+
+
+def put(video_id, strategy, info, resolve_seconds):
+    """Store a video's info dict and drop expired entries."""
+    data = zlib.compress(json.dumps(info, ensure_ascii=False).encode('utf-8'))
+    now = time.time()
+    with _db.transaction() as conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO resolved_formats (video_id, strategy, info, resolve_seconds, resolved_at) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (video_id, strategy, data, resolve_seconds, now)
+        )
+        conn.execute('DELETE FROM resolved_formats WHERE resolved_at < ?', (now - _ttl_seconds,))
+
+
+def get(video_id, strategy):
+    """The info dict of a video resolved with this strategy less than TTL seconds ago, or None."""
+    if _db is None or not video_id:
+        return None
+    row = _db.connect().execute(
+        'SELECT strategy, info, resolve_seconds, resolved_at FROM resolved_formats WHERE video_id = ?', (video_id,)
+    ).fetchone()
+    if row is None or row['strategy'] != strategy:
+        metrics.inc('format_cache_lookups_total', result='miss')
+        return None
+    if time.time() - row['resolved_at'] >= _ttl_seconds:
+        metrics.inc('format_cache_lookups_total', result='expired')
+        return None
+    metrics.inc('format_cache_lookups_total', result='hit')
+    logger.debug("Using formats of %s resolved %.0fs ago (saves ~%.2fs)",
+                 video_id, time.time() - row['resolved_at'], row['resolve_seconds'])
+    return json.loads(zlib.decompress(row['info']))
+
+
+def discard(video_id):
+    """Forget a video's info (it failed to download)."""
+    with _db.transaction() as conn:
+        conn.execute('DELETE FROM resolved_formats WHERE video_id = ?', (video_id,))
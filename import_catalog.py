@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+One-shot importer from the legacy data.json catalog into catalog.db.
+Run this on Render via Shell after deploying the SQLite catalog. The app also
+runs the same import automatically on first start if data.json is present.
+"""
+
+import os
+from pathlib import Path
+
+import catalog
+
+
+def import_catalog():
+    persistent_dir = Path(os.getenv('PERSISTENT_DATA_PATH', 'persistent_data'))
+    data_file = persistent_dir / 'data.json'
+    db_file = persistent_dir / 'catalog.db'
+
+    if not data_file.exists():
+        print(f"No {data_file} found - nothing to import")
+        return
+
+    catalog.init_db(db_file)
+    imported = catalog.import_json(data_file)
+
+    if imported:
+        print(f"✓ Imported {imported} songs from {data_file} into {db_file}")
+    else:
+        print(f"✓ {data_file} was already imported - nothing to do")
+    print(f"✓ Catalog now holds {catalog.count_songs()} songs")
+
+
+if __name__ == '__main__':
+    import_catalog()
@@ -0,0 +1,310 @@
+"""
+Persistent background job queue.
+
+Long-running admin work (YouTube downloads) is recorded as a row in jobs.db
+and executed by a small thread pool outside the request cycle. The queue is
+shared by all gunicorn workers: any worker may pick up a queued job, and a
+job only runs once because claiming it is a single conditional UPDATE. The
+number of jobs running at the same time is capped across all workers.
+
+Job states: queued -> running -> succeeded | failed.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+PENDING_STATES = (QUEUED, RUNNING)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    params TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    progress REAL,
+    downloaded_bytes INTEGER,
+    total_bytes INTEGER,
+    worker_pid INTEGER,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status);
+"""
+
+# A running job whose worker stopped reporting for this long is considered dead
+STALE_AFTER_SECONDS = 15 * 60
+
+# How often a worker refreshes updated_at of the jobs it is running
+HEARTBEAT_SECONDS = 60
+
+# Progress is written to the database at most this often per job
+PROGRESS_INTERVAL_SECONDS = 1.0
+
+_db = None
+_handlers = {}
+_max_running = 2
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+_last_progress_write = {}
+
+
+def init(db_path, handlers, max_running=2):
+    """
+    Open the job database and register job handlers.
+
+    handlers maps a job kind to a function handler(params, progress) that
+    returns a JSON-serializable result or raises on failure. progress is a
+    callable accepting percent, downloaded_bytes and total_bytes keywords.
+    """
+    global _db, _max_running
+    _db = Database(db_path, SCHEMA)
+    _handlers.update(handlers)
+    _max_running = max(1, int(max_running))
+
+
+def _get_executor():
+    """Return this process's thread pool, creating it (and its heartbeat) after a fork."""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=_max_running, thread_name_prefix='job')
+            _executor_pid = os.getpid()
+            threading.Thread(target=_heartbeat, args=(_executor,), name='job-heartbeat', daemon=True).start()
+        return _executor
+
+
+def _heartbeat(executor):
+    """
+    Keep updated_at of this process's running jobs fresh, also through long
+    stretches without progress reports, so that resume_pending() only takes
+    a job whose worker is gone.
+    """
+    pid = os.getpid()
+    while True:
+        time.sleep(HEARTBEAT_SECONDS)
+        if executor is not _executor:
+            return
+        try:
+            with _db.transaction() as conn:
+                conn.execute('UPDATE jobs SET updated_at = ? WHERE status = ? AND worker_pid = ?',
+                             (time.time(), RUNNING, pid))
+        except Exception:
+            logger.warning("Could not record the job heartbeat", exc_info=True)
+
+
+def _row_to_job(row):
+    if row is None:
+        return None
+    job = dict(row)
+    job['params'] = json.loads(job['params'])
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    end = job['finished_at'] or time.time()
+    job['elapsed'] = round(end - job['started_at'], 1) if job['started_at'] else None
+    return job
+
+
+# ============ QUEUE ============
+
+def enqueue(kind, params):
+    """Record a new job and schedule it. Returns the job id immediately."""
+    if kind not in _handlers:
+        raise ValueError(f"Unknown job kind: {kind}")
+
+    now = time.time()
+    with _db.transaction() as conn:
+        cursor = conn.execute(
+            'INSERT INTO jobs (kind, status, params, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+            (kind, QUEUED, json.dumps(params, ensure_ascii=False), now, now)
+        )
+        job_id = cursor.lastrowid
+
+    logger.info("Queued %s job %d", kind, job_id)
+    _get_executor().submit(_run, job_id)
+    return job_id
+
+
+def resume_pending():
+    """
+    Requeue jobs orphaned by dead workers and schedule every queued job.
+    Called once when a worker starts; afterwards each finished job hands
+    its slot to the oldest queued one.
+
+    A running job is orphaned when its worker process is gone, or when the
+    worker's heartbeat stopped (its pid may belong to another process now).
+    """
+    now = time.time()
+    with _db.transaction() as conn:
+        running = conn.execute(
+            'SELECT id, worker_pid, updated_at FROM jobs WHERE status = ?', (RUNNING,)
+        ).fetchall()
+        for row in running:
+            if _pid_alive(row['worker_pid']) and now - row['updated_at'] < STALE_AFTER_SECONDS:
+                continue
+            conn.execute(
+                'UPDATE jobs SET status = ?, worker_pid = NULL, updated_at = ? WHERE id = ?',
+                (QUEUED, now, row['id'])
+            )
+            logger.warning("Requeued orphaned job %d", row['id'])
+
+    queued = _db.connect().execute(
+        'SELECT id FROM jobs WHERE status = ? ORDER BY id', (QUEUED,)
+    ).fetchall()
+    for row in queued:
+        _get_executor().submit(_run, row['id'])
+    return len(queued)
+
+
+def _pid_alive(pid):
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _claim(job_id=None):
+    """
+    Atomically move a queued job (the oldest one if job_id is None) to
+    running if there is capacity. Returns the job or None.
+    """
+    now = time.time()
+    with _db.transaction() as conn:
+        running = conn.execute('SELECT COUNT(*) FROM jobs WHERE status = ?', (RUNNING,)).fetchone()[0]
+        if running >= _max_running:
+            return None
+        if job_id is None:
+            row = conn.execute('SELECT id FROM jobs WHERE status = ? ORDER BY id LIMIT 1', (QUEUED,)).fetchone()
+            if row is None:
+                return None
+            job_id = row['id']
+        cursor = conn.execute(
+            'UPDATE jobs SET status = ?, worker_pid = ?, started_at = ?, updated_at = ? '
+            'WHERE id = ? AND status = ?',
+            (RUNNING, os.getpid(), now, now, job_id, QUEUED)
+        )
+        if cursor.rowcount != 1:
+            return None
+        row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    return _row_to_job(row)
+
+
+def _run(job_id=None):
+    # Run the job, then the oldest queued ones while there are any
+    while True:
+        job = _claim(job_id)
+        if job is None:
+            # Already taken by another worker, or the pool is full - whoever
+            # finishes next picks up the oldest queued job.
+            return
+        _execute(job)
+        job_id = None
+
+
+def _execute(job):
+    job_id = job['id']
+    logger.info("Running %s job %d", job['kind'], job_id)
+    handler = _handlers[job['kind']]
+
+    def progress(percent=None, downloaded_bytes=None, total_bytes=None):
+        _report_progress(job_id, percent, downloaded_bytes, total_bytes)
+
+    try:
+        result = handler(job['params'], progress)
+    except Exception as e:
+        _finish(job_id, FAILED, error=str(e) or e.__class__.__name__)
+        logger.error("Job %d failed: %s", job_id, e, exc_info=True)
+    else:
+        _finish(job_id, SUCCEEDED, result=result)
+        logger.info("Job %d succeeded", job_id)
+    finally:
+        _last_progress_write.pop(job_id, None)
+
+
+def _report_progress(job_id, percent, downloaded_bytes, total_bytes):
+    now = time.time()
+    if percent is not None and percent < 100:
+        if now - _last_progress_write.get(job_id, 0) < PROGRESS_INTERVAL_SECONDS:
+            return
+    _last_progress_write[job_id] = now
+    with _db.transaction() as conn:
+        conn.execute(
+            'UPDATE jobs SET progress = COALESCE(?, progress), downloaded_bytes = COALESCE(?, downloaded_bytes), '
+            'total_bytes = COALESCE(?, total_bytes), updated_at = ? WHERE id = ?',
+            (percent, downloaded_bytes, total_bytes, now, job_id)
+        )
+
+
+def _finish(job_id, status, result=None, error=None):
+    now = time.time()
+    with _db.transaction() as conn:
+        conn.execute(
+            'UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, updated_at = ? WHERE id = ?',
+            (status, json.dumps(result, ensure_ascii=False) if result is not None else None,
+             error, now, now, job_id)
+        )
+
+
+# ============ STATUS ============
+
+def get_job(job_id):
+    """Return a job by id, or None."""
+    row = _db.connect().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+    return _row_to_job(row)
+
+
+def list_jobs(statuses=None, limit=50, kind=None):
+    """Return the most recent jobs, optionally filtered by status and kind."""
+    conditions = []
+    args = []
+    if statuses:
+        conditions.append(f"status IN ({', '.join('?' for _ in statuses)})")
+        args.extend(statuses)
+    if kind:
+        conditions.append('kind = ?')
+        args.append(kind)
+    query = 'SELECT * FROM jobs'
+    if conditions:
+        query += ' WHERE ' + ' AND '.join(conditions)
+    query += ' ORDER BY id DESC LIMIT ?'
+    args.append(limit)
+    rows = _db.connect().execute(query, args).fetchall()
+    return [_row_to_job(row) for row in rows]
+
+
+def count_by_status():
+    """Number of jobs in each state, e.g. {'queued': 2, 'running': 1, ...}."""
+    rows = _db.connect().execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+    counts = dict.fromkeys((QUEUED, RUNNING, SUCCEEDED, FAILED), 0)
+    counts.update({status: count for status, count in rows})
+    return counts
+
+
+def list_recent_failures(max_age_seconds=24 * 60 * 60, limit=10):
+    """Return jobs that failed recently, newest first."""
+    rows = _db.connect().execute(
+        'SELECT * FROM jobs WHERE status = ? AND finished_at > ? ORDER BY id DESC LIMIT ?',
+        (FAILED, time.time() - max_age_seconds, limit)
+    ).fetchall()
+    return [_row_to_job(row) for row in rows]
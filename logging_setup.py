@@ -0,0 +1,97 @@
+"""
+Leveled, structured logging that never blocks a request on stdout.
+
+configure() routes every log record through a QueueHandler; a background
+QueueListener thread formats the records and writes them to stdout. A
+request thread only pays for putting the record on an in-memory queue.
+
+Records are formatted as one line each, either as text
+
+    2026-01-01 12:00:00,000 INFO app: Download queued job_id=12
+
+or, with LOG_FORMAT=json, as JSON objects. Values passed in a record's
+``extra`` dict are appended as key=value pairs (text) or fields (json).
+"""
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+# Attributes every LogRecord has; anything else came from extra={...}
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+
+
+def _extra_fields(record):
+    return {key: value for key, value in vars(record).items() if key not in _STANDARD_ATTRS}
+
+
+class TextFormatter(logging.Formatter):
+    """`time LEVEL logger: message key=value ...`"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record):
+        line = super().format(record)
+        fields = _extra_fields(record)
+        if fields:
+            line += ' ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for log pipelines."""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update(_extra_fields(record))
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def _start_listener():
+    global _listener
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if os.getenv('LOG_FORMAT') == 'json' else TextFormatter())
+    log_queue = queue.SimpleQueue()
+
+    root = logging.getLogger()
+    for old in list(root.handlers):
+        root.removeHandler(old)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def configure(level=None):
+    """
+    Send all logging through a non-blocking queue (see module docstring).
+
+    level defaults to the LOG_LEVEL environment variable, or INFO. Safe to
+    call more than once; the listener thread is restarted in forked children.
+    """
+    logging.getLogger().setLevel((level or os.getenv('LOG_LEVEL', 'INFO')).upper())
+    if _listener is not None:
+        return
+    _start_listener()
+    atexit.register(_stop_listener)
+    # The listener thread does not survive a fork (e.g. gunicorn --preload)
+    os.register_at_fork(after_in_child=_start_listener)
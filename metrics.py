@@ -0,0 +1,205 @@
+"""
+Request latency and work counters, exported in Prometheus text format.
+
+Recording is cheap and local: counters and histogram buckets accumulate
+in a per-process dict. Every flush_interval seconds (checked when
+something is recorded) the pending increments are added to metrics.db in
+one transaction, so /metrics - served by any gunicorn worker - reports
+the totals of all workers.
+
+Metric families are declared in DEFINITIONS; recording an undeclared
+name raises KeyError so typos do not silently create new series.
+"""
+
+import atexit
+import logging
+import threading
+import time
+
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metrics (
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (name, labels)
+);
+"""
+
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SLOW_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+
+# name: (type, help, histogram buckets)
+DEFINITIONS = {
+    'http_requests_total': (
+        'counter', 'Requests by endpoint, method and status code', None),
+    'http_request_duration_seconds': (
+        'histogram', 'Request latency by endpoint, until the body is sent (file responses: until hand-off)', HTTP_BUCKETS),
+    'http_response_bytes_total': (
+        'counter', 'Bytes served in responses with a known length, by endpoint', None),
+    'admission_rejected_total': (
+        'counter', 'Public file requests turned away, by lane and reason (rate_limit: 429, busy/queue_timeout: 503)', None),
+    'admission_queued_total': (
+        'counter', 'Large transfers that waited for a free slot, by lane and outcome', None),
+    'admission_queue_wait_seconds': (
+        'histogram', 'Time large transfers waited for a free slot', HTTP_BUCKETS),
+    'ytdlp_search_duration_seconds': (
+        'histogram', 'yt-dlp YouTube searches (cache misses only)', SLOW_BUCKETS),
+    'ytdlp_download_duration_seconds': (
+        'histogram', 'yt-dlp download attempts by cookie strategy and outcome', SLOW_BUCKETS),
+    'ytdlp_download_ttfb_seconds': (
+        'histogram', 'Time from the start of a download attempt to its first audio byte, '
+                     'by whether its formats were pre-resolved', SLOW_BUCKETS),
+    'download_resumes_total': (
+        'counter', 'Download attempts that continued a partial file left by an earlier attempt', None),
+    'download_throttle_seconds_total': (
+        'counter', 'Time downloads spent waiting for the shared DOWNLOAD_BANDWIDTH_KBPS budget', None),
+    'format_cache_lookups_total': (
+        'counter', 'Pre-resolved format lookups by downloads: hit, miss or expired', None),
+    'ffmpeg_duration_seconds': (
+        'histogram', 'ffmpeg post-processing run by yt-dlp, by postprocessor', SLOW_BUCKETS),
+    'search_cache_lookups_total': (
+        'counter', 'YouTube search cache lookups by result (hit/miss)', None),
+    'storage_evictions_total': (
+        'counter', 'Audio files evicted from downloads/ to stay within STORAGE_QUOTA_MB', None),
+    'storage_refetches_total': (
+        'counter', 'Evicted audio files downloaded again on request, by outcome', None),
+    'static_page_lookups_total': (
+        'counter', 'Homepage requests served pre-rendered (hit) or rendered dynamically (miss)', None),
+}
+
+_db = None
+_flush_interval = 5.0
+
+_lock = threading.Lock()
+_pending = {}
+_last_flush = time.monotonic()
+
+
+def init(db_path, flush_interval=_flush_interval):
+    """Open the shared metrics database and set how often increments are flushed."""
+    global _db, _flush_interval
+    _db = Database(db_path, SCHEMA)
+    _flush_interval = flush_interval
+    atexit.register(flush)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    return ','.join(f'{key}="{_escape(value)}"' for key, value in labels)
+
+
+def _add(updates):
+    with _lock:
+        for key, delta in updates:
+            _pending[key] = _pending.get(key, 0) + delta
+        due = time.monotonic() - _last_flush >= _flush_interval
+    if due:
+        flush()
+
+
+def inc(name, value=1, **labels):
+    """Add to a counter."""
+    if DEFINITIONS[name][0] != 'counter':
+        raise ValueError(f'{name} is not a counter')
+    _add([((name, _format_labels(sorted(labels.items()))), value)])
+
+
+def observe(name, seconds, **labels):
+    """Record one observation in a histogram."""
+    kind, _, buckets = DEFINITIONS[name]
+    if kind != 'histogram':
+        raise ValueError(f'{name} is not a histogram')
+    labels = sorted(labels.items())
+    base = _format_labels(labels)
+    updates = [
+        ((f'{name}_bucket', _format_labels(labels + [('le', bound)])), 1)
+        for bound in buckets if seconds <= bound
+    ]
+    updates.append(((f'{name}_bucket', _format_labels(labels + [('le', '+Inf')])), 1))
+    updates.append(((f'{name}_sum', base), seconds))
+    updates.append(((f'{name}_count', base), 1))
+    _add(updates)
+
+
+def flush():
+    """Add this process's pending increments to the shared totals."""
+    global _pending, _last_flush
+    with _lock:
+        pending, _pending = _pending, {}
+        _last_flush = time.monotonic()
+    if not pending or _db is None:
+        return
+
+    try:
+        with _db.transaction() as conn:
+            conn.executemany(
+                'INSERT INTO metrics (name, labels, value) VALUES (?, ?, ?) '
+                'ON CONFLICT(name, labels) DO UPDATE SET value = value + excluded.value',
+                [(name, labels, delta) for (name, labels), delta in pending.items()]
+            )
+    except Exception:
+        logger.warning('Could not flush metrics, keeping them for the next flush', exc_info=True)
+        with _lock:
+            for key, delta in pending.items():
+                _pending[key] = _pending.get(key, 0) + delta
+
+
+def _family(series_name):
+    for suffix in ('_bucket', '_sum', '_count'):
+        if series_name.endswith(suffix) and series_name[:-len(suffix)] in DEFINITIONS:
+            return series_name[:-len(suffix)]
+    return series_name
+
+
+def _series_order(row):
+    name, labels, _ = row
+    # Buckets in increasing le order, then _sum and _count
+    le = float('inf')
+    if 'le="' in labels:
+        bound = labels.rsplit('le="', 1)[1].rstrip('"')
+        le = float(bound) if bound != '+Inf' else float('inf')
+        labels = labels.rsplit('le="', 1)[0].rstrip(',')
+    return labels, {'_bucket': 0, '_sum': 1, '_count': 2}.get(name[len(_family(name)):], 0), le
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+def render(gauges=()):
+    """
+    All metrics in Prometheus text format, summed over every worker.
+
+    gauges are extra point-in-time values computed by the caller, as
+    (name, help, [(labels dict, value), ...]).
+    """
+    flush()
+    rows = _db.connect().execute('SELECT name, labels, value FROM metrics').fetchall()
+    families = {}
+    for row in rows:
+        families.setdefault(_family(row['name']), []).append(tuple(row))
+
+    lines = []
+    for name, (kind, help_text, _) in DEFINITIONS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for series_name, labels, value in sorted(families.get(name, []), key=_series_order):
+            lines.append(f'{series_name}{{{labels}}} {_format_value(value)}' if labels
+                         else f'{series_name} {_format_value(value)}')
+
+    for name, help_text, samples in gauges:
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} gauge')
+        for labels, value in samples:
+            labels = _format_labels(sorted(labels.items()))
+            lines.append(f'{name}{{{labels}}} {_format_value(value)}' if labels
+                         else f'{name} {_format_value(value)}')
+
+    return '\n'.join(lines) + '\n'
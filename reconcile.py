@@ -0,0 +1,345 @@
+#!/usr/bin/env python3
+"""
+Consistency check of the stored files against the catalog.
+
+Over time downloads/, thumbnails/ and streams/ drift from catalog.db: a
+worker killed mid-download leaves its temporary files behind, and a file
+that vanished or rotted on disk only shows up as a 404 or a song that
+does not play. scan() compares the three directories with the catalog
+and reports:
+
+- missing: files a song refers to that are not on disk. Audio of songs
+  with a YouTube URL is listed separately as refetchable - it is
+  downloaded again the next time someone asks for it (see storage.py)
+- orphans: files and stream directories no song refers to
+- partial: temporary files of interrupted downloads, thumbnail ingests
+  and stream builds
+- invalid: audio and thumbnails whose first bytes do not match their
+  extension (empty, truncated or overwritten files)
+- corrupt: with checksums, files whose content changed although their
+  size and mtime did not (bit-rot)
+
+The directories are listed in parallel and files are read by a thread
+pool. The outcome of each check is kept in cache.db with the file's size
+and mtime, so a repeat scan only reads the files that changed (or every
+file, to compare checksums). Files younger than GRACE_SECONDS are left
+alone: they may belong to a download that is still running.
+
+repair() deletes orphans, partial files and invalid or corrupt audio of
+songs that can be fetched again, and drops references to missing
+thumbnails.
+
+    python reconcile.py [--repair] [--checksums]
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import catalog
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_checks (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    valid INTEGER NOT NULL,
+    sha256 TEXT
+);
+"""
+
+# Unreferenced files this recent may still be on their way into the catalog
+GRACE_SECONDS = 60 * 60
+
+# yt-dlp's in-progress downloads; .source is a thumbnail before ingest
+PARTIAL_SUFFIXES = ('.part', '.ytdl', '.temp', '.tmp', '.source')
+
+# Bytes read to recognize a file type
+HEAD_BYTES = 12
+
+_FILE_TYPES = {
+    '.mp3': lambda head: head.startswith(b'ID3') or (len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0),
+    '.m4a': lambda head: head[4:8] == b'ftyp',
+    '.aac': lambda head: len(head) > 1 and head[0] == 0xFF and head[1] & 0xF0 == 0xF0,
+    '.opus': lambda head: head.startswith(b'OggS'),
+    '.ogg': lambda head: head.startswith(b'OggS'),
+    '.webm': lambda head: head.startswith(b'\x1a\x45\xdf\xa3'),
+    '.jpg': lambda head: head.startswith(b'\xff\xd8\xff'),
+    '.png': lambda head: head.startswith(b'\x89PNG\r\n\x1a\n'),
+    '.gif': lambda head: head.startswith(b'GIF8'),
+    '.webp': lambda head: head[:4] == b'RIFF' and head[8:12] == b'WEBP',
+}
+
+_db = None
+_dirs = {}
+
+
+def init(db_path, downloads_dir, thumbnails_dir, streams_dir):
+    """Open the check cache and set the directories to scan."""
+    global _db, _dirs
+    _db = Database(db_path, SCHEMA)
+    _dirs = {
+        'downloads': Path(downloads_dir),
+        'thumbnails': Path(thumbnails_dir),
+        'streams': Path(streams_dir),
+    }
+
+
+def _list(directory):
+    """{name: (size, mtime_ns, is_file)} of a directory's entries."""
+    entries = {}
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                entries[entry.name] = (stat.st_size, stat.st_mtime_ns, entry.is_file(follow_symlinks=False))
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def _is_partial(name):
+    return (name.startswith('.') and not name.endswith('.lock')) or name.endswith(PARTIAL_SUFFIXES) \
+        or '.part-Frag' in name
+
+
+def _check(path, checksums):
+    """(valid, sha256 or None) of a file's content."""
+    check_type = _FILE_TYPES.get(path.suffix.lower())
+    digest = hashlib.sha256() if checksums else None
+    with open(path, 'rb') as f:
+        head = f.read(HEAD_BYTES)
+        valid = bool(head) and (check_type is None or check_type(head))
+        if digest is not None:
+            digest.update(head)
+            while True:
+                chunk = f.read(1024 * 1024)
+                if not chunk:
+                    break
+                digest.update(chunk)
+    return valid, digest.hexdigest() if digest is not None else None
+
+
+def _entry_size(directory, name, is_file, size):
+    if is_file:
+        return size
+    return sum(path.stat().st_size for path in (directory / name).rglob('*') if path.is_file())
+
+
+def scan(checksums=False, workers=4, progress=None):
+    """
+    Compare the stored files with the catalog and return a report (a dict
+    of lists, see the module docstring). progress(percent) is called while
+    files are being read.
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(_dirs)) as pool:
+        listings = dict(zip(_dirs, pool.map(_list, _dirs.values())))
+    # The catalog is read after the listing: a file stored and added in between is referenced
+    songs = catalog.list_songs()
+    now_ns = time.time_ns()
+
+    def is_recent(mtime_ns):
+        return now_ns - mtime_ns < GRACE_SECONDS * 1_000_000_000
+
+    references = {'downloads': {}, 'thumbnails': {}}
+    for song in songs:
+        for column in catalog.FILE_COLUMNS:
+            if song[column]:
+                label = 'downloads' if column == 'filename' else 'thumbnails'
+                references[label].setdefault(song[column], []).append((song, column))
+    stream_stems = {Path(name).stem for name in references['downloads']}
+
+    report = {'missing': [], 'refetchable': [], 'orphans': [], 'partial': [], 'invalid': [], 'corrupt': []}
+
+    for label, refs in references.items():
+        for name, users in refs.items():
+            if name in listings[label]:
+                continue
+            for song, column in users:
+                item = {'song_id': song['id'], 'title': song['display_name'], 'column': column, 'name': name}
+                if column == 'filename' and song['youtube_url']:
+                    report['refetchable'].append(item)
+                else:
+                    report['missing'].append(item)
+
+    to_check = []
+    for label, entries in listings.items():
+        directory = _dirs[label]
+        for name, (size, mtime_ns, is_file) in entries.items():
+            if label == 'streams':
+                referenced = name in stream_stems
+            else:
+                referenced = is_file and name in references[label]
+            if referenced and not _is_partial(name):
+                if label != 'streams':
+                    to_check.append((label, name, size, mtime_ns))
+                continue
+            if name.endswith('.lock') or is_recent(mtime_ns):
+                continue
+            kind = 'partial' if _is_partial(name) else 'orphans'
+            report[kind].append({'path': f'{label}/{name}', 'bytes': _entry_size(directory, name, is_file, size)})
+
+    cached = {row['path']: row for row in _db.connect().execute('SELECT * FROM file_checks')}
+    pending = []
+    reused = 0
+    for label, name, size, mtime_ns in to_check:
+        key = f'{label}/{name}'
+        row = cached.get(key)
+        unchanged = row is not None and row['size'] == size and row['mtime_ns'] == mtime_ns
+        if unchanged and not checksums:
+            reused += 1
+            if not row['valid']:
+                report['invalid'].append(_problem(key, size, references[label][name]))
+            continue
+        pending.append((key, _dirs[label] / name, size, mtime_ns, row if unchanged else None))
+
+    updates = []
+
+    def check(item):
+        key, path, size, mtime_ns, row = item
+        try:
+            return item, _check(path, checksums)
+        except OSError:
+            return item, None  # deleted since the listing
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for done, (item, result) in enumerate(pool.map(check, pending), 1):
+            if progress and done % 50 == 0:
+                progress(percent=100.0 * done / len(pending))
+            if result is None:
+                continue
+            key, path, size, mtime_ns, row = item
+            valid, sha256 = result
+            label, name = key.split('/', 1)
+            if not valid:
+                report['invalid'].append(_problem(key, size, references[label][name]))
+            if row is not None and row['sha256'] and sha256 and row['sha256'] != sha256:
+                report['corrupt'].append(_problem(key, size, references[label][name]))
+                # Keep the first checksum, so the file stays flagged until it is replaced
+                sha256 = row['sha256']
+            elif sha256 is None and row is not None:
+                sha256 = row['sha256']
+            updates.append((key, size, mtime_ns, int(valid), sha256))
+
+    with _db.transaction() as conn:
+        conn.executemany(
+            'INSERT OR REPLACE INTO file_checks (path, size, mtime_ns, valid, sha256) VALUES (?, ?, ?, ?, ?)',
+            updates
+        )
+        present = {f'{label}/{name}' for label, name, _, _ in to_check}
+        conn.executemany('DELETE FROM file_checks WHERE path = ?',
+                         [(key,) for key in cached if key not in present])
+
+    report['scanned'] = {label: len(entries) for label, entries in listings.items()}
+    report['files_read'] = len(pending)
+    report['files_cached'] = reused
+    report['reclaimable_bytes'] = sum(item['bytes'] for kind in ('orphans', 'partial') for item in report[kind])
+    report['seconds'] = round(time.perf_counter() - start, 2)
+    logger.info("Storage scan: %d missing, %d refetchable, %d orphans, %d partial, %d invalid, %d corrupt "
+                "(%d files read, %d from cache) in %.2fs",
+                *(len(report[kind]) for kind in ('missing', 'refetchable', 'orphans', 'partial', 'invalid', 'corrupt')),
+                len(pending), reused, report['seconds'])
+    return report
+
+
+def _problem(key, size, users):
+    return {
+        'path': key,
+        'bytes': size,
+        'song_ids': [song['id'] for song, _ in users],
+        'refetchable': all(column == 'filename' and song['youtube_url'] for song, column in users),
+    }
+
+
+def _remove(key):
+    path = _dirs[key.split('/', 1)[0]] / key.split('/', 1)[1]
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+
+
+def repair(report):
+    """
+    Fix what a scan() report found that can be fixed safely. Returns a
+    dict of the removed paths, the cleared thumbnail references and the
+    bytes reclaimed.
+    """
+    removed = []
+    reclaimed = 0
+    for item in report['orphans'] + report['partial']:
+        _remove(item['path'])
+        removed.append(item['path'])
+        reclaimed += item['bytes']
+
+    # Bad audio of songs with a YouTube URL is downloaded again on the next request
+    seen = set()
+    for item in report['invalid'] + report['corrupt']:
+        if item['refetchable'] and item['path'] not in seen:
+            seen.add(item['path'])
+            _remove(item['path'])
+            removed.append(item['path'])
+            reclaimed += item['bytes']
+
+    cleared = 0
+    for item in report['missing']:
+        if item['column'] != 'filename':
+            cleared += catalog.clear_file_reference(item['column'], item['name'])
+
+    with _db.transaction() as conn:
+        conn.executemany('DELETE FROM file_checks WHERE path = ?', [(key,) for key in removed])
+    for key in removed:
+        logger.info("Removed %s", key)
+    return {'removed': removed, 'cleared_references': cleared, 'reclaimed_bytes': reclaimed}
+
+
+def _print_report(report, result):
+    for kind, title in (('missing', 'Missing files'), ('refetchable', 'Audio to fetch again on demand'),
+                        ('invalid', 'Invalid files'), ('corrupt', 'Changed content (bit-rot)')):
+        for item in report[kind]:
+            detail = f"song {item['song_id']} ({item['title']})" if 'song_id' in item else f"songs {item['song_ids']}"
+            print(f"{title}: {item.get('path') or item['name']} - {detail}")
+    for kind, title in (('orphans', 'Orphan'), ('partial', 'Partial')):
+        for item in report[kind]:
+            print(f"{title}: {item['path']} ({item['bytes'] / (1024 * 1024):.1f} MB)")
+    print(f"Scanned {report['scanned']} in {report['seconds']}s "
+          f"({report['files_read']} files read, {report['files_cached']} unchanged)")
+    if result is None:
+        print(f"{report['reclaimable_bytes'] / (1024 * 1024):.1f} MB reclaimable - run with --repair to remove")
+    else:
+        print(f"Removed {len(result['removed'])} entries, reclaimed {result['reclaimed_bytes'] / (1024 * 1024):.1f} MB, "
+              f"cleared {result['cleared_references']} thumbnail references")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repair', action='store_true', help='remove orphans and leftovers (default: report only)')
+    parser.add_argument('--checksums', action='store_true', help='hash every file to detect bit-rot (slow)')
+    parser.add_argument('--workers', type=int, default=4, help='files read in parallel (default 4)')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    persistent_dir = Path(os.getenv('PERSISTENT_DATA_PATH', 'persistent_data'))
+    catalog.init_db(persistent_dir / 'catalog.db')
+    init(persistent_dir / 'cache.db', persistent_dir / 'downloads', persistent_dir / 'thumbnails',
+         persistent_dir / 'streams')
+    scan_report = scan(checksums=args.checksums, workers=args.workers)
+    repair_result = repair(scan_report) if args.repair else None
+    if args.json:
+        print(json.dumps({'report': scan_report, 'repair': repair_result}, indent=2, ensure_ascii=False))
+    else:
+        _print_report(scan_report, repair_result)
@@ -0,0 +1,136 @@
+"""
+Shared TTL/LRU cache for YouTube search results.
+
+A ytsearch through yt-dlp takes seconds, and the admin flow often repeats
+the exact same search (re-opening results after a failed download, going
+back to the results page). Results are kept in cache.db on the persistent
+disk, so every gunicorn worker shares them and they survive restarts.
+
+Entries are keyed by the normalized query and the number of results,
+expire after a TTL, and the least recently used entries are evicted once
+the cache exceeds its entry or byte budget.
+"""
+
+import json
+import logging
+import re
+import threading
+import time
+import unicodedata
+
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS search_cache (
+    key TEXT PRIMARY KEY,
+    results TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    fetch_seconds REAL NOT NULL,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_search_cache_last_used ON search_cache(last_used_at);
+"""
+
+_db = None
+_ttl_seconds = 6 * 60 * 60
+_max_entries = 500
+_max_bytes = 5 * 1024 * 1024
+
+# Per-worker counters for the hit-rate log line
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'saved_seconds': 0.0}
+
+
+def init(db_path, ttl_seconds=_ttl_seconds, max_entries=_max_entries, max_bytes=_max_bytes):
+    """Open the cache database and set its limits."""
+    global _db, _ttl_seconds, _max_entries, _max_bytes
+    _db = Database(db_path, SCHEMA)
+    _ttl_seconds = ttl_seconds
+    _max_entries = max_entries
+    _max_bytes = max_bytes
+
+
+def normalize_query(query):
+    """Canonical form of a search: Unicode-normalized, case-folded, single-spaced."""
+    query = unicodedata.normalize('NFKC', query or '')
+    return re.sub(r'\s+', ' ', query).strip().casefold()
+
+
+def _key(query, num_results):
+    return f"{num_results}:{normalize_query(query)}"
+
+
+def _record(hit, saved_seconds=0.0):
+    with _stats_lock:
+        _stats['hits' if hit else 'misses'] += 1
+        _stats['saved_seconds'] += saved_seconds
+        lookups = _stats['hits'] + _stats['misses']
+        return _stats['hits'], lookups, _stats['saved_seconds']
+
+
+def get(query, num_results):
+    """Return cached results for a search, or None on a miss or expired entry."""
+    key = _key(query, num_results)
+    now = time.time()
+    with _db.transaction() as conn:
+        row = conn.execute(
+            'SELECT results, fetch_seconds, created_at FROM search_cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is not None and now - row['created_at'] > _ttl_seconds:
+            conn.execute('DELETE FROM search_cache WHERE key = ?', (key,))
+            row = None
+        if row is not None:
+            conn.execute(
+                'UPDATE search_cache SET last_used_at = ?, hits = hits + 1 WHERE key = ?', (now, key)
+            )
+
+    if row is None:
+        hits, lookups, _ = _record(hit=False)
+        logger.info("Search cache miss '%s' (hit rate %d/%d)", key, hits, lookups)
+        return None
+
+    hits, lookups, saved = _record(hit=True, saved_seconds=row['fetch_seconds'])
+    logger.info("Search cache hit '%s' saved ~%.2fs (hit rate %d/%d, %.1fs saved by this worker)",
+                key, row['fetch_seconds'], hits, lookups, saved)
+    return json.loads(row['results'])
+
+
+def put(query, num_results, results, fetch_seconds):
+    """Store search results and evict expired / least recently used entries."""
+    key = _key(query, num_results)
+    payload = json.dumps(results, ensure_ascii=False)
+    now = time.time()
+    with _db.transaction() as conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO search_cache (key, results, size, fetch_seconds, created_at, last_used_at, hits) '
+            'VALUES (?, ?, ?, ?, ?, ?, 0)',
+            (key, payload, len(payload.encode('utf-8')), fetch_seconds, now, now)
+        )
+        conn.execute('DELETE FROM search_cache WHERE created_at < ?', (now - _ttl_seconds,))
+
+        entries, total_bytes = conn.execute(
+            'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM search_cache'
+        ).fetchone()
+        if entries > _max_entries or total_bytes > _max_bytes:
+            rows = conn.execute('SELECT key, size FROM search_cache ORDER BY last_used_at').fetchall()
+            for row in rows:
+                if entries <= _max_entries and total_bytes <= _max_bytes:
+                    break
+                if row['key'] == key:
+                    continue
+                conn.execute('DELETE FROM search_cache WHERE key = ?', (row['key'],))
+                entries -= 1
+                total_bytes -= row['size']
+
+
+def stats():
+    """Per-worker hit/miss counters and the shared cache's current size."""
+    entries, total_bytes = _db.connect().execute(
+        'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM search_cache'
+    ).fetchone()
+    with _stats_lock:
+        return dict(_stats, entries=entries, bytes=total_bytes)
@@ -0,0 +1,144 @@
+"""
+Full-text index over the song catalog.
+
+Songs are searchable by display name and the admin's original search
+query. The index is two SQLite FTS5 tables inside catalog.db, updated in
+the same transaction as every catalog write, so it is always in sync and
+shared by all gunicorn workers:
+
+- songs_trigram (trigram tokenizer) matches any substring of 3+ letters,
+  which also finds words behind Hebrew prefixes ("שיר" in "והשיר")
+- songs_words (word tokens with 1-2 letter prefix indexes) handles query
+  words shorter than 3 letters as prefix matches
+
+Text is normalized the same way before indexing and before querying:
+Hebrew niqqud / cantillation and Latin accents are stripped, Hebrew final
+letters are mapped to their regular forms, Latin text is case-folded and
+punctuation (including geresh/gershayim) is dropped.
+"""
+
+import re
+import unicodedata
+
+SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS songs_trigram USING fts5(text, tokenize='trigram');
+CREATE VIRTUAL TABLE IF NOT EXISTS songs_words USING fts5(text, tokenize='unicode61', prefix='1 2');
+"""
+
+# Bump when normalize() changes so existing indexes are rebuilt on startup
+INDEX_VERSION = '1'
+
+FINAL_LETTERS = str.maketrans('ךםןףץ', 'כמנפצ')
+
+# Geresh / gershayim and ASCII quotes inside abbreviations (צה"ל, ג'ירפה) join the word
+_JOINERS_RE = re.compile(r"[׳״'\"`’]")
+_NON_WORD_RE = re.compile(r'[\W_]+')
+
+MIN_TRIGRAM_LENGTH = 3
+
+
+def normalize(text):
+    """Normalize text for indexing and querying (see module docstring)."""
+    if not text:
+        return ''
+    # Decompose so niqqud, cantillation and accents become separate marks, then drop them
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    text = text.casefold().translate(FINAL_LETTERS)
+    text = _JOINERS_RE.sub('', text)
+    return _NON_WORD_RE.sub(' ', text).strip()
+
+
+def song_text(song):
+    """The searchable text of a song (dict-like with display_name / search_query)."""
+    return normalize(' '.join(filter(None, (song.get('display_name'), song.get('search_query')))))
+
+
+def index_song(conn, song_id, song):
+    """Add or replace a song's index entries. Call inside the catalog write transaction."""
+    text = song_text(song)
+    remove_song(conn, song_id)
+    conn.execute('INSERT INTO songs_trigram (rowid, text) VALUES (?, ?)', (song_id, text))
+    conn.execute('INSERT INTO songs_words (rowid, text) VALUES (?, ?)', (song_id, text))
+
+
+def remove_song(conn, song_id):
+    """Drop a song's index entries. Call inside the catalog write transaction."""
+    conn.execute('DELETE FROM songs_trigram WHERE rowid = ?', (song_id,))
+    conn.execute('DELETE FROM songs_words WHERE rowid = ?', (song_id,))
+
+
+def rebuild(conn):
+    """Re-index every song from scratch. Call inside a write transaction."""
+    conn.execute('DELETE FROM songs_trigram')
+    conn.execute('DELETE FROM songs_words')
+    rows = conn.execute('SELECT id, display_name, search_query FROM songs').fetchall()
+    entries = [(row['id'], song_text(dict(row))) for row in rows]
+    conn.executemany('INSERT INTO songs_trigram (rowid, text) VALUES (?, ?)', entries)
+    conn.executemany('INSERT INTO songs_words (rowid, text) VALUES (?, ?)', entries)
+    return len(entries)
+
+
+def _quote(token):
+    return '"' + token.replace('"', '""') + '"'
+
+
+def _matching(query, after=None, before=None):
+    """
+    The SQL selecting the rowids that match every word of query (above
+    after / below before when given) and its arguments, or None when the
+    query has no words.
+
+    Words of 3+ letters match anywhere in the text; shorter words match the
+    start of a word.
+    """
+    tokens = normalize(query).split()
+    if not tokens:
+        return None
+
+    long_tokens = [token for token in tokens if len(token) >= MIN_TRIGRAM_LENGTH]
+    short_tokens = [token for token in tokens if len(token) < MIN_TRIGRAM_LENGTH]
+
+    # The id bounds go into every SELECT so FTS5 only walks that end of its rowid list
+    bounds = ''
+    bound_args = []
+    if after is not None:
+        bounds += ' AND rowid > ?'
+        bound_args.append(after)
+    if before is not None:
+        bounds += ' AND rowid < ?'
+        bound_args.append(before)
+
+    selects = []
+    args = []
+    if long_tokens:
+        selects.append('SELECT rowid FROM songs_trigram WHERE songs_trigram MATCH ?' + bounds)
+        args += [' AND '.join(_quote(token) for token in long_tokens)] + bound_args
+    if short_tokens:
+        selects.append('SELECT rowid FROM songs_words WHERE songs_words MATCH ?' + bounds)
+        args += [' AND '.join(_quote(token) + '*' for token in short_tokens)] + bound_args
+    return ' INTERSECT '.join(selects), args
+
+
+def search(conn, query, limit=50, after=None, before=None):
+    """
+    Return ids of up to limit songs matching every word of the query, in id
+    order: the first ones after the id after, or the last ones before the id
+    before.
+    """
+    matching = _matching(query, after, before)
+    if matching is None:
+        return []
+    sql, args = matching
+    order = 'DESC' if before is not None else 'ASC'
+    song_ids = [row[0] for row in conn.execute(f'{sql} ORDER BY rowid {order} LIMIT ?', args + [limit])]
+    return song_ids[::-1] if before is not None else song_ids
+
+
+def count(conn, query):
+    """Return the number of songs matching every word of the query."""
+    matching = _matching(query)
+    if matching is None:
+        return 0
+    sql, args = matching
+    return conn.execute(f'SELECT COUNT(*) FROM ({sql})', args).fetchone()[0]
@@ -0,0 +1,245 @@
+"""
+Pre-rendered public homepage.
+
+The homepage only changes when the catalog does, yet it used to be
+rendered for every visit. Instead every page of the unfiltered listing
+(/, ?after=<id> and the matching ?before=<id> links) is rendered to static
+HTML, plus gzip and, when the brotli package is installed, brotli
+variants:
+
+    pages/
+        current -> build-<generation>-<rendering>-<token>    (symlink)
+        build-<generation>-<rendering>-<token>/
+            manifest.json                         fingerprint of every page
+            index.html  index.html.gz  index.html.br
+            after-<id>.html ...                   before-<id>.html are hard links
+
+A build runs in a background thread after the catalog changes. It only
+renders pages whose contents (songs, cursors, templates) differ from the
+previous build and hard-links the rest. The finished directory then
+replaces the current one with an atomic symlink swap. One build runs at a
+time across all workers (flock on pages/.lock).
+
+The build directory is named after the catalog generation and a hash of
+what the pages were rendered with: the templates and the settings they
+show (page size, Jinja globals such as HLS_JS_URL). Requests are served
+from it only while both are still current. Otherwise the caller renders the page
+dynamically and schedules a build.
+"""
+
+import fcntl
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:  # optional: pages are served with gzip only
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+CURRENT = 'current'
+MANIFEST = 'manifest.json'
+
+# Content-Encoding: file suffix, best first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+_pages_dir = None
+_load_pages = None
+_render_page = None
+_rendering_hash = ''
+
+_state_lock = threading.Lock()
+_running = False
+_dirty = False
+
+
+def init(pages_dir, load_pages, render_page, templates_dir, settings=None):
+    """
+    Configure the pre-rendered pages.
+
+    load_pages() returns (generation, pages) like catalog.list_all_pages();
+    render_page(page) returns a page's HTML. settings maps the names of
+    other values the pages depend on to their values. Template changes (a
+    deploy) and changed settings (a restart with a new environment)
+    invalidate every page, so both are part of each fingerprint.
+    """
+    global _pages_dir, _load_pages, _render_page, _rendering_hash
+    _pages_dir = Path(pages_dir)
+    _pages_dir.mkdir(parents=True, exist_ok=True)
+    _load_pages = load_pages
+    _render_page = render_page
+    digest = hashlib.sha256()
+    for path in sorted(Path(templates_dir).rglob('*.html')):
+        digest.update(path.name.encode() + b'\0' + path.read_bytes())
+    digest.update(json.dumps(settings or {}, sort_keys=True, default=str).encode('utf-8'))
+    _rendering_hash = digest.hexdigest()
+
+
+def _build_prefix(generation):
+    return f'build-{generation}-{_rendering_hash[:16]}'
+
+
+def _current_build():
+    """(build prefix, directory) of the published build, or (None, None)."""
+    try:
+        target = os.readlink(_pages_dir / CURRENT)
+    except OSError:
+        return None, None
+    return target.rsplit('-', 1)[0], _pages_dir / target
+
+
+def is_current(generation):
+    """True if the published pages show this catalog generation with the deployed templates and settings."""
+    return _current_build()[0] == _build_prefix(generation)
+
+
+def find(key, generation, accepts):
+    """
+    Path and Content-Encoding of the stored page key for a client that
+    accepts(encoding) returns True for, or (None, None) if there is no
+    up-to-date copy.
+    """
+    prefix, build_dir = _current_build()
+    if prefix != _build_prefix(generation):
+        return None, None
+    path = build_dir / f'{key}.html'
+    for encoding, suffix in ENCODINGS:
+        if accepts(encoding):
+            encoded = path.with_name(path.name + suffix)
+            if encoded.exists():
+                return encoded, encoding
+    return (path, None) if path.exists() else (None, None)
+
+
+def schedule():
+    """Build the pages in a background thread (again, if one is already running)."""
+    global _running, _dirty
+    if _pages_dir is None:
+        return
+    with _state_lock:
+        _dirty = True
+        if _running:
+            return
+        _running = True
+    threading.Thread(target=_build_loop, name='static-pages', daemon=True).start()
+
+
+def _build_loop():
+    global _running, _dirty
+    while True:
+        with _state_lock:
+            if not _dirty:
+                _running = False
+                return
+            _dirty = False
+        try:
+            build()
+        except Exception:
+            logger.exception("Pre-rendering the homepage failed")
+
+
+def _page_keys(pages):
+    """Primary key and alias keys of each page, matching the pagination links."""
+    keys = []
+    for index, page in enumerate(pages):
+        primary = 'index' if index == 0 else f"after-{pages[index - 1]['songs'][-1]['id']}"
+        aliases = [f"before-{pages[index + 1]['songs'][0]['id']}"] if index + 1 < len(pages) else []
+        keys.append((primary, aliases))
+    return keys
+
+
+# What a page shows. page['total'] is not on the homepage - with it, every
+# added song would change every page.
+FINGERPRINT_FIELDS = ('songs', 'prev_before', 'next_after')
+
+
+def _fingerprint(page):
+    shown = {field: page[field] for field in FINGERPRINT_FIELDS}
+    data = json.dumps(shown, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256((_rendering_hash + data).encode('utf-8')).hexdigest()
+
+
+def _write_variants(build_dir, key, html):
+    data = html.encode('utf-8')
+    (build_dir / f'{key}.html').write_bytes(data)
+    (build_dir / f'{key}.html.gz').write_bytes(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        (build_dir / f'{key}.html.br').write_bytes(brotli.compress(data, mode=brotli.MODE_TEXT, quality=9))
+
+
+def _link_variants(source_dir, source_key, build_dir, key):
+    for suffix in ('', '.gz', '.br'):
+        source = source_dir / f'{source_key}.html{suffix}'
+        if source.exists():
+            os.link(source, build_dir / f'{key}.html{suffix}')
+
+
+def build():
+    """
+    Render the pages of the current catalog generation and publish them.
+    Returns the number of pages rendered (0 if the published build is current).
+    """
+    lock_path = _pages_dir / '.lock'
+    with open(lock_path, 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            return _build_locked()
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _build_locked():
+    start = time.perf_counter()
+    generation, pages = _load_pages()
+    if is_current(generation):
+        return 0
+    previous_dir = _current_build()[1]
+
+    previous = {}
+    if previous_dir is not None:
+        try:
+            previous = json.loads((previous_dir / MANIFEST).read_text())['pages']
+        except (OSError, ValueError, KeyError):
+            previous = {}
+
+    build_dir = _pages_dir / f'{_build_prefix(generation)}-{uuid.uuid4().hex[:8]}'
+    build_dir.mkdir()
+    try:
+        fingerprints = {}
+        rendered = 0
+        for page, (key, aliases) in zip(pages, _page_keys(pages)):
+            fingerprint = _fingerprint(page)
+            fingerprints[key] = fingerprint
+            if previous.get(key) == fingerprint:
+                _link_variants(previous_dir, key, build_dir, key)
+            else:
+                _write_variants(build_dir, key, _render_page(page))
+                rendered += 1
+            for alias in aliases:
+                _link_variants(build_dir, key, build_dir, alias)
+        (build_dir / MANIFEST).write_text(json.dumps({'generation': generation, 'pages': fingerprints}))
+
+        link = _pages_dir / f'.{CURRENT}-{uuid.uuid4().hex[:8]}'
+        os.symlink(build_dir.name, link)
+        os.replace(link, _pages_dir / CURRENT)
+    except BaseException:
+        shutil.rmtree(build_dir, ignore_errors=True)
+        raise
+
+    # Keep the build just replaced for requests that already resolved it
+    for old in _pages_dir.glob('build-*'):
+        if old not in (build_dir, previous_dir):
+            shutil.rmtree(old, ignore_errors=True)
+
+    logger.info("Pre-rendered homepage for generation %d: %d of %d pages rendered in %.2fs",
+                generation, rendered, len(pages), time.perf_counter() - start)
+    return rendered
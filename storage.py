@@ -0,0 +1,196 @@
+"""
+Disk quota for downloaded audio, with least-recently-downloaded eviction.
+
+The persistent disk has a fixed size and downloads/ only ever grew. With a
+quota set, audio files are evicted once downloads/ is over it:
+
+- every download of a song records when its file was last served (in
+  cache.db, at most once a minute per file and worker); a file stored
+  more recently than that counts from when it was stored
+- enforce() removes the least recently served files until downloads/ fits
+  in the quota again - only files the app can fetch again (songs with a
+  YouTube URL). Catalog entries stay as they are
+- ensure() brings an evicted file back through the fetch callback (a new
+  yt-dlp download under the same name). Concurrent requests for the same
+  file, from any thread or worker, wait for a single fetch: the fetching
+  request holds an flock on one of LOCK_STRIPES files downloads/.refetch-<n>.lock
+"""
+
+import fcntl
+import logging
+import os
+import threading
+import time
+import zlib
+from pathlib import Path
+
+import metrics
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS audio_access (
+    filename TEXT PRIMARY KEY,
+    last_access REAL NOT NULL
+);
+"""
+
+# Seconds between two recorded accesses of the same file by one worker
+TOUCH_INTERVAL = 60
+
+# A fixed set of lock files shared by all audio files, instead of one per name
+LOCK_STRIPES = 64
+
+_db = None
+_downloads_dir = None
+_quota_bytes = 0
+_fetch = None
+_refetchable = None
+
+_touched = {}
+_touched_lock = threading.Lock()
+
+
+def init(db_path, downloads_dir, quota_bytes, fetch, refetchable):
+    """
+    Configure the quota (0 disables eviction).
+
+    fetch(filename) downloads an evicted file again into downloads_dir
+    under the same name; refetchable() returns the set of file names
+    fetch can restore.
+    """
+    global _db, _downloads_dir, _quota_bytes, _fetch, _refetchable
+    _db = Database(db_path, SCHEMA)
+    _downloads_dir = Path(downloads_dir)
+    _quota_bytes = quota_bytes
+    _fetch = fetch
+    _refetchable = refetchable
+    # Per-file lock files of earlier versions (.<audio file>.lock)
+    for path in _downloads_dir.glob('.*.lock'):
+        if '.' in path.name[1:-len('.lock')]:
+            path.unlink(missing_ok=True)
+
+
+def touch(filename, force=False):
+    """Record that a file was just served."""
+    now = time.time()
+    with _touched_lock:
+        if not force and now - _touched.get(filename, 0) < TOUCH_INTERVAL:
+            return
+        _touched[filename] = now
+    with _db.transaction() as conn:
+        conn.execute(
+            'INSERT INTO audio_access (filename, last_access) VALUES (?, ?) '
+            'ON CONFLICT(filename) DO UPDATE SET last_access = excluded.last_access',
+            (filename, now)
+        )
+
+
+def _lock_path(filename):
+    return _downloads_dir / f'.refetch-{zlib.crc32(filename.encode()) % LOCK_STRIPES}.lock'
+
+
+def ensure(filename):
+    """
+    Return the path of an audio file, fetching it again first if it was evicted.
+
+    Blocks while another request fetches the same file. Raises RuntimeError
+    if the fetch fails.
+    """
+    path = _downloads_dir / filename
+    if path.exists():
+        return path
+
+    with open(_lock_path(filename), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            # Whoever held the lock before us may have fetched it already
+            if path.exists():
+                return path
+            start = time.perf_counter()
+            try:
+                _fetch(filename)
+            except Exception:
+                metrics.inc('storage_refetches_total', outcome='failed')
+                raise
+            if not path.exists():
+                metrics.inc('storage_refetches_total', outcome='failed')
+                raise RuntimeError(f'{filename} was not restored')
+            metrics.inc('storage_refetches_total', outcome='ok')
+            logger.info("Fetched evicted %s again in %.1fs", filename, time.perf_counter() - start)
+            # Most recently used from now on, before anyone else can run an eviction pass
+            touch(filename, force=True)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    enforce()
+    return path
+
+
+def _audio_files():
+    """(name, size, mtime) of the stored audio files, skipping temporary and lock files."""
+    files = []
+    with os.scandir(_downloads_dir) as entries:
+        for entry in entries:
+            if entry.name.startswith('.') or not entry.is_file():
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            files.append((entry.name, stat.st_size, stat.st_mtime))
+    return files
+
+
+def enforce():
+    """Evict least recently served files until downloads/ fits in the quota. Returns the evicted names."""
+    if not _quota_bytes:
+        return []
+
+    # One eviction pass at a time across workers; a pass already running does the job
+    with open(_downloads_dir / '.quota.lock', 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return []
+        try:
+            return _evict()
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _evict():
+    files = _audio_files()
+    total = sum(size for _, size, _ in files)
+    if total <= _quota_bytes:
+        return []
+
+    accessed = {row['filename']: row['last_access']
+                for row in _db.connect().execute('SELECT filename, last_access FROM audio_access')}
+    refetchable = _refetchable()
+    candidates = sorted(
+        (max(accessed.get(name, 0), mtime), name, size) for name, size, mtime in files
+        if name in refetchable
+    )
+
+    evicted = []
+    for _, name, size in candidates:
+        if total <= _quota_bytes:
+            break
+        (_downloads_dir / name).unlink(missing_ok=True)
+        total -= size
+        evicted.append(name)
+        metrics.inc('storage_evictions_total')
+        logger.info("Evicted %s (%.1f MB) from downloads", name, size / (1024 * 1024))
+
+    if total > _quota_bytes:
+        logger.warning("downloads/ is still over its quota after eviction",
+                       extra={'mb': round(total / (1024 * 1024)), 'quota_mb': round(_quota_bytes / (1024 * 1024))})
+    return evicted
+
+
+def stats():
+    """Stored audio files, their total size and the quota, for /metrics."""
+    sizes = [size for _, size, _ in _audio_files()]
+    return {'files': len(sizes), 'bytes': sum(sizes), 'quota_bytes': _quota_bytes}
@@ -0,0 +1,130 @@
+"""
+Low-bitrate HLS variants for in-page playback.
+
+A downloaded song is 3-8 MB of 192 kbps MP3; on a slow mobile connection
+playback waits for a good part of it. After ingest a background job
+encodes each song into small AAC variants split into short MPEG-TS
+segments with HLS playlists:
+
+    streams/<audio file stem>/
+        master.m3u8          variant list, lowest bitrate first
+        a32/index.m3u8       32 kbps mono, SEGMENT_SECONDS per segment
+        a32/seg000.ts ...
+        a64/index.m3u8       64 kbps stereo
+        a64/seg000.ts ...
+
+Players start after the first segment and switch variants by bandwidth.
+Songs of the same video share one directory, like they share the audio.
+"""
+
+import logging
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# name: (bitrate, channels)
+VARIANTS = {
+    'a32': ('32k', 1),
+    'a64': ('64k', 2),
+}
+
+SEGMENT_SECONDS = 6
+MASTER_PLAYLIST = 'master.m3u8'
+
+# Requested file names that may be served from a stream directory
+FILE_NAME_RE = re.compile(r'^(?:master\.m3u8|a\d+/(?:index\.m3u8|seg\d{3,5}\.ts))$')
+
+MIME_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.ts': 'video/mp2t',
+}
+
+# Per-variant ffmpeg limit - a long set can take a while on a small instance
+ENCODE_TIMEOUT_SECONDS = 15 * 60
+
+
+def stream_dir(streams_dir, filename):
+    """Directory holding the variants of an audio file."""
+    return Path(streams_dir) / Path(filename).stem
+
+
+def is_ready(streams_dir, filename):
+    return (stream_dir(streams_dir, filename) / MASTER_PLAYLIST).exists()
+
+
+def _bandwidth(bitrate):
+    # Declared peak bandwidth: audio bitrate plus ~20% MPEG-TS overhead
+    return int(bitrate.rstrip('k')) * 1200
+
+
+def generate(source_path, streams_dir):
+    """
+    Encode source_path into the HLS variants (see module docstring).
+
+    The variants are built in a temporary directory and moved into place
+    when complete, so a half-written stream is never served. Raises
+    RuntimeError if ffmpeg fails.
+    """
+    target = stream_dir(streams_dir, source_path)
+    Path(streams_dir).mkdir(parents=True, exist_ok=True)
+    work_dir = Path(tempfile.mkdtemp(dir=streams_dir, prefix=f'.{target.name}-'))
+    start = time.perf_counter()
+    try:
+        for name, (bitrate, channels) in VARIANTS.items():
+            variant_dir = work_dir / name
+            variant_dir.mkdir()
+            try:
+                result = subprocess.run(
+                    ['ffmpeg', '-nostdin', '-loglevel', 'error', '-y', '-i', str(source_path),
+                     '-vn', '-map', '0:a:0', '-c:a', 'aac', '-b:a', bitrate, '-ac', str(channels),
+                     '-f', 'hls', '-hls_time', str(SEGMENT_SECONDS), '-hls_playlist_type', 'vod',
+                     '-hls_segment_filename', str(variant_dir / 'seg%03d.ts'),
+                     str(variant_dir / 'index.m3u8')],
+                    capture_output=True, text=True, timeout=ENCODE_TIMEOUT_SECONDS,
+                )
+            except subprocess.TimeoutExpired:
+                raise RuntimeError(f"ffmpeg timed out after {ENCODE_TIMEOUT_SECONDS}s ({name})")
+            if result.returncode != 0:
+                raise RuntimeError(f"ffmpeg failed ({name}): {result.stderr.strip()[-500:]}")
+
+        lines = ['#EXTM3U', '#EXT-X-VERSION:3']
+        for name, (bitrate, _) in VARIANTS.items():
+            lines.append(f'#EXT-X-STREAM-INF:BANDWIDTH={_bandwidth(bitrate)},CODECS="mp4a.40.2"')
+            lines.append(f'{name}/index.m3u8')
+        (work_dir / MASTER_PLAYLIST).write_text('\n'.join(lines) + '\n')
+
+        if target.exists():
+            shutil.rmtree(target)
+        work_dir.rename(target)
+    finally:
+        if work_dir.exists():
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    elapsed = time.perf_counter() - start
+    metrics.observe('ffmpeg_duration_seconds', elapsed, postprocessor='HLSVariants')
+    size = sum(path.stat().st_size for path in target.rglob('*') if path.is_file())
+    logger.info("Built HLS variants for %s in %.2fs", Path(source_path).name, elapsed,
+                extra={'kb': round(size / 1024)})
+
+
+def remove(streams_dir, filename):
+    """Delete the variants of an audio file, if any."""
+    shutil.rmtree(stream_dir(streams_dir, filename), ignore_errors=True)
+
+
+def file_path(streams_dir, filename, name):
+    """
+    Resolve a requested playlist/segment name inside a song's stream directory.
+
+    Returns (path, mime type), or None for names that are not part of a stream.
+    """
+    if not FILE_NAME_RE.match(name):
+        return None
+    return stream_dir(streams_dir, filename) / name, MIME_TYPES[Path(name).suffix]
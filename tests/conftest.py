@@ -0,0 +1,35 @@
+import importlib.util
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+BENCH_DIR = REPO_DIR / 'benchmarks'
+sys.path.insert(0, str(REPO_DIR))
+sys.path.insert(0, str(BENCH_DIR))
+
+
+def load_fake_yt_dlp():
+    """The benchmarks' yt_dlp stand-in, under its own name so the real yt_dlp stays importable."""
+    spec = importlib.util.spec_from_file_location('fake_yt_dlp', BENCH_DIR / 'fake_yt_dlp' / 'yt_dlp' / '__init__.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    """The app module, configured from its environment variables like the benchmarks do, with its data in a temporary directory."""
+    data_dir = tempfile.mkdtemp(prefix='dmp-tests-')
+    os.environ.update({
+        'PERSISTENT_DATA_PATH': data_dir,
+        'LOG_LEVEL': 'ERROR',
+        'STATIC_HOMEPAGE': '0',
+        'PRERESOLVE_RESULTS': '0',
+        'STRATEGY_FAILURE_THRESHOLD': '1000000',
+    })
+    import app
+    return app
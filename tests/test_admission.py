@@ -0,0 +1,81 @@
+"""Admission control of public downloads (admission.py, app.admit_transfer)."""
+
+import pytest
+
+import admission
+import catalog
+import token_buckets
+
+
+@pytest.fixture
+def song_id(app_module, tmp_path):
+    (app_module.DOWNLOADS_DIR / 'admission-test.mp3').write_bytes(b'\0' * 64 * 1024)
+    song_id = catalog.add_song('Admission test', 'admission-test.mp3')
+    admission.init(tmp_path / 'slots', {'downloads': (1, 1)}, max_transfers=2)
+    yield song_id
+    catalog.delete_song(song_id)
+    admission.init(tmp_path / 'slots', {}, max_transfers=0)
+
+
+def get(client, path, ip, **headers):
+    response = client.get(path, headers=headers, environ_base={'REMOTE_ADDR': ip})
+    response.close()
+    return response
+
+
+def test_download_budget_per_client(app_module, song_id):
+    client = app_module.app.test_client()
+
+    assert get(client, f'/download/{song_id}', '203.0.113.7').status_code == 200
+    rejected = get(client, f'/download/{song_id}', '203.0.113.7')
+    assert rejected.status_code == 429
+    assert int(rejected.headers['Retry-After']) >= 1
+
+
+def test_continuations_of_a_sent_file_are_free(app_module, song_id):
+    client = app_module.app.test_client()
+
+    first = get(client, f'/download/{song_id}', '203.0.113.8', Range='bytes=0-')
+    assert first.status_code == 206
+    etag = first.headers['ETag']
+    for start in (1024, 32 * 1024, 4096, 8192, 16 * 1024):
+        assert get(client, f'/download/{song_id}', '203.0.113.8', Range=f'bytes={start}-',
+                   **{'If-Range': etag}).status_code == 206
+    # A new download from the start still counts
+    assert get(client, f'/download/{song_id}', '203.0.113.8', Range='bytes=0-').status_code == 429
+
+
+def test_mid_file_ranges_alone_are_still_limited(app_module, song_id):
+    client = app_module.app.test_client()
+    # Another client's ETag does not help either
+    etag = get(client, f'/download/{song_id}', '203.0.113.10').headers['ETag']
+
+    statuses = [get(client, f'/download/{song_id}', '203.0.113.9', Range='bytes=1-',
+                    **({'If-Range': etag} if n % 2 else {})).status_code
+                for n in range(int(1 / admission.CONTINUATION_COST) + 1)]
+
+    assert statuses[:-1] == [206] * int(1 / admission.CONTINUATION_COST)
+    assert statuses[-1] == 429
+
+
+def test_thumbnails_take_the_shared_budget_in_batches(tmp_path, monkeypatch):
+    admission.init(tmp_path / 'slots', {'thumbnails': (1, 20)}, max_transfers=0, batches={'thumbnails': 10})
+    takes = []
+    take = token_buckets.take
+    monkeypatch.setattr(token_buckets, 'take', lambda key, amount, *args: takes.append(amount) or take(key, amount, *args))
+
+    for _ in range(20):
+        admission.check_rate('203.0.113.11', 'thumbnails')
+    assert takes == [10, 10]
+
+    # The shared bucket is empty: the next full batch is refused, and this worker keeps refusing on its own
+    for _ in range(9):
+        admission.check_rate('203.0.113.11', 'thumbnails')
+    with pytest.raises(admission.Rejected):
+        admission.check_rate('203.0.113.11', 'thumbnails')
+    with pytest.raises(admission.Rejected) as rejected:
+        admission.check_rate('203.0.113.11', 'thumbnails')
+    assert takes == [10, 10, 10]
+    assert rejected.value.status == 429
+    assert rejected.value.retry_after > 500
+    admission.init(tmp_path / 'slots', {}, max_transfers=0)
@@ -0,0 +1,47 @@
+"""Bulk import report (app.run_bulk_import_job)."""
+
+import random
+import time
+
+import catalog
+
+
+def test_report_follows_input_order(app_module, monkeypatch):
+    entries = ['first song', 'https://www.youtube.com/watch?v=missing', 'https://www.youtube.com/playlist?list=PL1',
+               'second song']
+
+    def resolve(entries):
+        videos = [
+            {'youtube_url': 'https://www.youtube.com/watch?v=bulk1', 'title': 'First', 'source': entries[0], 'entry_index': 0},
+            {'youtube_url': 'https://www.youtube.com/watch?v=bulk2', 'title': 'Playlist 1', 'source': entries[2], 'entry_index': 2},
+            {'youtube_url': 'https://www.youtube.com/watch?v=bulk3', 'title': 'Playlist 2', 'source': entries[2], 'entry_index': 2},
+            {'youtube_url': 'https://www.youtube.com/watch?v=bulk4', 'title': 'Second', 'source': entries[3], 'entry_index': 3},
+        ]
+        errors = [{'source': entries[1], 'error': 'Video unavailable', 'entry_index': 1}]
+        return videos, errors
+
+    def ingest(youtube_url, title, progress_hook=None):
+        # Downloads finish in any order
+        time.sleep(random.uniform(0, 0.05))
+        if title == 'Playlist 2':
+            raise RuntimeError('download failed')
+        video_id = catalog.extract_video_id(youtube_url)
+        return {'filename': f'{video_id}.mp3', 'video_id': video_id}
+
+    monkeypatch.setattr(app_module, 'resolve_bulk_entries', resolve)
+    monkeypatch.setattr(app_module, 'ingest_song_files', ingest)
+    monkeypatch.setattr(app_module, 'queue_stream_variants', lambda song, title: None)
+
+    result = app_module.run_bulk_import_job({'entries': entries}, lambda **kwargs: None)
+
+    assert [(item['title'] if 'title' in item else item['source'], item['status']) for item in result['items']] == [
+        ('First', 'ok'),
+        ('https://www.youtube.com/watch?v=missing', 'failed'),
+        ('Playlist 1', 'ok'),
+        ('Playlist 2', 'failed'),
+        ('Second', 'ok'),
+    ]
+    assert (result['succeeded'], result['failed']) == (3, 2)
+    for item in result['items']:
+        if 'song_id' in item:
+            catalog.delete_song(item['song_id'])
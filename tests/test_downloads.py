@@ -0,0 +1,113 @@
+"""
+download_from_youtube() transfers against fake_media_server.py, with the real
+yt-dlp: resume after a cut connection, parallel DASH fragments and the shared
+DOWNLOAD_BANDWIDTH_KBPS budget. Needs ffmpeg on PATH.
+"""
+
+import json
+import math
+import shutil
+import time
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import pytest
+
+pytestmark = pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='needs ffmpeg on PATH')
+
+SECONDS = 20
+SEGMENT_SECONDS = 2
+
+
+@pytest.fixture(scope='module')
+def server():
+    import fake_media_server
+    server = fake_media_server.start(seconds=SECONDS, segment_seconds=SEGMENT_SECONDS, kbps=1024, latency=0.05)
+    yield server
+    fake_media_server.stop(server)
+
+
+@pytest.fixture
+def download(app_module, server, tmp_path, monkeypatch):
+    """Download a media server path; returns (audio path, bytes of the finished download before post-processing)."""
+    server.drop_paths = set()
+    server.reset()
+    monkeypatch.setattr(app_module, 'DOWNLOAD_BANDWIDTH_KBPS', 0)
+
+    def download(path, output_path=None):
+        finished = {}
+
+        def hook(d):
+            if d.get('status') == 'finished':
+                finished['bytes'] = Path(d['filename']).read_bytes()
+
+        output_path = output_path or tmp_path / f'.{uuid.uuid4().hex}.mp3'
+        audio_path = app_module.download_from_youtube(server.url(path), output_path, progress_hook=hook,
+                                                      audio_format='original')
+        return audio_path, finished.get('bytes')
+
+    return download
+
+
+def bytes_sent(server):
+    # The handler counts a response after its last write
+    time.sleep(0.2)
+    with urllib.request.urlopen(server.url('/stats')) as response:
+        return sum(json.load(response)['bytes_sent'].values())
+
+
+def test_resumes_after_connection_is_cut(app_module, server, download, tmp_path, monkeypatch):
+    original = (server.media_dir / 'audio.m4a').read_bytes()
+    server.drop_paths = {'/audio.m4a'}
+    server.drop_after = len(original) // 2
+    server.reset()
+    monkeypatch.setattr(app_module, 'DOWNLOAD_RETRIES', 0)
+    output_path = tmp_path / '.resume.mp3'
+
+    failed, _ = download('/audio.m4a', output_path)
+    assert failed is None
+    first_bytes = bytes_sent(server)
+    kept = sum(path.stat().st_size for path in tmp_path.glob('.resume.*.part'))
+    assert kept > 0
+
+    audio_path, downloaded = download('/audio.m4a', output_path)
+
+    assert audio_path is not None
+    assert downloaded == original
+    # Only the rest of the file was fetched again (plus yt-dlp's first look at the URL)
+    assert bytes_sent(server) - first_bytes <= len(original) - kept + 64 * 1024
+    assert not app_module.has_partial_download(output_path.with_suffix(''))
+
+
+def test_parallel_fragments_reassemble_in_order(app_module, server, download, monkeypatch):
+    monkeypatch.setattr(app_module, 'DOWNLOAD_FRAGMENT_CONCURRENCY', 4)
+    dash_dir = server.media_dir / 'dash'
+    # The fragments the manifest lists, in playback order
+    segments = [dash_dir / f'chunk-stream0-{number:05d}.m4s'
+                for number in range(1, math.ceil(SECONDS / SEGMENT_SECONDS) + 1)]
+    expected = (dash_dir / 'init-stream0.m4s').read_bytes() + b''.join(path.read_bytes() for path in segments)
+
+    audio_path, downloaded = download('/dash/manifest.mpd')
+
+    assert audio_path is not None
+    assert downloaded == expected
+
+
+def test_parallel_downloads_share_bandwidth_budget(app_module, server, download, monkeypatch):
+    budget_kbps = 256
+    monkeypatch.setattr(app_module, 'DOWNLOAD_BANDWIDTH_KBPS', budget_kbps)
+    size = (server.media_dir / 'audio.m4a').stat().st_size
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        results = list(pool.map(lambda _: download('/audio.m4a'), range(2)))
+    elapsed = time.perf_counter() - start
+
+    assert all(audio_path is not None for audio_path, _ in results)
+    total = bytes_sent(server)
+    assert total >= 2 * size
+    # The bucket starts full (one second of budget); each download may be a quantum ahead of it
+    allowed = budget_kbps * 1024 * (elapsed + 1) + 2 * 256 * 1024
+    assert total <= allowed
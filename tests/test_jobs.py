@@ -0,0 +1,102 @@
+"""Persistent job queue: running queued jobs in order, orphan detection and the heartbeat (jobs.py)."""
+
+import os
+import subprocess
+import threading
+import time
+
+import pytest
+
+import jobs
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    """jobs configured on a fresh database with one slot; the module state is restored afterwards."""
+    for name in ('_db', '_max_running', '_executor', '_executor_pid'):
+        monkeypatch.setattr(jobs, name, getattr(jobs, name))
+    monkeypatch.setattr(jobs, '_handlers', {})
+    monkeypatch.setattr(jobs, 'HEARTBEAT_SECONDS', 0.05)
+    ran = []
+    release = threading.Event()
+
+    def record(params, progress):
+        release.wait(5)
+        ran.append(params['n'])
+        return {'n': params['n']}
+
+    jobs.init(tmp_path / 'jobs.db', {'record': record}, max_running=1)
+    return ran, release
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.02)
+
+
+def set_running(job_id, pid, updated_at):
+    with jobs._db.transaction() as conn:
+        conn.execute('UPDATE jobs SET status = ?, worker_pid = ?, updated_at = ? WHERE id = ?',
+                     (jobs.RUNNING, pid, updated_at, job_id))
+
+
+def dead_pid():
+    process = subprocess.Popen(['true'])
+    process.wait()
+    return process.pid
+
+
+def test_queued_jobs_run_in_order_when_a_slot_frees(queue):
+    ran, release = queue
+    job_ids = [jobs.enqueue('record', {'n': n}) for n in range(3)]
+    wait_for(lambda: jobs.count_by_status()[jobs.RUNNING] == 1)
+    assert jobs.count_by_status()[jobs.QUEUED] == 2
+
+    release.set()
+    wait_for(lambda: jobs.count_by_status()[jobs.SUCCEEDED] == 3)
+
+    assert ran == [0, 1, 2]
+    assert [jobs.get_job(job_id)['result'] for job_id in job_ids] == [{'n': 0}, {'n': 1}, {'n': 2}]
+
+
+def test_resume_pending_keeps_jobs_of_live_workers(queue):
+    job_id = jobs.enqueue('record', {'n': 0})
+    wait_for(lambda: jobs.get_job(job_id)['status'] == jobs.RUNNING)
+    # Another job of this (live) worker, which reported a moment ago
+    with jobs._db.transaction() as conn:
+        other_id = conn.execute(
+            'INSERT INTO jobs (kind, status, params, worker_pid, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+            ('record', jobs.RUNNING, '{"n": 1}', os.getpid(), time.time(), time.time())).lastrowid
+
+    jobs.resume_pending()
+
+    assert jobs.get_job(job_id)['status'] == jobs.RUNNING
+    assert jobs.get_job(other_id)['status'] == jobs.RUNNING
+    queue[1].set()
+
+
+def test_resume_pending_requeues_orphans(queue):
+    ran, release = queue
+    release.set()
+    fresh_dead = jobs.enqueue('record', {'n': 0})
+    stale_live = jobs.enqueue('record', {'n': 1})
+    wait_for(lambda: jobs.count_by_status()[jobs.SUCCEEDED] == 2)
+    ran.clear()
+    # A worker that died, and a pid whose heartbeat stopped long ago (reused by another process)
+    set_running(fresh_dead, dead_pid(), time.time())
+    set_running(stale_live, os.getpid(), time.time() - jobs.STALE_AFTER_SECONDS - 1)
+
+    jobs.resume_pending()
+
+    wait_for(lambda: sorted(ran) == [0, 1])
+
+
+def test_heartbeat_refreshes_running_jobs(queue):
+    job_id = jobs.enqueue('record', {'n': 0})
+    wait_for(lambda: jobs.get_job(job_id)['status'] == jobs.RUNNING)
+    started = jobs.get_job(job_id)['updated_at']
+
+    wait_for(lambda: jobs.get_job(job_id)['updated_at'] > started)
+    queue[1].set()
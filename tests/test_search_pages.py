@@ -0,0 +1,51 @@
+"""Paged ?q= searches of the homepage and /api/songs."""
+
+import pytest
+
+import catalog
+
+
+@pytest.fixture
+def songs(app_module):
+    song_ids = catalog.add_songs([{'display_name': f'Needle song {n}', 'filename': f'needle-{n}.mp3'} for n in range(7)]
+                                 + [{'display_name': f'Other {n}', 'filename': f'other-{n}.mp3'} for n in range(3)])
+    yield song_ids[:7]
+    for song_id in song_ids:
+        catalog.delete_song(song_id)
+
+
+def test_search_pages_count_every_match(songs):
+    first = catalog.search_songs_page('needle', limit=3)
+    assert first['total'] == 7
+    assert [song['id'] for song in first['songs']] == songs[:3]
+    assert first['prev_before'] is None
+
+    second = catalog.search_songs_page('needle', after=first['next_after'], limit=3)
+    third = catalog.search_songs_page('needle', after=second['next_after'], limit=3)
+    assert [song['id'] for song in second['songs'] + third['songs']] == songs[3:]
+    assert third['next_after'] is None
+
+    back = catalog.search_songs_page('needle', before=second['prev_before'], limit=3)
+    assert back['songs'] == first['songs']
+
+
+def test_search_total_follows_catalog_changes(songs):
+    assert catalog.search_songs_page('needle', limit=3)['total'] == 7
+
+    catalog.delete_song(songs[0])
+    page = catalog.search_songs_page('needle', limit=3)
+
+    assert page['total'] == 6
+    assert [song['id'] for song in page['songs']] == songs[1:4]
+
+
+def test_search_links_keep_the_query(app_module, songs):
+    client = app_module.app.test_client()
+
+    data = client.get('/api/songs?q=needle&limit=3').get_json()
+    assert data['total'] == 7
+    assert 'q=needle' in data['next']
+    assert len(client.get(data['next']).get_json()['songs']) == 3
+
+    html = client.get('/?q=needle').get_data(as_text=True)
+    assert '7 תוצאות' in html
@@ -0,0 +1,35 @@
+"""Pre-rendered homepage builds (static_pages.py)."""
+
+import pytest
+
+import static_pages
+from conftest import REPO_DIR
+
+PAGES = [{'songs': [{'id': 1, 'display_name': 'One'}], 'prev_before': None, 'next_after': None, 'total': 1}]
+
+
+@pytest.fixture(autouse=True)
+def restore_static_pages(monkeypatch):
+    for name in ('_pages_dir', '_load_pages', '_render_page', '_rendering_hash'):
+        monkeypatch.setattr(static_pages, name, getattr(static_pages, name))
+
+
+def init(tmp_path, settings):
+    static_pages.init(tmp_path / 'pages', lambda: (7, PAGES), lambda page: f'<p>{page["songs"]}</p>',
+                      REPO_DIR / 'templates', settings=settings)
+
+
+def test_changed_settings_rebuild_the_pages(tmp_path):
+    init(tmp_path, {'PAGE_SIZE': 50, 'HLS_JS_URL': ''})
+    assert static_pages.build() == 1
+    assert static_pages.is_current(7)
+
+    # A restart on the same data directory with the same settings keeps the build
+    init(tmp_path, {'HLS_JS_URL': '', 'PAGE_SIZE': 50})
+    assert static_pages.is_current(7)
+
+    init(tmp_path, {'PAGE_SIZE': 50, 'HLS_JS_URL': '/static/hls.js'})
+    assert not static_pages.is_current(7)
+    assert static_pages.find('index', 7, lambda name: True) == (None, None)
+    assert static_pages.build() == 1
+    assert static_pages.is_current(7)
@@ -0,0 +1,146 @@
+"""Disk quota: LRU eviction and single-flight refetch of evicted files (storage.py)."""
+
+import os
+import threading
+import time
+import uuid
+
+import pytest
+
+import storage
+from conftest import load_fake_yt_dlp
+
+FILE_BYTES = 64 * 1024
+
+
+class FakeDownloader:
+    """fetch callback for storage.init: downloads with the fake yt-dlp and counts the fetches."""
+
+    def __init__(self, downloads_dir, seconds=0.0):
+        self.downloads_dir = downloads_dir
+        self.yt_dlp = load_fake_yt_dlp()
+        self.yt_dlp.RESOLVE_SECONDS = 0
+        self.yt_dlp.DOWNLOAD_SECONDS = seconds
+        self.yt_dlp.FFMPEG_SECONDS = 0
+        self.yt_dlp.JITTER = 0
+        self.yt_dlp.MP3_BYTES = FILE_BYTES
+        self.fetched = []
+        self.lock = threading.Lock()
+
+    def __call__(self, filename):
+        with self.lock:
+            self.fetched.append(filename)
+        temp_path = self.downloads_dir / f'.{uuid.uuid4().hex}'
+        opts = {'outtmpl': str(temp_path),
+                'postprocessors': [{'key': 'FFmpegExtractAudio', 'preferredcodec': 'mp3'}]}
+        with self.yt_dlp.YoutubeDL(opts) as ydl:
+            ydl.extract_info(f'https://www.youtube.com/watch?v={filename[:-4]}')
+        os.replace(temp_path.with_suffix('.mp3'), self.downloads_dir / filename)
+
+
+@pytest.fixture(autouse=True)
+def restore_storage(monkeypatch):
+    # The app configured storage for its own data directory
+    for name in ('_db', '_downloads_dir', '_quota_bytes', '_fetch', '_refetchable'):
+        monkeypatch.setattr(storage, name, getattr(storage, name))
+
+
+@pytest.fixture
+def downloads_dir(tmp_path):
+    path = tmp_path / 'downloads'
+    path.mkdir()
+    return path
+
+
+def setup_storage(tmp_path, downloads_dir, files, quota_files, refetchable=None, seconds=0.0):
+    """Store files (oldest first, a minute apart) and init storage with a quota of quota_files of them."""
+    now = time.time()
+    for age, name in enumerate(reversed(files)):
+        path = downloads_dir / name
+        path.write_bytes(b'\0' * FILE_BYTES)
+        os.utime(path, (now - 3600 - 60 * age, now - 3600 - 60 * age))
+    downloader = FakeDownloader(downloads_dir, seconds)
+    refetchable = set(files if refetchable is None else refetchable)
+    storage.init(tmp_path / 'cache.db', downloads_dir, quota_files * FILE_BYTES,
+                 fetch=downloader, refetchable=lambda: refetchable)
+    storage._touched.clear()
+    return downloader
+
+
+def stored(downloads_dir):
+    return sorted(name for name in os.listdir(downloads_dir) if not name.startswith('.'))
+
+
+def test_evicts_least_recently_served_first(tmp_path, downloads_dir):
+    setup_storage(tmp_path, downloads_dir, ['a.mp3', 'b.mp3', 'c.mp3', 'd.mp3'], quota_files=2)
+    # a is the oldest file, but it was just served
+    storage.touch('a.mp3')
+
+    assert storage.enforce() == ['b.mp3', 'c.mp3']
+    assert stored(downloads_dir) == ['a.mp3', 'd.mp3']
+    assert storage.enforce() == []
+
+
+def test_keeps_files_it_cannot_fetch_again(tmp_path, downloads_dir):
+    setup_storage(tmp_path, downloads_dir, ['local.mp3', 'b.mp3', 'c.mp3'], quota_files=1,
+                  refetchable={'b.mp3', 'c.mp3'})
+
+    assert storage.enforce() == ['b.mp3', 'c.mp3']
+    assert stored(downloads_dir) == ['local.mp3']
+
+
+def test_refetches_evicted_file_on_next_access(tmp_path, downloads_dir):
+    downloader = setup_storage(tmp_path, downloads_dir, ['a.mp3', 'b.mp3', 'c.mp3'], quota_files=2)
+    assert storage.enforce() == ['a.mp3']
+
+    path = storage.ensure('a.mp3')
+
+    assert path == downloads_dir / 'a.mp3'
+    assert path.stat().st_size == FILE_BYTES
+    assert downloader.fetched == ['a.mp3']
+    # Back as the most recently used file: making room for it evicted the next oldest
+    assert stored(downloads_dir) == ['a.mp3', 'c.mp3']
+    assert storage.ensure('a.mp3') == path
+    assert downloader.fetched == ['a.mp3']
+
+
+def test_concurrent_requests_share_one_fetch(tmp_path, downloads_dir):
+    downloader = setup_storage(tmp_path, downloads_dir, ['a.mp3', 'b.mp3'], quota_files=2, seconds=0.5)
+    (downloads_dir / 'a.mp3').unlink()
+
+    start = threading.Barrier(4)
+    results = []
+
+    def request():
+        start.wait()
+        results.append(storage.ensure('a.mp3'))
+
+    threads = [threading.Thread(target=request) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert downloader.fetched == ['a.mp3']
+    assert results == [downloads_dir / 'a.mp3'] * 4
+    assert stored(downloads_dir) == ['a.mp3', 'b.mp3']
+    assert all(path.name.startswith(('.refetch-', '.quota.')) for path in downloads_dir.glob('.*.lock'))
+
+
+def test_init_removes_per_file_lock_files(tmp_path, downloads_dir):
+    for name in ('.a.mp3.lock', '.download-3.lock', '.refetch-7.lock', '.quota.lock'):
+        (downloads_dir / name).touch()
+
+    setup_storage(tmp_path, downloads_dir, [], quota_files=1)
+
+    assert sorted(path.name for path in downloads_dir.iterdir()) == ['.download-3.lock', '.quota.lock',
+                                                                     '.refetch-7.lock']
+
+
+def test_failed_fetch_raises(tmp_path, downloads_dir):
+    setup_storage(tmp_path, downloads_dir, ['fail.mp3'], quota_files=1)
+    (downloads_dir / 'fail.mp3').unlink()
+
+    with pytest.raises(Exception, match='Video unavailable'):
+        storage.ensure('fail.mp3')
+    assert stored(downloads_dir) == []
@@ -0,0 +1,33 @@
+"""Streamed page responses (app.stream_page)."""
+
+import sys
+
+import flask
+
+import catalog
+
+
+def test_abandoned_stream_pops_its_request_context(app_module, monkeypatch):
+    errors = []
+    monkeypatch.setattr(sys, 'unraisablehook', lambda unraisable: errors.append(unraisable.exc_value))
+    monkeypatch.setattr(app_module, 'STREAM_CHUNK_SIZE', 1)
+    # Keep the template streams alive, as a traceback or a reference cycle would, so only closing pops their context
+    streams = []
+    monkeypatch.setattr(app_module, 'stream_template',
+                        lambda *args, **kwargs: streams.append(flask.stream_template(*args, **kwargs)) or streams[-1])
+    song_id = catalog.add_song('Streamed song', 'streamed.mp3')
+    client = app_module.app.test_client()
+    try:
+        response = client.get('/?q=streamed', buffered=False)
+        next(iter(response.response))
+        assert flask.has_request_context()
+
+        # The client went away after the first chunk: the server closes the response
+        response.close()
+        assert not flask.has_request_context()
+
+        assert client.get('/metrics').status_code == 200
+        assert 'Streamed song' in client.get('/?q=streamed').get_data(as_text=True)
+        assert errors == []
+    finally:
+        catalog.delete_song(song_id)
@@ -0,0 +1,53 @@
+"""On-demand MP3 cache: one transcode per song, on a fixed set of lock files (transcode.py)."""
+
+import threading
+import time
+
+import transcode
+
+
+def test_concurrent_requests_share_one_transcode(tmp_path, monkeypatch):
+    cache_dir = tmp_path / 'transcoded'
+    monkeypatch.setattr(transcode, '_cache_dir', transcode._cache_dir)
+    monkeypatch.setattr(transcode, '_max_bytes', transcode._max_bytes)
+    transcode.init(cache_dir)
+    transcoded = []
+
+    def fake_transcode(source_path, target):
+        transcoded.append(source_path.name)
+        time.sleep(0.2 if source_path == sources[0] else 0)
+        target.write_bytes(b'ID3' + source_path.read_bytes())
+
+    monkeypatch.setattr(transcode, '_transcode', fake_transcode)
+    sources = []
+    for n in range(20):
+        source = tmp_path / f'song-{n}.m4a'
+        source.write_bytes(b'audio')
+        sources.append(source)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(transcode.get_mp3(sources[0]))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for source in sources[1:]:
+        transcode.get_mp3(source)
+
+    assert transcoded == [source.name for source in sources]
+    assert len(set(results)) == 1 and results[0].read_bytes() == b'ID3audio'
+    locks = [path.name for path in cache_dir.iterdir() if path.suffix == '.lock']
+    assert all(name.startswith('.transcode-') for name in locks)
+    assert len(locks) <= transcode.LOCK_STRIPES
+
+
+def test_init_removes_per_song_lock_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(transcode, '_cache_dir', transcode._cache_dir)
+    cache_dir = tmp_path / 'transcoded'
+    cache_dir.mkdir()
+    (cache_dir / 'song-123.lock').touch()
+    (cache_dir / '.transcode-5.lock').touch()
+
+    transcode.init(cache_dir)
+
+    assert sorted(path.name for path in cache_dir.iterdir()) == ['.transcode-5.lock']
@@ -0,0 +1,107 @@
+"""
+Thumbnail ingest: small, fixed-size, content-addressed JPEG variants.
+
+yt-dlp writes whatever thumbnail YouTube offers - usually a full-size WebP
+or PNG of several hundred KB - while the pages show it at 80x60. Every
+ingested thumbnail is cropped to 4:3 and re-encoded as a 1x and a 2x JPEG.
+Each variant is named after the SHA-256 of its bytes, so it can be served
+with an immutable Cache-Control header and identical images share a file.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+from io import BytesIO
+
+logger = logging.getLogger(__name__)
+
+# Display size on index.html / admin_dashboard.html is 80x60
+VARIANTS = {
+    '1x': (80, 60),
+    '2x': (160, 120),
+}
+
+JPEG_QUALITY = 80
+MIME_TYPE = 'image/jpeg'
+
+# Magic numbers for files that could not be transcoded and are kept as-is
+_SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg', '.jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png', '.png'),
+    (b'GIF8', 'image/gif', '.gif'),
+)
+
+
+def sniff_image_type(head):
+    """Return (mime type, extension) for the first bytes of an image file."""
+    for signature, mime, ext in _SIGNATURES:
+        if head.startswith(signature):
+            return mime, ext
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp', '.webp'
+    return 'image/jpeg', '.jpg'
+
+
+def _write_content_addressed(data, directory, ext):
+    """Store data under <sha256>.<ext> in directory (atomically) and return the name."""
+    name = hashlib.sha256(data).hexdigest()[:32] + ext
+    path = os.path.join(directory, name)
+    if not os.path.exists(path):
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return name
+
+
+def _encode_variant(image, size):
+    from PIL import Image, ImageOps
+
+    variant = ImageOps.fit(image, size, method=Image.LANCZOS)
+    buffer = BytesIO()
+    variant.save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def ingest(source_path, thumbnails_dir):
+    """
+    Turn a downloaded thumbnail into stored variants.
+
+    Returns the catalog fields (thumbnail, thumbnail_2x, thumbnail_width,
+    thumbnail_height, thumbnail_mime). If the image cannot be decoded it is
+    stored unchanged, content-addressed and with its real mime type. The
+    source file is left in place for the caller to remove.
+    """
+    # Imported here: only ingest needs Pillow, serving thumbnails never loads it
+    from PIL import Image, ImageOps
+
+    with open(source_path, 'rb') as f:
+        original = f.read()
+
+    try:
+        with Image.open(BytesIO(original)) as image:
+            image = ImageOps.exif_transpose(image).convert('RGB')
+            variants = {name: _encode_variant(image, size) for name, size in VARIANTS.items()}
+    except Exception as e:
+        logger.warning("Could not transcode %s: %s - keeping original", source_path, e)
+        mime, ext = sniff_image_type(original[:16])
+        return {
+            'thumbnail': _write_content_addressed(original, thumbnails_dir, ext),
+            'thumbnail_2x': None,
+            'thumbnail_width': None,
+            'thumbnail_height': None,
+            'thumbnail_mime': mime,
+        }
+
+    width, height = VARIANTS['1x']
+    fields = {
+        'thumbnail': _write_content_addressed(variants['1x'], thumbnails_dir, '.jpg'),
+        'thumbnail_2x': _write_content_addressed(variants['2x'], thumbnails_dir, '.jpg'),
+        'thumbnail_width': width,
+        'thumbnail_height': height,
+        'thumbnail_mime': MIME_TYPE,
+    }
+    logger.info("Thumbnail %.1f KB source -> %.1f KB (1x) + %.1f KB (2x)",
+                len(original) / 1024, len(variants['1x']) / 1024, len(variants['2x']) / 1024)
+    return fields
@@ -0,0 +1,74 @@
+"""
+Token buckets shared by all gunicorn workers.
+
+A bucket holds up to `burst` tokens and refills at `rate` tokens per
+second. Its level lives in a small SQLite table (one row per key), updated
+in a BEGIN IMMEDIATE transaction, so every worker and thread draws from
+the same budget. Refill is computed lazily from the time of the last
+update; there is no background refresher.
+
+- reserve() always takes the tokens and returns how long the caller should
+  wait for them. The bucket may go into debt, which makes the next callers
+  wait longer: used to pace a flow of bytes
+- take() only takes the tokens if they are there, otherwise it says when
+  to come back: used to admit or reject requests
+"""
+
+import time
+
+from database import Database
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS token_buckets (
+    key TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+_db = None
+
+
+def init(db_path):
+    """Open (and create) the bucket table."""
+    global _db
+    _db = Database(db_path, SCHEMA)
+
+
+def _level(conn, key, rate, burst, now):
+    row = conn.execute('SELECT tokens, updated_at FROM token_buckets WHERE key = ?', (key,)).fetchone()
+    if row is None:
+        return burst
+    return min(burst, row['tokens'] + max(0.0, now - row['updated_at']) * rate)
+
+
+def _store(conn, key, tokens, now):
+    conn.execute('INSERT OR REPLACE INTO token_buckets (key, tokens, updated_at) VALUES (?, ?, ?)',
+                 (key, tokens, now))
+
+
+def reserve(key, amount, rate, burst):
+    """Take amount tokens, going into debt if needed. Returns the seconds to wait before using them."""
+    now = time.time()
+    with _db.transaction() as conn:
+        tokens = _level(conn, key, rate, burst, now) - amount
+        _store(conn, key, tokens, now)
+    return -tokens / rate if tokens < 0 else 0.0
+
+
+def take(key, amount, rate, burst):
+    """Take amount tokens if the bucket has them. Returns (taken, seconds until it would have them)."""
+    now = time.time()
+    with _db.transaction() as conn:
+        tokens = _level(conn, key, rate, burst, now)
+        if tokens < amount:
+            return False, (amount - tokens) / rate
+        _store(conn, key, tokens - amount, now)
+    return True, 0.0
+
+
+def prune(idle_seconds):
+    """Forget buckets untouched for idle_seconds (long enough for them to be full again). Returns how many."""
+    with _db.transaction() as conn:
+        return conn.execute('DELETE FROM token_buckets WHERE updated_at < ?',
+                            (time.time() - idle_seconds,)).rowcount
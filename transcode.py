@@ -0,0 +1,163 @@
+"""
+On-demand MP3 transcoding with a size-bounded, shared cache.
+
+With INGEST_AUDIO_FORMAT=original, songs are stored as the m4a/opus
+stream YouTube serves, so ingest skips the CPU-heavy MP3 encode. Phones
+that need MP3 get one the first time they ask for it: the file is
+transcoded with ffmpeg into cache_dir and reused afterwards.
+
+- one transcode per song at a time, across threads and gunicorn workers:
+  the transcoding request holds an flock on one of LOCK_STRIPES lock files
+  (picked by the cache name), and concurrent requests for the same song
+  wait on it and then serve the finished file
+- cached files are named after the source file and its mtime, so a
+  replaced source never serves a stale MP3
+- the cache is trimmed to max_bytes, least recently served first
+  (serving a cached file bumps its mtime)
+"""
+
+import fcntl
+import logging
+import os
+import subprocess
+import tempfile
+import time
+import zlib
+from pathlib import Path
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Audio formats the app stores, by file extension
+AUDIO_TYPES = {
+    '.mp3': 'audio/mpeg',
+    '.m4a': 'audio/mp4',
+    '.opus': 'audio/ogg',
+    '.ogg': 'audio/ogg',
+    '.webm': 'audio/webm',
+    '.aac': 'audio/aac',
+}
+
+MP3_BITRATE = '192k'
+
+# Generous upper bound for one song; gunicorn's own timeout is 120s
+TRANSCODE_TIMEOUT_SECONDS = 110
+
+# A fixed set of lock files shared by all songs, instead of one per cached name
+LOCK_STRIPES = 64
+
+_cache_dir = None
+_max_bytes = 2 * 1024 * 1024 * 1024
+
+
+def init(cache_dir, max_bytes=_max_bytes):
+    """Set the transcode cache directory and its size budget."""
+    global _cache_dir, _max_bytes
+    _cache_dir = Path(cache_dir)
+    _cache_dir.mkdir(parents=True, exist_ok=True)
+    _max_bytes = max_bytes
+    # Per-song lock files of earlier versions
+    for path in _cache_dir.glob('*.lock'):
+        if not path.name.startswith('.'):
+            path.unlink(missing_ok=True)
+
+
+def audio_type(filename):
+    """Mime type of a stored audio file, from its extension."""
+    return AUDIO_TYPES.get(Path(filename).suffix.lower(), 'application/octet-stream')
+
+
+def _cache_name(source_path):
+    source_path = Path(source_path)
+    return f"{source_path.stem}-{source_path.stat().st_mtime_ns}.mp3"
+
+
+def get_mp3(source_path):
+    """
+    Return the path of an MP3 version of source_path, transcoding it if needed.
+
+    Blocks while another request transcodes the same song. Raises
+    RuntimeError if ffmpeg fails.
+    """
+    cached = _cache_dir / _cache_name(source_path)
+    if cached.exists():
+        os.utime(cached)
+        return cached
+
+    stripe = zlib.crc32(cached.name.encode()) % LOCK_STRIPES
+    with open(_cache_dir / f'.transcode-{stripe}.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            # Whoever held the lock before us may have produced it already
+            if cached.exists():
+                os.utime(cached)
+                return cached
+            _transcode(source_path, cached)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    _trim()
+    return cached
+
+
+def _transcode(source_path, target):
+    fd, tmp_path = tempfile.mkstemp(dir=_cache_dir, prefix='.tmp-', suffix='.mp3')
+    os.close(fd)
+    start = time.perf_counter()
+    try:
+        result = subprocess.run(
+            ['ffmpeg', '-nostdin', '-loglevel', 'error', '-y', '-i', str(source_path),
+             '-vn', '-map_metadata', '0', '-codec:a', 'libmp3lame', '-b:a', MP3_BITRATE,
+             '-f', 'mp3', tmp_path],
+            capture_output=True, text=True, timeout=TRANSCODE_TIMEOUT_SECONDS,
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed: {result.stderr.strip()[-500:]}")
+        os.replace(tmp_path, target)
+    except subprocess.TimeoutExpired:
+        raise RuntimeError(f"ffmpeg timed out after {TRANSCODE_TIMEOUT_SECONDS}s")
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+    elapsed = time.perf_counter() - start
+    metrics.observe('ffmpeg_duration_seconds', elapsed, postprocessor='OnDemandMP3')
+    logger.info("Transcoded %s to MP3 in %.2fs", Path(source_path).name, elapsed,
+                extra={'mb': round(target.stat().st_size / (1024 * 1024), 2)})
+
+
+def _cached_files():
+    # Skips in-progress .tmp- files
+    return [path for path in _cache_dir.glob('*.mp3') if not path.name.startswith('.')]
+
+
+def _trim():
+    """Delete least recently served MP3s until the cache fits in max_bytes."""
+    entries = []
+    for path in _cached_files():
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= _max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+        logger.info("Evicted %s from the transcode cache", path.name)
+
+
+def discard(source_path):
+    """Drop cached MP3s of a source file (e.g. after the song was deleted)."""
+    for path in _cache_dir.glob(f"{Path(source_path).stem}-*.mp3"):
+        path.unlink(missing_ok=True)
+
+
+def stats():
+    """Number of cached MP3s and their total size, for the admin."""
+    sizes = [path.stat().st_size for path in _cached_files()]
+    return {'entries': len(sizes), 'bytes': sum(sizes), 'max_bytes': _max_bytes}
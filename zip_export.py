@@ -0,0 +1,259 @@
+"""
+ZIP archives of songs, streamed as they are built.
+
+MP3s don't compress, so every member is STORED: the archive is the song
+files themselves with a small header in front of each and a central
+directory at the end. That makes the layout fully determined by the
+member names and file sizes, which gives:
+
+- an exact Content-Length before anything is read
+- Range requests: any byte of the archive can be produced on its own, so
+  an interrupted download resumes instead of starting over
+- constant memory and no temporary files - headers are generated per
+  member and file data is copied in CHUNK_SIZE pieces
+
+STORED members need their CRC-32 in the header in front of the data. It
+is computed by reading the file once and kept in cache.db (keyed by path,
+size and mtime), so only the first export of a song reads it twice.
+Archives larger than 4 GB or with more than 65535 members use the ZIP64
+end records.
+"""
+
+import hashlib
+import logging
+import os
+import struct
+import time
+import zlib
+
+from database import Database
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_crc32 (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    crc32 INTEGER NOT NULL
+);
+"""
+
+CHUNK_SIZE = 64 * 1024
+
+# General purpose flag bit 11: names are UTF-8 (Hebrew display names)
+UTF8_FLAG = 0x0800
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+
+LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+END_RECORD = struct.Struct('<IHHHHIIH')
+ZIP64_END_RECORD = struct.Struct('<IQHHIIQQQQ')
+ZIP64_LOCATOR = struct.Struct('<IIQI')
+
+_db = None
+
+
+def init(db_path):
+    """Open the CRC-32 cache database."""
+    global _db
+    _db = Database(db_path, SCHEMA)
+
+
+def _dos_datetime(timestamp):
+    t = time.gmtime(max(timestamp, 315532800))  # ZIP dates start in 1980
+    return (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2), ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+
+
+def unique_names(names):
+    """Make member names unique, adding " (2)", " (3)" ... before the extension."""
+    seen = set()
+    result = []
+    for name in names:
+        stem, ext = os.path.splitext(name)
+        candidate, number = name, 1
+        while candidate.casefold() in seen:
+            number += 1
+            candidate = f"{stem} ({number}){ext}"
+        seen.add(candidate.casefold())
+        result.append(candidate)
+    return result
+
+
+class Archive:
+    """
+    The layout of a STORED ZIP of (name, path, timestamp) members. Files
+    that do not exist are left out. size, etag and mtime describe the
+    whole archive; read(start, length) yields any part of it.
+    """
+
+    def __init__(self, members):
+        self.entries = []
+        offset = 0
+        for name, path, timestamp in members:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                logger.warning("Skipping missing file %s in ZIP export", path)
+                continue
+            encoded = name.encode('utf-8')
+            header_size = LOCAL_HEADER.size + len(encoded)
+            self.entries.append({
+                'name': encoded,
+                'path': str(path),
+                'size': stat.st_size,
+                'mtime_ns': stat.st_mtime_ns,
+                'ino': stat.st_ino,
+                'dos': _dos_datetime(timestamp),
+                'offset': offset,
+                'header_size': header_size,
+            })
+            offset += header_size + stat.st_size
+
+        self.central_offset = offset
+        self.central_size = sum(CENTRAL_HEADER.size + len(entry['name']) + self._zip64_extra_size(entry)
+                                for entry in self.entries)
+        self.zip64 = (len(self.entries) >= ZIP64_COUNT_LIMIT or self.central_offset >= ZIP64_LIMIT
+                      or self.central_size >= ZIP64_LIMIT)
+        end_size = END_RECORD.size + (ZIP64_END_RECORD.size + ZIP64_LOCATOR.size if self.zip64 else 0)
+        self.size = self.central_offset + self.central_size + end_size
+        self.mtime = max((entry['mtime_ns'] / 1e9 for entry in self.entries), default=0)
+
+        digest = hashlib.sha256()
+        for entry in self.entries:
+            digest.update(b'%s\0%d\0%d\0%d\0' % (entry['name'], entry['size'], entry['mtime_ns'], entry['ino']))
+        self.etag = 'zip-' + digest.hexdigest()[:32]
+        self._crcs = None
+
+    @staticmethod
+    def _zip64_extra_size(entry):
+        return 12 if entry['offset'] >= ZIP64_LIMIT else 0
+
+    # ---- CRC-32 ----
+
+    def _crc(self, entry):
+        if self._crcs is None:
+            self._crcs = _load_crcs()
+        key = entry['path']
+        cached = self._crcs.get(key)
+        if cached is not None and cached[:2] == (entry['size'], entry['mtime_ns']):
+            return cached[2]
+        crc = _compute_crc(entry['path'])
+        self._crcs[key] = (entry['size'], entry['mtime_ns'], crc)
+        _store_crc(key, entry['size'], entry['mtime_ns'], crc)
+        return crc
+
+    # ---- records ----
+
+    def _local_header(self, entry):
+        time_, date = entry['dos']
+        return LOCAL_HEADER.pack(
+            0x04034b50, 20, UTF8_FLAG, 0, time_, date, self._crc(entry),
+            entry['size'], entry['size'], len(entry['name']), 0,
+        ) + entry['name']
+
+    def _central_header(self, entry):
+        time_, date = entry['dos']
+        extra = b''
+        offset = entry['offset']
+        if offset >= ZIP64_LIMIT:
+            extra = struct.pack('<HHQ', 0x0001, 8, offset)
+            offset = ZIP64_LIMIT
+        version = 45 if extra else 20
+        return CENTRAL_HEADER.pack(
+            0x02014b50, (3 << 8) | version, version, UTF8_FLAG, 0, time_, date, self._crc(entry),
+            entry['size'], entry['size'], len(entry['name']), len(extra), 0, 0, 0,
+            0o100644 << 16, offset,
+        ) + entry['name'] + extra
+
+    def _end_records(self):
+        count = len(self.entries)
+        records = b''
+        if self.zip64:
+            zip64_offset = self.central_offset + self.central_size
+            records += ZIP64_END_RECORD.pack(
+                0x06064b50, ZIP64_END_RECORD.size - 12, 45, 45, 0, 0,
+                count, count, self.central_size, self.central_offset,
+            )
+            records += ZIP64_LOCATOR.pack(0x07064b50, 0, zip64_offset, 1)
+        records += END_RECORD.pack(
+            0x06054b50, 0, 0, min(count, ZIP64_COUNT_LIMIT), min(count, ZIP64_COUNT_LIMIT),
+            min(self.central_size, ZIP64_LIMIT), min(self.central_offset, ZIP64_LIMIT), 0,
+        )
+        return records
+
+    # ---- content ----
+
+    def _segments(self):
+        """(offset, size, producer) for every part of the archive, in order."""
+        for entry in self.entries:
+            yield entry['offset'], entry['header_size'], lambda e=entry: self._local_header(e)
+            yield entry['offset'] + entry['header_size'], entry['size'], entry
+        offset = self.central_offset
+        for entry in self.entries:
+            size = CENTRAL_HEADER.size + len(entry['name']) + self._zip64_extra_size(entry)
+            yield offset, size, lambda e=entry: self._central_header(e)
+            offset += size
+        yield offset, self.size - offset, self._end_records
+
+    def read(self, start=0, length=None):
+        """Yield length bytes of the archive (to the end if None) starting at start."""
+        end = self.size if length is None else min(self.size, start + length)
+        for offset, size, producer in self._segments():
+            if offset + size <= start or size == 0:
+                continue
+            if offset >= end:
+                break
+            skip = max(0, start - offset)
+            take = min(size, end - offset) - skip
+            if isinstance(producer, dict):
+                yield from _read_file(producer['path'], skip, take)
+            else:
+                yield producer()[skip:skip + take]
+
+
+def _read_file(path, skip, length):
+    with open(path, 'rb') as f:
+        f.seek(skip)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                raise IOError(f"{path} shrank while it was being archived")
+            length -= len(chunk)
+            yield chunk
+
+
+def _compute_crc(path):
+    crc = 0
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(1024 * 1024)
+            if not chunk:
+                return crc
+            crc = zlib.crc32(chunk, crc)
+
+
+def _load_crcs():
+    if _db is None:
+        return {}
+    rows = _db.connect().execute('SELECT path, size, mtime_ns, crc32 FROM file_crc32').fetchall()
+    return {row['path']: (row['size'], row['mtime_ns'], row['crc32']) for row in rows}
+
+
+def _store_crc(path, size, mtime_ns, crc):
+    if _db is None:
+        return
+    with _db.transaction() as conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO file_crc32 (path, size, mtime_ns, crc32) VALUES (?, ?, ?, ?)',
+            (path, size, mtime_ns, crc)
+        )
+
+
+def forget(path):
+    """Drop the cached CRC-32 of a deleted file."""
+    if _db is None:
+        return
+    with _db.transaction() as conn:
+        conn.execute('DELETE FROM file_crc32 WHERE path = ?', (str(path),))